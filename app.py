@@ -2,48 +2,351 @@ import os
 import json
 import csv
 import io
+import time
+import hashlib
+import random
+import threading
+import tempfile
+import uuid
 import requests
-import firebase_admin
-from firebase_admin import credentials, auth
-from flask import Flask, request, render_template, jsonify, redirect, url_for, session, send_file, Response
+from flask import Flask, Blueprint, current_app, request, render_template, jsonify, redirect, url_for, session, send_file, Response, stream_with_context, Request
 from functools import wraps
 from datetime import datetime
+from supabase_client import LazyClient
+from cache import TTLCache
+from token_cache import VerifiedTokenCache
+from setlist_generator import generate_setlist, regenerate_setlist, SongColumns, PACKING_MODES
+from setlist_flow import ENERGY_CURVES
+from setlist_candidates import generate_candidates
+from setlist_tour import generate_tour
+from setlist_export import EXPORTERS, EXPORT_FORMATS
+from song_dedupe import DuplicateIndex, find_clusters, song_signature, suggest_keep
+from jobs import JobQueue, JobFailed, QueueFull
+import instrumentation
+import pagination
 
 # Get the absolute path to the templates folder
 base_dir = os.path.abspath(os.path.dirname(__file__))
 templates_dir = os.path.join(base_dir, 'app', 'templates')
 static_dir = os.path.join(base_dir, 'app', 'static')
 
-# Print paths for debugging
-print(f"Base directory: {base_dir}")
-print(f"Templates directory: {templates_dir}")
-print(f"Static directory: {static_dir}")
-
-# Check if templates directory exists
-if os.path.exists(templates_dir):
-    print(f"Templates directory exists: {os.listdir(templates_dir)}")
-else:
-    print(f"Templates directory does not exist!")
-
-# Initialize Flask app
-app = Flask(__name__, template_folder=templates_dir, static_folder=static_dir)
-app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev_secret_key")
-
-# Initialize Firebase Admin SDK (server-side)
-try:
-    cred = credentials.Certificate(json.loads(os.environ.get("FIREBASE_ADMIN_CREDENTIALS", "{}")))
-    firebase_admin.initialize_app(cred)
-except (ValueError, firebase_admin.exceptions.FirebaseError):
-    # In development, use a service account file if environment variable is not set
+# Routes are registered on a blueprint and attached to the app in create_app()
+bp = Blueprint('setlistgenie', __name__)
+
+def init_firebase():
+    """
+    Initialize the Firebase Admin SDK (server-side)
+    
+    Deferred until the first token verification or the startup probe, since
+    importing firebase_admin and google-auth is a large share of cold start.
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+    
     try:
-        cred = credentials.Certificate("firebase-service-account.json")
+        cred = credentials.Certificate(json.loads(os.environ.get("FIREBASE_ADMIN_CREDENTIALS", "{}")))
         firebase_admin.initialize_app(cred)
-    except:
-        print("Firebase Admin SDK initialization failed. Continuing without Firebase Admin.")
+    except (ValueError, firebase_admin.exceptions.FirebaseError):
+        # In development, use a service account file if environment variable is not set
+        try:
+            cred = credentials.Certificate("firebase-service-account.json")
+            firebase_admin.initialize_app(cred)
+        except:
+            print("Firebase Admin SDK initialization failed. Continuing without Firebase Admin.")
+
+# Supabase client setup (one pooled session shared by every request thread, built on first use)
+supabase = LazyClient()
+
+# CSV import batching: default/maximum songs per upsert and how many row errors to report
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", 500))
+IMPORT_MAX_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100
+
+# How CSV imports treat rows that look like an existing song (see import_songs), and how many
+# rows of a file are indexed to catch near-duplicates within it (about 1.2KB each); later rows
+# are still checked against the library and the rows indexed so far
+IMPORT_FUZZY_MODES = ('flag', 'skip', 'off')
+IMPORT_FUZZY_MAX_ROWS = int(os.environ.get("IMPORT_FUZZY_MAX_ROWS", 10000))
+
+# CPU budget for the 'optimal' set packing mode (per request, in milliseconds)
+DEFAULT_PACKING_BUDGET_MS = int(os.environ.get("DEFAULT_PACKING_BUDGET_MS", 300))
+MAX_PACKING_BUDGET_MS = int(os.environ.get("MAX_PACKING_BUDGET_MS", 2000))
+
+# Time the energy/key/BPM flow ordering may spend per request, in milliseconds
+FLOW_TIME_LIMIT_MS = int(os.environ.get("FLOW_TIME_LIMIT_MS", 300))
+
+# Rows read per Supabase request when streaming a setlist export
+EXPORT_PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", 200))
+
+# Upper bound on candidate setlists generated per request
+MAX_CANDIDATES = int(os.environ.get("MAX_CANDIDATES", 64))
+
+# Largest show accepted by the generators: sets per show, seconds per set and artist spacing.
+# Larger values are clamped; they also bound the optimal packer's per-set bitset.
+MAX_NUM_SETS = int(os.environ.get("MAX_NUM_SETS", 10))
+MAX_SET_DURATION = int(os.environ.get("MAX_SET_DURATION", 6 * 3600))
+MAX_ARTIST_SPACING = 50
+SET_SHAPE_LIMITS = {
+    'num_sets': (1, MAX_NUM_SETS),
+    'set_duration': (1, MAX_SET_DURATION),
+    'min_songs_between_artist': (0, MAX_ARTIST_SPACING)
+}
+
+# Tour generation: most shows per request and the CPU time the whole tour may use
+# (milliseconds, shared equally by optimal packing and flow ordering)
+MAX_TOUR_SHOWS = int(os.environ.get("MAX_TOUR_SHOWS", 200))
+TOUR_TIME_BUDGET_MS = int(os.environ.get("TOUR_TIME_BUDGET_MS", 4000))
+
+# firebase_uid -> profiles.id cache. PROFILE_ID_IN_SESSION also mirrors it into the session
+# cookie; it is off by default because the profile then comes from the cookie rather than the
+# verified uid, so only enable it with a strong FLASK_SECRET_KEY
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", 10000))
+PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", 3600))
+PROFILE_ID_IN_SESSION = os.environ.get("PROFILE_ID_IN_SESSION", "false").lower() in ['true', 'yes', '1']
+profile_cache = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL)
+
+def resolve_profile_id(user_id, create=False):
+    """
+    Look up the Supabase profile ID for a Firebase user
+    
+    Checks the session (only with PROFILE_ID_IN_SESSION), then the in-process
+    cache, and only then queries Supabase, so the profiles round trip is paid
+    once per user rather than once per request.
+    
+    Args:
+        user_id: Firebase UID
+        create: Create the profile if it does not exist yet
+    
+    Returns:
+        The profile ID, or None if it does not exist and could not be created
+    """
+    if PROFILE_ID_IN_SESSION and session.get('profile_uid') == user_id and session.get('profile_id'):
+        return session['profile_id']
+    
+    profile_id = profile_cache.get(user_id)
+    if profile_id is None:
+        profile_response = supabase.get(f"profiles?firebase_uid=eq.{user_id}&select=id")
+        if profile_response.status_code == 200 and profile_response.json():
+            profile_id = profile_response.json()[0]['id']
+        elif create:
+            profile_response = supabase.post(
+                "profiles",
+                json={'firebase_uid': user_id},
+                prefer='return=representation'
+            )
+            if profile_response.status_code == 201:
+                profile_id = profile_response.json()[0]['id']
+        
+        if profile_id is None:
+            return None
+        profile_cache.set(user_id, profile_id)
+    
+    if PROFILE_ID_IN_SESSION:
+        session['profile_uid'] = user_id
+        session['profile_id'] = profile_id
+    return profile_id
+
+# Fuzzy duplicate detection: minimum title similarity (0-1) for two songs by the same artist
+DUPLICATE_THRESHOLD = float(os.environ.get("DUPLICATE_THRESHOLD", 0.75))
+
+# Per-profile song library cache, bounded by entry count and estimated memory: about 600 bytes
+# per song for the decoded song dicts plus the SongColumns view and ID map built from them
+# (measured with tracemalloc; the JSON body is under half of that)
+SONG_FIELDS = 'id,title,artist,duration,energy,key,bpm,must_play,exclude_from_set'
+LIBRARY_BYTES_PER_SONG = 600
+LIBRARY_CACHE_SIZE = int(os.environ.get("LIBRARY_CACHE_SIZE", 256))
+LIBRARY_CACHE_MAX_BYTES = int(os.environ.get("LIBRARY_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+library_cache = TTLCache(
+    maxsize=LIBRARY_CACHE_SIZE,
+    ttl=int(os.environ.get("LIBRARY_CACHE_TTL", 600)),
+    maxweight=LIBRARY_CACHE_MAX_BYTES,
+    weigh=lambda library: library['bytes']
+)
+
+# Marker replaced on every library write, so a fetch that overlapped a write is not cached
+library_writes = TTLCache(maxsize=PROFILE_CACHE_SIZE, ttl=60)
+
+def _library_entry(songs):
+    """A song list with its ETag and estimated in-memory size"""
+    body = json.dumps(songs, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return {
+        'songs': songs,
+        'etag': hashlib.sha1(body).hexdigest(),
+        'bytes': len(songs) * LIBRARY_BYTES_PER_SONG
+    }
+
+def _cache_library(profile_id, songs):
+    """Store a song list with its ETag and estimated size"""
+    library = _library_entry(songs)
+    library_cache.set(profile_id, library)
+    return library
+
+def load_song_library(profile_id):
+    """
+    Return the cached song library for a profile, fetching it on a miss
+    
+    Returns:
+        Dictionary with 'songs' and 'etag', or None if Supabase failed
+    """
+    library = library_cache.get(profile_id)
+    if library is not None:
+        return library
+    
+    written = library_writes.get(profile_id)
+    songs_response = supabase.get(f"songs?user_id=eq.{profile_id}&select={SONG_FIELDS}")
+    if songs_response.status_code != 200:
+        return None
+    
+    # A write that landed while the fetch was in flight may be missing from it; serve it uncached
+    library = _library_entry(songs_response.json())
+    if library_writes.get(profile_id) is written:
+        library_cache.set(profile_id, library)
+    return library
+
+# Fuzzy duplicate index of each profile's library at DUPLICATE_THRESHOLD, bounded by count and
+# estimated memory (about 80 bytes per indexed title trigram, measured with tracemalloc)
+DUPLICATE_INDEX_BYTES_PER_TRIGRAM = 80
+DUPLICATE_CACHE_SIZE = int(os.environ.get("DUPLICATE_CACHE_SIZE", 64))
+DUPLICATE_CACHE_MAX_BYTES = int(os.environ.get("DUPLICATE_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+duplicate_cache = TTLCache(
+    maxsize=DUPLICATE_CACHE_SIZE,
+    ttl=int(os.environ.get("LIBRARY_CACHE_TTL", 600)),
+    maxweight=DUPLICATE_CACHE_MAX_BYTES,
+    weigh=lambda entry: entry['bytes']
+)
+
+def _cache_duplicates(profile_id, etag, index, clusters):
+    """Store a library's duplicate index (and clusters, if known) with its estimated size"""
+    trigrams = sum(len(signature[2]) for signature in index.signatures)
+    duplicate_cache.set(profile_id, {
+        'etag': etag,
+        'index': index,
+        'clusters': clusters,
+        'bytes': trigrams * DUPLICATE_INDEX_BYTES_PER_TRIGRAM
+    })
+
+# Generated setlists keyed on (profile, library ETag, parameters, seed), bounded by count and bytes
+GENERATION_CACHE_SIZE = int(os.environ.get("GENERATION_CACHE_SIZE", 512))
+GENERATION_CACHE_MAX_BYTES = int(os.environ.get("GENERATION_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+generation_cache = TTLCache(
+    maxsize=GENERATION_CACHE_SIZE,
+    ttl=int(os.environ.get("GENERATION_CACHE_TTL", 3600)),
+    maxweight=GENERATION_CACHE_MAX_BYTES,
+    weigh=lambda entry: entry['bytes']
+)
+
+# Rendered saved setlists (GET /api/setlists/<id>) keyed on (profile, setlist), with their ETags
+SETLIST_CACHE_SIZE = int(os.environ.get("SETLIST_CACHE_SIZE", 1024))
+SETLIST_CACHE_MAX_BYTES = int(os.environ.get("SETLIST_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+setlist_cache = TTLCache(
+    maxsize=SETLIST_CACHE_SIZE,
+    ttl=int(os.environ.get("SETLIST_CACHE_TTL", 60)),
+    maxweight=SETLIST_CACHE_MAX_BYTES,
+    weigh=lambda entry: len(entry['body'])
+)
+
+def invalidate_generations(profile_id):
+    """Drop every cached setlist generated from a profile's library, and rendered saved setlists"""
+    generation_cache.pop_where(lambda key: key[0] == profile_id)
+    setlist_cache.pop_where(lambda key: key[0] == profile_id)
+
+def invalidate_song_library(profile_id):
+    """Forget a profile's cached library and everything generated from it"""
+    library_writes.set(profile_id, object())
+    library_cache.pop(profile_id)
+    duplicate_cache.pop(profile_id)
+    invalidate_generations(profile_id)
+
+def patch_song_library(profile_id, added=None, removed_ids=None):
+    """Apply a write to a cached library in place, or drop it if it is not cached"""
+    library_writes.set(profile_id, object())
+    invalidate_generations(profile_id)
+    library = library_cache.get(profile_id)
+    if library is None:
+        duplicate_cache.pop(profile_id)
+        return
+    songs = library['songs']
+    new_songs = []
+    if removed_ids:
+        removed_ids = {str(song_id) for song_id in removed_ids}
+        songs = [song for song in songs if str(song.get('id')) not in removed_ids]
+    if added:
+        # A fetch that finished just after the write may already hold the song
+        present = {str(song.get('id')) for song in songs}
+        fields = SONG_FIELDS.split(',')
+        new_songs = [{field: song.get(field) for field in fields}
+                     for song in added if str(song.get('id')) not in present]
+        songs = songs + new_songs
+    patched = _cache_library(profile_id, songs)
+    
+    # Songs that were only added extend the duplicate index instead of forcing a rebuild
+    duplicates = duplicate_cache.pop(profile_id)
+    if duplicates is not None and duplicates['etag'] == library['etag'] and not removed_ids:
+        index = duplicates['index']
+        for song in new_songs:
+            index.add(song)
+        _cache_duplicates(profile_id, patched['etag'], index, None)
+
+# Background jobs for large imports and saves, with state in a local SQLite database. The default
+# directory is instance-local (in-memory tmpfs on Cloud Run); point JOBS_DIR at a mounted volume
+# for jobs and their uploads to survive the instance being replaced
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(tempfile.gettempdir(), 'setlistgenie-jobs'))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 50))
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", 86400))
+
+# Uploads larger than this (bytes) and saves with more songs than this run as jobs
+IMPORT_SYNC_MAX_BYTES = int(os.environ.get("IMPORT_SYNC_MAX_BYTES", 1024 * 1024))
+SAVE_SYNC_MAX_ROWS = int(os.environ.get("SAVE_SYNC_MAX_ROWS", 1000))
+
+# Largest request body accepted (bytes); bigger uploads get a 413 before they are read
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 16 * 1024 * 1024))
+
+class UploadRequest(Request):
+    """
+    Request that spools uploads bound for a background import straight into JOBS_DIR
+    
+    Werkzeug would otherwise buffer them in the system temp directory and the
+    import would copy them again; a file already in JOBS_DIR is hard-linked to
+    the job's path instead (see import_csv).
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length > IMPORT_SYNC_MAX_BYTES:
+            os.makedirs(JOBS_DIR, exist_ok=True)
+            return tempfile.NamedTemporaryFile('rb+', dir=JOBS_DIR, suffix='.upload')
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+job_queue = JobQueue(os.path.join(JOBS_DIR, 'jobs.sqlite3'), workers=JOB_WORKERS,
+                     max_pending=JOB_QUEUE_SIZE, retention=JOB_RETENTION)
 
-# Supabase client setup
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://cqlldqgxghuvbtmlaiec.supabase.co")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
+def job_accepted_response(job):
+    """202 response pointing the client at a job's status endpoint"""
+    response = jsonify({
+        'success': True,
+        'job': job,
+        'status_url': url_for('.get_job', job_id=job['id'])
+    })
+    response.headers['Location'] = url_for('.get_job', job_id=job['id'])
+    return response, 202
+
+def queue_full_response():
+    """503 response asking the client to retry once the job queue drains"""
+    response = jsonify({'error': 'Too many background jobs queued, try again shortly'})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+# Verified ID token cache so repeat requests skip signature verification
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+TOKEN_REVOCATION_INTERVAL = int(os.environ.get("TOKEN_REVOCATION_INTERVAL", 0)) or None
+
+def setup_firebase():
+    """Initialize Firebase Admin and start keeping its signing keys warm"""
+    init_firebase()
+    token_cache.start_key_refresh(interval=int(os.environ.get("FIREBASE_KEY_REFRESH_INTERVAL", 3600)))
+
+token_cache = VerifiedTokenCache(maxsize=TOKEN_CACHE_SIZE, revocation_interval=TOKEN_REVOCATION_INTERVAL,
+                                 setup=setup_firebase)
 
 # Firebase Auth decorator
 def require_auth(f):
@@ -51,30 +354,107 @@ def require_auth(f):
     def decorated(*args, **kwargs):
         id_token = session.get('id_token')
         if not id_token:
-            return redirect(url_for('login'))
+            return redirect(url_for('.login'))
         
         try:
-            # Verify the ID token
-            decoded_token = auth.verify_id_token(id_token)
-            session['user_id'] = decoded_token['uid']
-            return f(*args, **kwargs)
+            # Verify the ID token (cached until it expires)
+            decoded_token = token_cache.verify(id_token)
         except Exception as e:
             print(f"Authentication error: {e}")
-            return redirect(url_for('login'))
+            return redirect(url_for('.login'))
+        
+        # Errors raised by the view itself (e.g. a 413 upload) reach their own handlers
+        session['user_id'] = decoded_token['uid']
+        return f(*args, **kwargs)
     return decorated
 
+def run_cpu_bound(fn, *args, **kwargs):
+    """
+    Run CPU-heavy work (setlist generation) without stalling other requests
+    
+    Under the gevent worker every request shares one OS thread, so work that
+    never waits on I/O is pushed to gevent's native thread pool; otherwise it
+    simply runs inline. The time spent is recorded as a 'cpu' span.
+    """
+    with instrumentation.traced('cpu', fn.__name__):
+        try:
+            from gevent import get_hub, monkey
+        except ImportError:
+            return fn(*args, **kwargs)
+        if not monkey.is_module_patched('threading'):
+            return fn(*args, **kwargs)
+        return get_hub().threadpool.apply(fn, args, kwargs)
+
+# Return JSON instead of an HTML page for uploads over MAX_UPLOAD_BYTES
+@bp.app_errorhandler(413)
+def handle_too_large(e):
+    return jsonify({'error': f"Request body is larger than {MAX_UPLOAD_BYTES} bytes"}), 413
+
+# Return JSON instead of a 500 page when Supabase is unreachable or times out
+@bp.app_errorhandler(requests.RequestException)
+def handle_upstream_error(e):
+    trace = instrumentation.current_trace.get()
+    print(f"Supabase request failed [{trace.request_id if trace else '-'}]: {e}")
+    return jsonify({'error': 'Upstream service unavailable'}), 503
+
+def pool_and_cache_metrics():
+    """Render Supabase pool and cache counters as Prometheus gauges"""
+    lines = []
+    sources = {
+        'supabase_pool': supabase.stats(),
+        'token_cache': token_cache.stats(),
+        'profile_cache': profile_cache.stats(),
+        'library_cache': library_cache.stats(),
+        'duplicate_cache': duplicate_cache.stats(),
+        'generation_cache': generation_cache.stats(),
+        'setlist_cache': setlist_cache.stats(),
+        'jobs': job_queue.stats()
+    }
+    for source, stats in sources.items():
+        for name, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                metric = f"setlistgenie_{source}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+    return '\n'.join(lines)
+
+# Prometheus scrape endpoint (set METRICS_TOKEN to require a bearer token)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@bp.route('/metrics')
+def metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(instrumentation.render_metrics(pool_and_cache_metrics()),
+                    mimetype='text/plain; version=0.0.4')
+
+# Health check exposing Supabase pool and cache usage
+@bp.route('/healthz')
+def healthz():
+    return jsonify({
+        'status': 'ok',
+        'supabase_pool': supabase.stats(),
+        'token_cache': token_cache.stats(),
+        'profile_cache': profile_cache.stats(),
+        'library_cache': library_cache.stats(),
+        'duplicate_cache': duplicate_cache.stats(),
+        'generation_cache': generation_cache.stats(),
+        'setlist_cache': setlist_cache.stats(),
+        'jobs': job_queue.stats()
+    })
+
 # Route to serve the index/login page
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
 # Route to serve the login page
-@app.route('/login')
+@bp.route('/login')
 def login():
     return render_template('login.html')
 
 # Route to handle user session check
-@app.route('/api/session/check', methods=['POST'])
+@bp.route('/api/session/check', methods=['POST'])
 def session_check():
     try:
         id_token = request.json.get('idToken')
@@ -82,85 +462,176 @@ def session_check():
             return jsonify({'authenticated': False}), 401
         
         # Verify the token with Firebase
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = token_cache.verify(id_token)
         
         # Store user info in session
         session['id_token'] = id_token
         session['user_id'] = decoded_token['uid']
-        
-        return jsonify({
-            'authenticated': True,
-            'user': {
-                'uid': decoded_token['uid'],
-                'email': decoded_token.get('email', '')
-            }
-        })
     except Exception as e:
         print(f"Session check error: {e}")
         return jsonify({'authenticated': False, 'error': str(e)}), 401
+    
+    # Resolve the profile once at sign-in so API calls can skip the lookup; this is only
+    # a prefetch, so a Supabase outage must not turn a valid sign-in into a 401
+    try:
+        resolve_profile_id(decoded_token['uid'])
+    except requests.RequestException as e:
+        print(f"Profile prefetch failed: {e}")
+    
+    return jsonify({
+        'authenticated': True,
+        'user': {
+            'uid': decoded_token['uid'],
+            'email': decoded_token.get('email', '')
+        }
+    })
 
 # Route to handle logout
-@app.route('/api/logout', methods=['POST'])
+@bp.route('/api/logout', methods=['POST'])
 def logout():
+    token_cache.invalidate(session.get('id_token'))
     session.clear()
     return jsonify({'success': True})
 
 # Dashboard route (protected)
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @require_auth
 def dashboard():
     return render_template('dashboard.html')
 
+# Paginated listings: default/maximum rows per page
+LIST_PAGE_SIZE = int(os.environ.get("LIST_PAGE_SIZE", 100))
+LIST_MAX_PAGE_SIZE = 1000
+
+# Query parameters that switch a listing from the full array to keyset pages
+LIST_PAGE_PARAMS = ('limit', 'after', 'fields', 'q', 'title', 'artist', 'name', 'updated_since')
+
+SETLIST_FIELDS = 'id,name,description,created_at,updated_at'
+
+def list_page(table, profile_id, fields, sort, search_columns, all_ids):
+    """
+    Serve one keyset page of a user's rows, filtered and projected in Supabase
+    
+    Query parameters:
+        limit: Rows per page (default LIST_PAGE_SIZE, at most LIST_MAX_PAGE_SIZE)
+        after: Cursor from the previous page's next_cursor
+        fields: Comma-separated columns to return
+        q: Case-insensitive search across ``search_columns``
+        <search column>: Case-insensitive search on that column alone
+        updated_since: Only rows changed after this ISO 8601 timestamp, oldest first
+    
+    Args:
+        table: Table to list
+        profile_id: Owner of the rows
+        fields: Columns callers may select (all of them by default)
+        sort: (column, direction) pairs ending in 'id', used when not delta-syncing
+        search_columns: Text columns that q and per-column search apply to
+        all_ids: Callable returning every current row ID, sent with the first delta page
+            so clients can drop rows deleted since their last sync
+    
+    Returns:
+        Dictionary with 'items', 'next_cursor' and, when delta-syncing, 'sync_token' and 'ids';
+        or a (response, status) tuple for invalid parameters
+    """
+    args = request.args
+    try:
+        selected = pagination.parse_fields(args.get('fields'), fields) or list(fields)
+        limit = pagination.parse_limit(args.get('limit'), LIST_PAGE_SIZE, LIST_MAX_PAGE_SIZE)
+        updated_since = None
+        if args.get('updated_since'):
+            updated_since = pagination.parse_timestamp(args['updated_since'])
+        order = [('updated_at', 'asc'), ('id', 'asc')] if updated_since else sort
+        after = pagination.decode_cursor(args['after'], len(order)) if args.get('after') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    filters = [('user_id', f"eq.{profile_id}")]
+    if updated_since:
+        filters.append(('updated_at', f"gt.{updated_since}"))
+    for column in search_columns:
+        if args.get(column, '').strip():
+            filters.append((column, f"ilike.{pagination.ilike_pattern(args[column], grouped=False)}"))
+    
+    conditions = []
+    if args.get('q', '').strip():
+        pattern = pagination.ilike_pattern(args['q'])
+        conditions.append(f"or({','.join(f'{column}.ilike.{pattern}' for column in search_columns)})")
+    if after is not None:
+        conditions.append(pagination.keyset_condition(order, after))
+    if len(conditions) == 1:
+        filters.append(('or', conditions[0][len('or'):]))
+    elif conditions:
+        filters.append(('and', f"({','.join(conditions)})"))
+    
+    # Sort keys are always fetched so the cursor can be built, then dropped if not asked for
+    sort_columns = [column for column, _ in order]
+    select = selected + [column for column in sort_columns if column not in selected]
+    response = supabase.get(pagination.page_path(table, filters, select, order, limit + 1))
+    if response.status_code != 200:
+        return jsonify({'error': f'Failed to fetch {table}'}), 500
+    
+    rows = response.json()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        next_cursor = pagination.encode_cursor([rows[-1][column] for column in sort_columns])
+    
+    page = {
+        'items': [{field: row.get(field) for field in selected} for row in rows],
+        'next_cursor': next_cursor
+    }
+    if updated_since:
+        # Pass the newest updated_at back as updated_since on the next sync
+        page['sync_token'] = rows[-1]['updated_at'] if rows else args['updated_since']
+        if after is None:
+            page['ids'] = all_ids()
+    return page
+
 # API endpoint to get user's songs
-@app.route('/api/songs', methods=['GET'])
+@bp.route('/api/songs', methods=['GET'])
 @require_auth
 def get_songs():
     user_id = session.get('user_id')
     
-    # Fetch user's profile from Supabase
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}'
-    }
-    
-    profile_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/profiles?firebase_uid=eq.{user_id}&select=id",
-        headers=headers
-    )
-    
-    if profile_response.status_code != 200 or not profile_response.json():
-        # Create profile if it doesn't exist
-        profile_data = {'firebase_uid': user_id}
-        profile_response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/profiles",
-            headers=headers,
-            json=profile_data
-        )
-        if profile_response.status_code != 201:
-            return jsonify({'error': 'Failed to create user profile'}), 500
+    # Resolve the user's profile, creating it on first use
+    profile_id = resolve_profile_id(user_id, create=True)
+    if profile_id is None:
+        return jsonify({'error': 'Failed to create user profile'}), 500
+    
+    # Keyset pages, search and delta sync are answered by Supabase directly
+    if any(param in request.args for param in LIST_PAGE_PARAMS):
+        def all_ids():
+            library = load_song_library(profile_id)
+            if library is None:
+                raise requests.RequestException('Failed to fetch song ids')
+            return [song['id'] for song in library['songs']]
         
-        # Fetch the newly created profile
-        profile_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/profiles?firebase_uid=eq.{user_id}&select=id",
-            headers=headers
+        page = list_page(
+            'songs', profile_id,
+            fields=SONG_FIELDS.split(',') + ['created_at', 'updated_at'],
+            sort=[('title', 'asc'), ('id', 'asc')],
+            search_columns=['title', 'artist'],
+            all_ids=all_ids
         )
-    
-    profile = profile_response.json()[0]
-    profile_id = profile['id']
-    
-    # Fetch songs for this user
-    songs_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/songs?user_id=eq.{profile_id}&select=id,title,artist,duration,must_play,exclude_from_set",
-        headers=headers
-    )
-    
-    if songs_response.status_code != 200:
+        if isinstance(page, tuple):
+            return page
+        page['songs'] = page.pop('items')
+        return jsonify(page)
+    
+    # Fetch songs for this user (served from the library cache when warm)
+    library = load_song_library(profile_id)
+    if library is None:
         return jsonify({'error': 'Failed to fetch songs'}), 500
     
-    return jsonify(songs_response.json())
+    # Let the browser reuse its copy when the library has not changed
+    response = jsonify(library['songs'])
+    response.set_etag(library['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 # API endpoint to add a new song
-@app.route('/api/songs', methods=['POST'])
+@bp.route('/api/songs', methods=['POST'])
 @require_auth
 def add_song():
     user_id = session.get('user_id')
@@ -173,20 +644,19 @@ def add_song():
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
     # Get user profile ID
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}'
-    }
-    
-    profile_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/profiles?firebase_uid=eq.{user_id}&select=id",
-        headers=headers
-    )
-    
-    if profile_response.status_code != 200 or not profile_response.json():
+    profile_id = resolve_profile_id(user_id)
+    if profile_id is None:
         return jsonify({'error': 'User profile not found'}), 404
     
-    profile_id = profile_response.json()[0]['id']
+    # Warn about songs the library already has under a similar title (refuse them if asked to)
+    likely = []
+    library = load_song_library(profile_id)
+    if library is not None:
+        index, _ = library_duplicates(profile_id, library, clusters=False)
+        likely = [duplicate_match(index.songs[position], score)
+                  for position, score in index.matches(song_data['title'], song_data['artist'])]
+        if likely and song_data.get('skip_duplicates'):
+            return jsonify({'error': 'Likely duplicate of an existing song', 'likely_duplicates': likely}), 409
     
     # Add the song
     song = {
@@ -194,172 +664,1041 @@ def add_song():
         'title': song_data['title'],
         'artist': song_data['artist'],
         'duration': song_data['duration'],
+        'energy': song_data.get('energy', 5),
+        'key': song_data.get('key', ''),
+        'bpm': song_data.get('bpm', 0),
         'must_play': song_data.get('must_play', False),
         'exclude_from_set': song_data.get('exclude_from_set', False)
     }
     
-    response = requests.post(
-        f"{SUPABASE_URL}/rest/v1/songs",
-        headers=headers,
-        json=song
-    )
+    response = supabase.post("songs", json=song, prefer='return=representation')
+    
+    # The unique (user_id, title, artist) index rejects an exact duplicate; name the song it clashes with
+    if response.status_code == 409:
+        existing = supabase.get(pagination.page_path(
+            'songs',
+            [('user_id', f"eq.{profile_id}"), ('title', f"eq.{song['title']}"), ('artist', f"eq.{song['artist']}")],
+            ['id', 'title', 'artist'], [('created_at', 'asc')], 1
+        ))
+        rows = existing.json() if existing.status_code == 200 else []
+        return jsonify({
+            'error': f"'{song['title']}' by {song['artist']} is already in your library",
+            'existing_song': rows[0] if rows else None
+        }), 409
     
     if response.status_code != 201:
         return jsonify({'error': 'Failed to add song'}), 500
     
-    return jsonify({'success': True, 'id': response.json().get('id')})
+    created = response.json()[0]
+    patch_song_library(profile_id, added=[created])
+    
+    return jsonify({'success': True, 'id': created.get('id'), 'likely_duplicates': likely})
 
 # API endpoint to delete a song
-@app.route('/api/songs/<song_id>', methods=['DELETE'])
+@bp.route('/api/songs/<song_id>', methods=['DELETE'])
 @require_auth
 def delete_song(song_id):
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}'
-    }
-    
-    response = requests.delete(
-        f"{SUPABASE_URL}/rest/v1/songs?id=eq.{song_id}",
-        headers=headers
-    )
+    response = supabase.delete(f"songs?id=eq.{song_id}")
     
     if response.status_code != 204:
         return jsonify({'error': 'Failed to delete song'}), 500
     
+    profile_id = resolve_profile_id(session.get('user_id'))
+    if profile_id is not None:
+        patch_song_library(profile_id, removed_ids=[song_id])
+    
     return jsonify({'success': True})
 
+# Bulk song edits: fields that may be changed, the type each must have, and the most IDs per call
+BULK_EDIT_FIELDS = {
+    'must_play': bool,
+    'exclude_from_set': bool,
+    'energy': int,
+    'bpm': int,
+    'duration': int,
+    'key': str
+}
+BULK_MAX_IDS = int(os.environ.get("BULK_MAX_IDS", 500))
+
+def parse_bulk_ids(data):
+    """
+    Validate the 'ids' list of a bulk request
+    
+    Returns:
+        (ids, requested): The distinct valid song IDs in canonical form, and a
+        (requested ID, canonical ID or None if invalid) pair per requested ID
+    
+    Raises:
+        ValueError: If 'ids' is missing, empty or too long
+    """
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('ids must be a non-empty list of song IDs')
+    if len(ids) > BULK_MAX_IDS:
+        raise ValueError(f"At most {BULK_MAX_IDS} ids per request")
+    
+    requested = []
+    for song_id in ids:
+        try:
+            requested.append((song_id, str(uuid.UUID(str(song_id)))))
+        except ValueError:
+            requested.append((song_id, None))
+    valid = list(dict.fromkeys(canonical for _, canonical in requested if canonical))
+    return valid, requested
+
+def bulk_results(requested, matched, status):
+    """Per-ID results: ``status`` if the query matched the song, else 'not_found' or 'invalid'"""
+    results = []
+    for song_id, canonical in requested:
+        if canonical is None:
+            outcome = 'invalid'
+        else:
+            outcome = status if canonical in matched else 'not_found'
+        results.append({'id': song_id, 'status': outcome})
+    return results
+
+def bulk_filter(profile_id, ids):
+    """PostgREST filter matching the given songs, limited to those the profile owns"""
+    return f"id=in.({','.join(pagination.quote_value(song_id) for song_id in ids)})&user_id=eq.{profile_id}"
+
+# API endpoint to delete many songs in one call
+@bp.route('/api/songs/bulk-delete', methods=['POST'])
+@require_auth
+def bulk_delete_songs():
+    try:
+        ids, requested = parse_bulk_ids(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    profile_id = resolve_profile_id(session.get('user_id'))
+    if profile_id is None:
+        return jsonify({'error': 'User profile not found'}), 404
+    
+    deleted = set()
+    if ids:
+        # One DELETE; songs owned by someone else simply don't match and report not_found
+        response = supabase.delete(f"songs?{bulk_filter(profile_id, ids)}&select=id",
+                                   prefer='return=representation')
+        if response.status_code != 200:
+            return jsonify({'error': 'Failed to delete songs'}), 500
+        deleted = {str(row['id']) for row in response.json()}
+        if deleted:
+            patch_song_library(profile_id, removed_ids=deleted)
+    
+    return jsonify({
+        'success': True,
+        'deleted': len(deleted),
+        'results': bulk_results(requested, deleted, 'deleted')
+    })
+
+# API endpoint to apply the same changes to many songs in one call
+@bp.route('/api/songs/bulk-update', methods=['POST'])
+@require_auth
+def bulk_update_songs():
+    data = request.json
+    try:
+        ids, requested = parse_bulk_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    changes = data.get('changes')
+    if not isinstance(changes, dict) or not changes:
+        return jsonify({'error': 'changes must be a non-empty object'}), 400
+    for field, value in changes.items():
+        expected = BULK_EDIT_FIELDS.get(field)
+        if expected is None:
+            return jsonify({'error': f"Field '{field}' cannot be bulk edited "
+                                     f"(choose from {', '.join(BULK_EDIT_FIELDS)})"}), 400
+        # bool is a subclass of int, so check it explicitly
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            return jsonify({'error': f"{field} must be of type {expected.__name__}"}), 400
+    
+    profile_id = resolve_profile_id(session.get('user_id'))
+    if profile_id is None:
+        return jsonify({'error': 'User profile not found'}), 404
+    
+    updated = []
+    if ids:
+        response = supabase.patch(f"songs?{bulk_filter(profile_id, ids)}&select={SONG_FIELDS}",
+                                  json=changes, prefer='return=representation')
+        if response.status_code != 200:
+            return jsonify({'error': 'Failed to update songs'}), 500
+        updated = response.json()
+        if updated:
+            patch_song_library(profile_id, added=updated, removed_ids=[song['id'] for song in updated])
+    
+    return jsonify({
+        'success': True,
+        'updated': len(updated),
+        'results': bulk_results(requested, {str(song['id']) for song in updated}, 'updated')
+    })
+
+def library_duplicates(profile_id, library, threshold=None, clusters=True):
+    """
+    The fuzzy duplicate index of a cached library
+    
+    The index at DUPLICATE_THRESHOLD is built on first use and kept in
+    duplicate_cache until the library changes; other thresholds are computed
+    for the request and not stored.
+    
+    Args:
+        profile_id: Profile the library belongs to
+        library: The user's cached song library (see load_song_library)
+        threshold: Minimum title similarity (defaults to DUPLICATE_THRESHOLD)
+        clusters: Also need the library's duplicate clusters, not just the index
+    
+    Returns:
+        (DuplicateIndex, clusters) as from song_dedupe.find_clusters; clusters is
+        None if it was not asked for and the index was extended after a write
+    """
+    threshold = DUPLICATE_THRESHOLD if threshold is None else threshold
+    if threshold != DUPLICATE_THRESHOLD:
+        return run_cpu_bound(find_clusters, library['songs'], threshold)
+    
+    cached = duplicate_cache.get(profile_id)
+    if (cached is not None and cached['etag'] == library['etag'] and
+            (not clusters or cached['clusters'] is not None)):
+        return cached['index'], cached['clusters']
+    index, found = run_cpu_bound(find_clusters, library['songs'], threshold)
+    _cache_duplicates(profile_id, library['etag'], index, found)
+    return index, found
+
+def duplicate_match(song, score):
+    """A likely duplicate as reported by the API"""
+    return {
+        'id': song.get('id'),
+        'title': song.get('title'),
+        'artist': song.get('artist'),
+        'score': round(score, 3)
+    }
+
+# API endpoint to list clusters of likely duplicate songs in the library
+@bp.route('/api/songs/duplicates', methods=['GET'])
+@require_auth
+def get_duplicate_songs():
+    try:
+        threshold = float(request.args.get('threshold', DUPLICATE_THRESHOLD))
+    except ValueError:
+        return jsonify({'error': 'threshold must be a number'}), 400
+    if not 0.5 <= threshold <= 1:
+        return jsonify({'error': 'threshold must be between 0.5 and 1'}), 400
+    
+    profile_id = resolve_profile_id(session.get('user_id'))
+    if profile_id is None:
+        return jsonify({'error': 'User profile not found'}), 404
+    library = load_song_library(profile_id)
+    if library is None:
+        return jsonify({'error': 'Failed to fetch songs'}), 500
+    
+    index, clusters = library_duplicates(profile_id, library, round(threshold, 2))
+    results = []
+    for cluster in clusters:
+        songs = [index.songs[position] for position in cluster['positions']]
+        results.append({
+            'keep': songs[suggest_keep(songs)].get('id'),
+            'score': cluster['score'],
+            'songs': songs
+        })
+    return jsonify({
+        'threshold': round(threshold, 2),
+        'songs_checked': len(index),
+        'duplicates': sum(len(cluster['songs']) - 1 for cluster in results),
+        'clusters': results
+    })
+
+# API endpoint to merge likely duplicates into the copy being kept
+@bp.route('/api/songs/duplicates/resolve', methods=['POST'])
+@require_auth
+def resolve_duplicate_songs():
+    data = request.json or {}
+    resolutions = data.get('resolutions', [data] if 'keep' in data else None)
+    if not isinstance(resolutions, list) or not resolutions:
+        return jsonify({'error': 'resolutions must be a non-empty list of {keep, duplicates}'}), 400
+    
+    # Canonical IDs per resolution; each song may appear once across the whole request
+    parsed = []
+    seen = set()
+    for resolution in resolutions:
+        if not isinstance(resolution, dict) or not isinstance(resolution.get('duplicates'), list):
+            return jsonify({'error': 'Each resolution needs keep and a list of duplicates'}), 400
+        try:
+            keep = str(uuid.UUID(str(resolution.get('keep'))))
+            duplicates = list(dict.fromkeys(str(uuid.UUID(str(song_id))) for song_id in resolution['duplicates']))
+        except ValueError:
+            parsed.append(None)
+            continue
+        if not duplicates or keep in duplicates or seen.intersection([keep] + duplicates):
+            return jsonify({'error': f"Resolution for {keep} must list other songs, each only once per request"}), 400
+        seen.update([keep] + duplicates)
+        parsed.append((keep, duplicates))
+    if len(seen) > BULK_MAX_IDS:
+        return jsonify({'error': f"At most {BULK_MAX_IDS} songs per request"}), 400
+    
+    profile_id = resolve_profile_id(session.get('user_id'))
+    if profile_id is None:
+        return jsonify({'error': 'User profile not found'}), 404
+    library = load_song_library(profile_id)
+    if library is None:
+        return jsonify({'error': 'Failed to fetch songs'}), 500
+    
+    # Only songs in the user's own library can be merged
+    owned = {str(song.get('id')): song for song in library['songs']}
+    results = []
+    merges = []
+    for resolution, ids in zip(resolutions, parsed):
+        if ids is None:
+            results.append({'keep': resolution.get('keep'), 'status': 'invalid'})
+            continue
+        keep, duplicates = ids
+        if not all(song_id in owned for song_id in [keep] + duplicates):
+            results.append({'keep': keep, 'status': 'not_found'})
+            continue
+        
+        # The kept song is must-play if any copy was, and takes details it is missing from them
+        kept = owned[keep]
+        changes = {}
+        if not kept.get('must_play') and any(owned[song_id].get('must_play') for song_id in duplicates):
+            changes['must_play'] = True
+        for field in ('duration', 'bpm', 'key'):
+            if not kept.get(field):
+                value = next((owned[song_id][field] for song_id in duplicates if owned[song_id].get(field)), None)
+                if value:
+                    changes[field] = value
+        merges.append((keep, duplicates, changes))
+        results.append({'keep': keep, 'status': 'merged', 'removed': duplicates, 'changes': changes})
+    
+    def failed(message):
+        # Earlier merges in this request may have gone through, so drop the cached library
+        invalidate_song_library(profile_id)
+        return jsonify({'error': message, 'results': results}), 500
+    
+    updated = []
+    removed = []
+    for keep, duplicates, changes in merges:
+        # Saved setlists point at the kept song instead of losing the duplicates' rows
+        response = supabase.patch(
+            f"setlist_songs?song_id=in.({','.join(duplicates)})",
+            json={'song_id': keep}, prefer='return=minimal'
+        )
+        if response.status_code not in (200, 204):
+            return failed('Failed to update setlists')
+        if changes:
+            response = supabase.patch(f"songs?id=eq.{keep}&user_id=eq.{profile_id}&select={SONG_FIELDS}",
+                                      json=changes, prefer='return=representation')
+            if response.status_code != 200:
+                return failed('Failed to update songs')
+            updated.extend(response.json())
+        removed.extend(duplicates)
+    
+    if removed:
+        # One DELETE for every duplicate in the request
+        response = supabase.delete(f"songs?{bulk_filter(profile_id, removed)}&select=id",
+                                   prefer='return=representation')
+        if response.status_code != 200:
+            return failed('Failed to delete songs')
+    if updated or removed:
+        patch_song_library(profile_id, added=updated,
+                           removed_ids=removed + [song['id'] for song in updated])
+    
+    return jsonify({
+        'success': True,
+        'merged': len(removed),
+        'results': results
+    })
+
+def library_columns(library):
+    """The generator's column view of a cached library, built on first use and kept with it"""
+    columns = library.get('columns')
+    if columns is None:
+        columns = library['columns'] = SongColumns(library['songs'])
+    return columns
+
+def generate(library, shape, candidates, top_k, seed, options):
+    """
+    Generate a setlist (or the best of several candidates) from a song library
+    
+    Args:
+        library: The user's cached song library (see load_song_library)
+        shape: num_sets, set_duration and min_songs_between_artist (see parse_set_shape)
+        candidates: Number of candidate setlists to generate and score
+        top_k: Number of best candidates to return
+        seed: Seed for reproducible generation
+        options: Extra generate_setlist arguments (mode, time_budget, flow, ...)
+    
+    Returns:
+        generate_setlist result (plus 'candidates' when more than one was generated),
+        or None if every song is excluded from sets
+    """
+    # Excluded songs are skipped by the generator
+    songs = library_columns(library)
+    if not songs.playable():
+        return None
+    
+    if candidates > 1:
+        ranked = run_cpu_bound(
+            generate_candidates,
+            songs=songs,
+            num_sets=shape['num_sets'],
+            set_duration=shape['set_duration'],
+            min_songs_between_artist=shape['min_songs_between_artist'],
+            candidates=candidates,
+            top_k=top_k,
+            seed=seed,
+            **options
+        )
+        result = dict(ranked[0])
+        result['candidates'] = [
+            {'seed': candidate['seed'], 'score': candidate['score'], 'setlist': candidate['setlist']}
+            for candidate in ranked
+        ]
+        return result
+    
+    return run_cpu_bound(
+        generate_setlist,
+        songs=songs,
+        num_sets=shape['num_sets'],
+        set_duration=shape['set_duration'],
+        min_songs_between_artist=shape['min_songs_between_artist'],
+        seed=seed,
+        **options
+    )
+
+def parse_set_shape(values, fields):
+    """
+    Read show-shape fields from a request body as integers clamped to SET_SHAPE_LIMITS
+    
+    Args:
+        values: Request body (or one show of a tour)
+        fields: Names of the fields to read; min_songs_between_artist defaults to 3
+    
+    Returns:
+        Dictionary of field name -> integer
+    
+    Raises:
+        ValueError: If a field is missing, not an integer or below its minimum
+    """
+    shape = {}
+    for field in fields:
+        low, high = SET_SHAPE_LIMITS[field]
+        value = values.get(field, 3 if field == 'min_songs_between_artist' else None)
+        if value is None:
+            raise ValueError(f"Missing required field: {field}")
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be an integer") from None
+        if value < low:
+            raise ValueError(f"{field} must be at least {low}")
+        shape[field] = min(value, high)
+    return shape
+
 # API endpoint to generate a setlist
-@app.route('/api/generate-setlist', methods=['POST'])
+def save_setlist(profile_id, sets, name, description, setlist_id=None):
+    """
+    Save a generated setlist header and its songs
+    
+    Both are written by the save_setlist Postgres function (schema.sql) in a
+    single transaction, so a failed save leaves nothing behind.
+    
+    Args:
+        profile_id: Profile that owns the setlist
+        sets: The 'setlist' list from a generated result
+        name: Setlist name
+        description: Setlist description
+        setlist_id: Id to create the setlist under; saving again under the same id
+            replaces its songs, which makes a retried save safe
+    
+    Returns:
+        Dictionary with 'setlist_id' and 'save_time_ms', or 'error' (and 'row_errors') on failure
+    """
+    save_started = time.perf_counter()
+    
+    # Build every setlist_songs row up front so they are written in the same call as the header
+    rows = []
+    row_errors = []
+    for set_idx, set_data in enumerate(sets):
+        for position, song in enumerate(set_data['songs']):
+            if not song.get('id'):
+                row_errors.append({
+                    'set_number': set_idx + 1,
+                    'position': position,
+                    'error': f"Song '{song.get('title', '')}' has no id"
+                })
+                continue
+            rows.append({
+                'song_id': song['id'],
+                'position': position,
+                'set_number': set_idx + 1
+            })
+    
+    if row_errors:
+        return {
+            'error': 'Failed to save setlist songs',
+            'row_errors': row_errors,
+            'save_time_ms': round((time.perf_counter() - save_started) * 1000, 1)
+        }
+    
+    response = supabase.post("rpc/save_setlist", json={
+        'p_user_id': profile_id,
+        'p_name': name,
+        'p_description': description,
+        'p_songs': rows,
+        'p_setlist_id': setlist_id
+    })
+    if response.status_code != 200:
+        return {
+            'error': 'Failed to save setlist',
+            'details': response.text,
+            'save_time_ms': round((time.perf_counter() - save_started) * 1000, 1)
+        }
+    
+    setlist_id = response.json()
+    setlist_cache.pop((profile_id, setlist_id))
+    return {
+        'setlist_id': setlist_id,
+        'save_time_ms': round((time.perf_counter() - save_started) * 1000, 1)
+    }
+
+def run_save_job(job, payload):
+    """Job handler: save a generated setlist under the id already returned to the client"""
+    saved = save_setlist(payload['profile_id'], payload['sets'], payload['name'], payload['description'],
+                         setlist_id=payload['setlist_id'])
+    if 'error' in saved:
+        raise JobFailed(saved['error'], saved)
+    return saved
+
+job_queue.register('save_setlist', run_save_job)
+
+@bp.route('/api/generate-setlist', methods=['POST'])
 @require_auth
 def api_generate_setlist():
     data = request.json
     user_id = session.get('user_id')
     
     # Validate input data
-    required_fields = ['num_sets', 'set_duration']
-    for field in required_fields:
-        if field not in data:
-            return jsonify({'error': f'Missing required field: {field}'}), 400
+    try:
+        shape = parse_set_shape(data, ('num_sets', 'set_duration', 'min_songs_between_artist'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Get user profile ID
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}'
-    }
-    
-    profile_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/profiles?firebase_uid=eq.{user_id}&select=id",
-        headers=headers
-    )
-    
-    if profile_response.status_code != 200 or not profile_response.json():
+    profile_id = resolve_profile_id(user_id)
+    if profile_id is None:
         return jsonify({'error': 'User profile not found'}), 404
     
-    profile_id = profile_response.json()[0]['id']
-    
     # Fetch songs for this user
-    songs_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/songs?user_id=eq.{profile_id}&select=id,title,artist,duration,must_play,exclude_from_set",
-        headers=headers
-    )
-    
-    if songs_response.status_code != 200:
+    library = load_song_library(profile_id)
+    if library is None:
         return jsonify({'error': 'Failed to fetch songs'}), 500
     
-    songs = songs_response.json()
-    
-    # Filter out excluded songs
-    songs = [song for song in songs if not song.get('exclude_from_set', False)]
-    
-    if not songs:
-        return jsonify({'error': 'No songs available for setlist generation'}), 400
+    # Packing mode and the CPU budget the optimiser may spend on this request
+    mode = data.get('mode', 'greedy')
+    if mode not in PACKING_MODES:
+        return jsonify({'error': f"mode must be one of: {', '.join(PACKING_MODES)}"}), 400
+    try:
+        time_budget_ms = int(data.get('time_budget_ms', DEFAULT_PACKING_BUDGET_MS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'time_budget_ms must be an integer'}), 400
+    time_budget_ms = max(0, min(time_budget_ms, MAX_PACKING_BUDGET_MS))
     
-    # Import the setlist generator function
-    from setlist_generator import generate_setlist
+    # Optional energy curve used to order each set for flow
+    flow = data.get('flow')
+    if flow is not None and flow not in ENERGY_CURVES:
+        return jsonify({'error': f"flow must be one of: {', '.join(ENERGY_CURVES)}"}), 400
     
-    # Generate the setlist
-    result = generate_setlist(
-        songs=songs,
-        num_sets=data['num_sets'],
-        set_duration=data['set_duration'],
-        min_songs_between_artist=data.get('min_songs_between_artist', 3)
+    # Number of candidate setlists to generate and score, and how many to return
+    try:
+        candidates = int(data.get('candidates', 1))
+        top_k = int(data.get('top_k', 3))
+        seed = int(data['seed']) if data.get('seed') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'candidates, top_k and seed must be integers'}), 400
+    candidates = max(1, min(candidates, MAX_CANDIDATES))
+    top_k = max(1, min(top_k, candidates))
+    
+    # Unseeded requests get a seed too, returned so the same setlist can be reproduced or shared
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    
+    # Same library, parameters and seed: reuse the earlier result instead of regenerating
+    cache_key = (
+        profile_id, library['etag'], shape['num_sets'], shape['set_duration'],
+        shape['min_songs_between_artist'], mode, time_budget_ms, flow, candidates, top_k, seed
     )
+    cached = generation_cache.get(cache_key)
+    
+    if cached is not None:
+        result = dict(cached['result'])
+        result['cached'] = True
+    else:
+        result = generate(library, shape, candidates, top_k, seed, {
+            'mode': mode,
+            'time_budget': time_budget_ms / 1000,
+            'flow': flow,
+            'flow_time_limit': FLOW_TIME_LIMIT_MS / 1000
+        })
+        if result is None:
+            return jsonify({'error': 'No songs available for setlist generation'}), 400
+        result['seed'] = seed
+        result['cached'] = False
+        generation_cache.set(cache_key, {
+            'result': dict(result),
+            'bytes': len(json.dumps(result, separators=(',', ':')))
+        })
     
-    # Save the setlist if requested
+    # Save the setlist if requested (in a background job when asked to, or when it is large)
     if data.get('save_setlist'):
         setlist_name = data.get('setlist_name', 'Untitled Setlist')
+        description = data.get('description', '')
+        row_count = sum(len(set_data['songs']) for set_data in result['setlist'])
         
-        # Create the setlist
-        setlist_data = {
-            'user_id': profile_id,
-            'name': setlist_name,
-            'description': data.get('description', '')
-        }
-        
-        setlist_response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/setlists",
-            headers=headers,
-            json=setlist_data
-        )
-        
-        if setlist_response.status_code != 201:
-            return jsonify({'error': 'Failed to save setlist'}), 500
-        
-        setlist_id = setlist_response.json().get('id')
-        
-        # Add songs to the setlist
-        for set_idx, set_data in enumerate(result['setlist']):
-            for position, song in enumerate(set_data['songs']):
-                setlist_song_data = {
+        if data.get('save_async') or row_count > SAVE_SYNC_MAX_ROWS:
+            setlist_id = str(uuid.uuid4())
+            try:
+                job = job_queue.submit('save_setlist', {
+                    'profile_id': profile_id,
                     'setlist_id': setlist_id,
-                    'song_id': song['id'],
-                    'position': position,
-                    'set_number': set_idx + 1
-                }
-                
-                requests.post(
-                    f"{SUPABASE_URL}/rest/v1/setlist_songs",
-                    headers=headers,
-                    json=setlist_song_data
-                )
+                    'name': setlist_name,
+                    'description': description,
+                    'sets': result['setlist']
+                }, owner=user_id)
+            except QueueFull:
+                return queue_full_response()
+            result['setlist_id'] = setlist_id
+            result['save_job'] = job
+            result['status_url'] = url_for('.get_job', job_id=job['id'])
+            return jsonify(result), 202
+        
+        saved = save_setlist(profile_id, result['setlist'], setlist_name, description)
+        if 'error' in saved:
+            return jsonify(saved), 500
+        result.update(saved)
+    
+    return jsonify(result)
+
+# API endpoint to generate setlists for a whole tour in one run
+@bp.route('/api/generate-tour', methods=['POST'])
+@require_auth
+def api_generate_tour():
+    data = request.json or {}
+    
+    shows = data.get('shows')
+    if not isinstance(shows, list) or not shows:
+        return jsonify({'error': 'shows must be a non-empty list'}), 400
+    if len(shows) > MAX_TOUR_SHOWS:
+        return jsonify({'error': f"At most {MAX_TOUR_SHOWS} shows per tour"}), 400
+    
+    # Each show needs its own positive num_sets and set_duration; other keys are passed through
+    tour = []
+    for number, show in enumerate(shows, 1):
+        if not isinstance(show, dict):
+            return jsonify({'error': f"Show {number} must be an object"}), 400
+        try:
+            tour.append(dict(show, **parse_set_shape(show, ('num_sets', 'set_duration'))))
+        except ValueError as e:
+            return jsonify({'error': f"Show {number}: {e}"}), 400
+    
+    mode = data.get('mode', 'greedy')
+    if mode not in PACKING_MODES:
+        return jsonify({'error': f"mode must be one of: {', '.join(PACKING_MODES)}"}), 400
+    flow = data.get('flow')
+    if flow is not None and flow not in ENERGY_CURVES:
+        return jsonify({'error': f"flow must be one of: {', '.join(ENERGY_CURVES)}"}), 400
+    
+    # Rotation rules: how many shows a song, an opener and a closer sit out
+    try:
+        spacing = parse_set_shape(data, ('min_songs_between_artist',))['min_songs_between_artist']
+        rests = {name: max(0, min(int(data.get(name, default)), len(tour)))
+                 for name, default in (('song_rest', 1), ('opener_rest', 3), ('closer_rest', 3))}
+        seed = int(data['seed']) if data.get('seed') is not None else random.randrange(2 ** 31)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'min_songs_between_artist, song_rest, opener_rest, closer_rest '
+                                 'and seed must be integers'}), 400
+    
+    profile_id = resolve_profile_id(session.get('user_id'))
+    if profile_id is None:
+        return jsonify({'error': 'User profile not found'}), 404
+    
+    # One library load for the whole tour
+    library = load_song_library(profile_id)
+    if library is None:
+        return jsonify({'error': 'Failed to fetch songs'}), 500
+    songs = library_columns(library)
+    if not songs.playable():
+        return jsonify({'error': 'No songs available for setlist generation'}), 400
+    
+    result = run_cpu_bound(
+        generate_tour,
+        songs,
+        tour,
+        min_songs_between_artist=spacing,
+        mode=mode,
+        time_budget=min(DEFAULT_PACKING_BUDGET_MS * len(tour), TOUR_TIME_BUDGET_MS / 2) / 1000,
+        flow=flow,
+        flow_time_limit=min(FLOW_TIME_LIMIT_MS * len(tour), TOUR_TIME_BUDGET_MS / 2) / 1000,
+        seed=seed,
+        **rests
+    )
+    result['seed'] = seed
+    return jsonify(result)
+
+def setlist_song_ids(setlist):
+    """
+    Song IDs per set from a setlist in the shape generate-setlist returns it
+    
+    Each set may be a list or an object with 'songs', and each song an ID or
+    an object with 'id'.
+    
+    Returns:
+        List of lists of song IDs, or None if the setlist is malformed
+    """
+    if not isinstance(setlist, list) or not setlist:
+        return None
+    sets = []
+    for set_data in setlist:
+        if isinstance(set_data, dict):
+            set_data = set_data.get('songs')
+        if not isinstance(set_data, list):
+            return None
+        ids = [song.get('id') if isinstance(song, dict) else song for song in set_data]
+        if not all(isinstance(song_id, (str, int)) for song_id in ids):
+            return None
+        sets.append(ids)
+    return sets
+
+# API endpoint to re-fill the open slots of an existing setlist, keeping pinned songs in place
+@bp.route('/api/regenerate-setlist', methods=['POST'])
+@require_auth
+def api_regenerate_setlist():
+    data = request.json or {}
+    
+    sets = setlist_song_ids(data.get('setlist'))
+    if sets is None:
+        return jsonify({'error': 'setlist must be a non-empty list of sets of songs'}), 400
+    pinned = data.get('pinned', [])
+    if not isinstance(pinned, list):
+        return jsonify({'error': 'pinned must be a list of song IDs'}), 400
+    try:
+        shape = parse_set_shape(data, ('set_duration', 'min_songs_between_artist'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        seed = int(data['seed']) if data.get('seed') is not None else random.randrange(2 ** 31)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seed must be an integer'}), 400
+    
+    profile_id = resolve_profile_id(session.get('user_id'))
+    if profile_id is None:
+        return jsonify({'error': 'User profile not found'}), 404
     
+    library = load_song_library(profile_id)
+    if library is None:
+        return jsonify({'error': 'Failed to fetch songs'}), 500
+    
+    result = run_cpu_bound(
+        regenerate_setlist,
+        library_columns(library),
+        sets,
+        shape['set_duration'],
+        min_songs_between_artist=shape['min_songs_between_artist'],
+        pinned=[song.get('id') if isinstance(song, dict) else song for song in pinned],
+        seed=seed
+    )
+    result['seed'] = seed
     return jsonify(result)
 
 # API endpoint to get saved setlists
-@app.route('/api/setlists', methods=['GET'])
+@bp.route('/api/setlists', methods=['GET'])
 @require_auth
 def get_setlists():
     user_id = session.get('user_id')
     
     # Get user profile ID
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}'
-    }
-    
-    profile_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/profiles?firebase_uid=eq.{user_id}&select=id",
-        headers=headers
-    )
-    
-    if profile_response.status_code != 200 or not profile_response.json():
+    profile_id = resolve_profile_id(user_id)
+    if profile_id is None:
+        if any(param in request.args for param in LIST_PAGE_PARAMS):
+            return jsonify({'setlists': [], 'next_cursor': None})
         return jsonify([])
     
-    profile_id = profile_response.json()[0]['id']
+    # Keyset pages, search and delta sync
+    if any(param in request.args for param in LIST_PAGE_PARAMS):
+        def all_ids():
+            ids_response = supabase.get(f"setlists?user_id=eq.{profile_id}&select=id")
+            if ids_response.status_code != 200:
+                raise requests.RequestException('Failed to fetch setlist ids')
+            return [setlist['id'] for setlist in ids_response.json()]
+        
+        page = list_page(
+            'setlists', profile_id,
+            fields=SETLIST_FIELDS.split(','),
+            sort=[('created_at', 'desc'), ('id', 'desc')],
+            search_columns=['name'],
+            all_ids=all_ids
+        )
+        if isinstance(page, tuple):
+            return page
+        page['setlists'] = page.pop('items')
+        return jsonify(page)
     
     # Fetch setlists for this user
-    setlists_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/setlists?user_id=eq.{profile_id}&select=id,name,description,created_at",
-        headers=headers
-    )
+    setlists_response = supabase.get(f"setlists?user_id=eq.{profile_id}&select=id,name,description,created_at")
     
     if setlists_response.status_code != 200:
         return jsonify({'error': 'Failed to fetch setlists'}), 500
     
     return jsonify(setlists_response.json())
 
+# Setlist header with its songs embedded in set/position order, for GET /api/setlists/<id>
+SETLIST_DETAIL_SELECT = (
+    "id,name,description,created_at,updated_at,"
+    "setlist_songs(position,set_number,songs(id,title,artist,duration,energy,key,bpm,must_play))"
+)
+
+def render_setlist(setlist):
+    """Group an embedded setlist_songs list into sets, returning the JSON body"""
+    sets = {}
+    for row in setlist.pop('setlist_songs') or []:
+        song = row.get('songs')
+        if song is None:
+            continue
+        current = sets.setdefault(row['set_number'], {'set_number': row['set_number'], 'songs': [], 'duration': 0})
+        current['songs'].append(song)
+        current['duration'] += song.get('duration') or 0
+    setlist['sets'] = [sets[number] for number in sorted(sets)]
+    setlist['song_count'] = sum(len(set_data['songs']) for set_data in setlist['sets'])
+    return json.dumps(setlist, separators=(',', ':'))
+
+def setlist_response(entry):
+    """JSON response for a rendered setlist, or 304 if the client already has it"""
+    response = Response(entry['body'], mimetype='application/json')
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# API endpoint to get one saved setlist with its songs
+@bp.route('/api/setlists/<setlist_id>', methods=['GET'])
+@require_auth
+def get_setlist(setlist_id):
+    profile_id = resolve_profile_id(session.get('user_id'))
+    if profile_id is None:
+        return jsonify({'error': 'User profile not found'}), 404
+    
+    try:
+        setlist_id = str(uuid.UUID(setlist_id))
+    except ValueError:
+        return jsonify({'error': 'Setlist not found'}), 404
+    
+    cache_key = (profile_id, setlist_id)
+    entry = setlist_cache.get(cache_key)
+    if entry is not None:
+        return setlist_response(entry)
+    
+    # Header, ordered setlist_songs and song details in one embedded query
+    response = supabase.get(
+        f"setlists?id=eq.{setlist_id}&user_id=eq.{profile_id}&select={SETLIST_DETAIL_SELECT}"
+        f"&setlist_songs.order=set_number.asc,position.asc"
+    )
+    if response.status_code != 200:
+        return jsonify({'error': 'Failed to fetch setlist'}), 500
+    rows = response.json()
+    if not rows:
+        return jsonify({'error': 'Setlist not found'}), 404
+    
+    # The ETag covers updated_at and the embedded rows, so edited song details also change it
+    body = render_setlist(rows[0])
+    entry = {'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(), 'body': body}
+    setlist_cache.set(cache_key, entry)
+    return setlist_response(entry)
+
+def _song_key(title, artist):
+    """Normalised (title, artist) pair used to detect duplicate songs"""
+    return (' '.join(title.split()).casefold(), ' '.join(artist.split()).casefold())
+
+def _parse_song_row(row, profile_id):
+    """Convert one CSV row into a songs record, raising ValueError if invalid"""
+    def as_int(field, default):
+        value = (row.get(field) or '').strip()
+        if not value:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"Invalid {field} '{value}'")
+    
+    song_data = {
+        'user_id': profile_id,
+        'title': (row.get('title') or '').strip(),
+        'artist': (row.get('artist') or '').strip(),
+        'duration': as_int('duration', 0),
+        'energy': as_int('energy', 5),
+        'key': (row.get('key') or '').strip(),
+        'bpm': as_int('bpm', 0),
+        'must_play': str(row.get('must_play', '')).lower() in ['true', 'yes', '1'],
+        'exclude_from_set': str(row.get('exclude_from_set', '')).lower() in ['true', 'yes', '1']
+    }
+    
+    if not song_data['title'] or not song_data['artist']:
+        raise ValueError("Missing title or artist")
+    
+    return song_data
+
+def _append_error(errors, message):
+    """Record an import error, keeping the list bounded for huge files"""
+    if len(errors) < IMPORT_MAX_ERRORS:
+        errors.append(message)
+
+def import_songs(profile_id, stream, batch_size, progress=None, fuzzy='flag'):
+    """
+    Import songs from a CSV byte stream, skipping songs the user already has
+    
+    Args:
+        profile_id: Profile that owns the songs
+        stream: Binary file-like object with the CSV data
+        batch_size: Songs per upsert
+        progress: Optional callback receiving rows_read, imported and duplicates after each batch
+        fuzzy: What to do with rows that look like a song already in the library or
+            earlier in the file: 'flag' imports and reports them, 'skip' leaves them
+            out, 'off' only skips exact (title, artist) duplicates
+    
+    Returns:
+        Summary dictionary returned by /api/import-csv
+    
+    Raises:
+        ValueError: If the file is not valid UTF-8 CSV
+        RuntimeError: If the existing songs could not be fetched
+    """
+    # Load the (title, artist) pairs the user already has so they can be skipped
+    library = load_song_library(profile_id)
+    if library is None:
+        raise RuntimeError('Failed to fetch existing songs')
+    
+    seen = {_song_key(song['title'], song['artist']) for song in library['songs']}
+    
+    # Near-duplicates are looked up in the library's index and in one for the rows imported so far
+    if fuzzy != 'off':
+        existing, _ = library_duplicates(profile_id, library, clusters=False)
+        in_file = DuplicateIndex(DUPLICATE_THRESHOLD)
+    likely_duplicates = 0
+    likely_rows = []
+    
+    started = time.perf_counter()
+    rows_read = 0
+    imported = 0
+    duplicates = 0
+    errors = []
+    batch_failures = []
+    batch = []
+    batch_number = 0
+    
+    def flush(batch, batch_number):
+        """Upsert one batch of songs, returning the number written"""
+        response = supabase.post(
+            "songs?on_conflict=user_id,title,artist",
+            json=batch,
+            prefer='resolution=ignore-duplicates,return=minimal'
+        )
+        if response.status_code in (200, 201):
+            return len(batch)
+        batch_failures.append({
+            'batch': batch_number,
+            'rows': len(batch),
+            'first_title': batch[0]['title'],
+            'error': response.text
+        })
+        return 0
+    
+    try:
+        # Wrap the upload stream so rows are decoded and parsed as they are read
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        csv_reader = csv.DictReader(text)
+        
+        for row in csv_reader:
+            rows_read += 1
+            try:
+                song_data = _parse_song_row(row, profile_id)
+            except ValueError as e:
+                _append_error(errors, f"Row {rows_read}: {str(e)}")
+                continue
+            
+            key = _song_key(song_data['title'], song_data['artist'])
+            if key in seen:
+                duplicates += 1
+                continue
+            seen.add(key)
+            
+            if fuzzy != 'off':
+                signature = song_signature(song_data['title'], song_data['artist'])
+                match = None
+                for index in (existing, in_file):
+                    matches = index.matches(signature=signature, limit=1)
+                    if matches:
+                        match = duplicate_match(index.songs[matches[0][0]], matches[0][1])
+                        break
+                if match:
+                    likely_duplicates += 1
+                    if len(likely_rows) < IMPORT_MAX_ERRORS:
+                        likely_rows.append({'row': rows_read, 'title': song_data['title'],
+                                            'artist': song_data['artist'], 'match': match})
+                    if fuzzy == 'skip':
+                        continue
+                # Only the title and artist are needed to report a match, not the whole row
+                if len(in_file) < IMPORT_FUZZY_MAX_ROWS:
+                    in_file.add({'title': song_data['title'], 'artist': song_data['artist']}, signature)
+            
+            batch.append(song_data)
+            if len(batch) >= batch_size:
+                batch_number += 1
+                imported += flush(batch, batch_number)
+                batch = []
+                if progress:
+                    progress(rows_read=rows_read, imported=imported, duplicates=duplicates)
+        
+        if batch:
+            batch_number += 1
+            imported += flush(batch, batch_number)
+    
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise ValueError(f"Error processing CSV: {str(e)}")
+    finally:
+        if imported:
+            invalidate_song_library(profile_id)
+    
+    elapsed = time.perf_counter() - started
+    return {
+        'success': True,
+        'message': f"Successfully imported {imported} songs",
+        'imported': imported,
+        'duplicates': duplicates,
+        'likely_duplicates': likely_duplicates,
+        'likely_duplicate_rows': likely_rows,
+        'rows_read': rows_read,
+        'batch_size': batch_size,
+        'batches': batch_number,
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'rows_per_sec': round(rows_read / elapsed, 1) if elapsed > 0 else rows_read,
+        'batch_failures': batch_failures,
+        'errors': errors
+    }
+
+def run_import_job(job, payload):
+    """Job handler: import a spooled CSV upload, reporting progress by bytes read"""
+    path = payload['path']
+    size = os.path.getsize(path) or 1
+    try:
+        with open(path, 'rb') as f:
+            def progress(**counts):
+                job.progress(fraction=round(min(f.tell() / size, 1.0), 3), **counts)
+            return import_songs(payload['profile_id'], f, payload['batch_size'], progress=progress,
+                                fuzzy=payload.get('fuzzy', 'flag'))
+    except (ValueError, RuntimeError) as e:
+        raise JobFailed(str(e))
+    finally:
+        os.remove(path)
+
+job_queue.register('import_csv', run_import_job)
+
 # CSV Import route - Upload a CSV file of songs
-@app.route('/api/import-csv', methods=['POST'])
+@bp.route('/api/import-csv', methods=['POST'])
 @require_auth
 def import_csv():
     user_id = session.get('user_id')
@@ -375,81 +1714,57 @@ def import_csv():
         return jsonify({'error': 'File must be a CSV'}), 400
     
     # Get user profile ID
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}'
-    }
-    
-    profile_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/profiles?firebase_uid=eq.{user_id}&select=id",
-        headers=headers
-    )
-    
-    if profile_response.status_code != 200 or not profile_response.json():
+    profile_id = resolve_profile_id(user_id)
+    if profile_id is None:
         return jsonify({'error': 'User profile not found'}), 404
     
-    profile_id = profile_response.json()[0]['id']
+    try:
+        batch_size = int(request.form.get('batch_size', IMPORT_BATCH_SIZE))
+    except ValueError:
+        return jsonify({'error': 'batch_size must be an integer'}), 400
+    batch_size = max(1, min(batch_size, IMPORT_MAX_BATCH_SIZE))
+    
+    fuzzy = request.values.get('fuzzy', 'flag')
+    if fuzzy not in IMPORT_FUZZY_MODES:
+        return jsonify({'error': f"fuzzy must be one of: {', '.join(IMPORT_FUZZY_MODES)}"}), 400
+    
+    # Large uploads (or ?async=1) are spooled to disk and imported by a background job
+    run_async = (request.values.get('async', '').lower() in ('1', 'true', 'yes')
+                 or (request.content_length or 0) > IMPORT_SYNC_MAX_BYTES)
+    if run_async:
+        job_queue.start()
+        job_id = uuid.uuid4().hex
+        path = os.path.join(JOBS_DIR, f"{job_id}.csv")
+        spooled = getattr(file.stream, 'name', None)
+        if isinstance(spooled, str) and os.path.dirname(spooled) == os.path.abspath(JOBS_DIR):
+            # Already on disk in JOBS_DIR (see UploadRequest): link it rather than copy it
+            file.stream.flush()
+            os.link(spooled, path)
+        else:
+            file.save(path)
+        try:
+            job = job_queue.submit('import_csv', {
+                'profile_id': profile_id,
+                'batch_size': batch_size,
+                'fuzzy': fuzzy,
+                'path': path
+            }, owner=user_id, job_id=job_id)
+        except QueueFull:
+            os.remove(path)
+            return queue_full_response()
+        return job_accepted_response(job)
     
     try:
-        # Read the CSV file
-        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_reader = csv.DictReader(stream)
-        
-        # Track imported songs
-        imported = 0
-        errors = []
-        
-        for row in csv_reader:
-            try:
-                # Extract data from CSV row
-                song_data = {
-                    'user_id': profile_id,
-                    'title': row.get('title', '').strip(),
-                    'artist': row.get('artist', '').strip(),
-                    'duration': int(row.get('duration', 0)) if row.get('duration') else 0,
-                    'energy': int(row.get('energy', 5)) if row.get('energy') else 5,
-                    'key': row.get('key', '').strip(),
-                    'bpm': int(row.get('bpm', 0)) if row.get('bpm') else 0,
-                    'must_play': str(row.get('must_play', '')).lower() in ['true', 'yes', '1'],
-                    'exclude_from_set': str(row.get('exclude_from_set', '')).lower() in ['true', 'yes', '1']
-                }
-                
-                # Validate required fields
-                if not song_data['title'] or not song_data['artist']:
-                    errors.append(f"Row missing title or artist: {row}")
-                    continue
-                
-                # Add song to database
-                song_response = requests.post(
-                    f"{SUPABASE_URL}/rest/v1/songs",
-                    headers={
-                        'apikey': SUPABASE_KEY,
-                        'Authorization': f'Bearer {SUPABASE_KEY}',
-                        'Content-Type': 'application/json',
-                        'Prefer': 'return=representation'
-                    },
-                    json=song_data
-                )
-                
-                if song_response.status_code == 201:
-                    imported += 1
-                else:
-                    errors.append(f"Failed to import {song_data['title']}: {song_response.text}")
-            
-            except Exception as e:
-                errors.append(f"Error processing row: {str(e)}")
-        
-        return jsonify({
-            'success': True,
-            'message': f"Successfully imported {imported} songs",
-            'errors': errors
-        })
-        
-    except Exception as e:
-        return jsonify({'error': f"Error processing CSV: {str(e)}"}), 500
+        summary = import_songs(profile_id, file.stream, batch_size, fuzzy=fuzzy)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify(summary)
 
 # CSV Template route - Download a template CSV file
-@app.route('/api/csv-template')
+@bp.route('/api/csv-template')
 @require_auth
 def download_csv_template():
     # Create a CSV template with headers and example rows
@@ -473,32 +1788,70 @@ def download_csv_template():
         }
     )
 
-# Export Setlist route - Download a setlist as CSV
-@app.route('/api/export-setlist/<int:setlist_id>')
+def setlist_songs_page_path(setlist_id, after=None, page_size=None):
+    """
+    PostgREST path for one page of a setlist's songs in set/position order
+    
+    Pages use keyset pagination on (set_number, position): ``after`` is the
+    last row of the previous page.
+    """
+    keyset = ''
+    if after is not None:
+        keyset = (f"&or=(set_number.gt.{after['set_number']},"
+                  f"and(set_number.eq.{after['set_number']},position.gt.{after['position']}))")
+    return (f"setlist_songs?setlist_id=eq.{setlist_id}{keyset}"
+            f"&select=position,set_number,songs(title,artist,duration,energy,key,bpm)"
+            f"&order=set_number.asc,position.asc&limit={page_size or EXPORT_PAGE_SIZE}")
+
+def iter_setlist_songs(setlist_id, first_page=None, page_size=None):
+    """
+    Yield a setlist's songs in set/position order, reading one page at a time
+    
+    Each request stays cheap however long the setlist is, and only one page is
+    held in memory.
+    """
+    page_size = page_size or EXPORT_PAGE_SIZE
+    page = first_page
+    after = None
+    while True:
+        if page is None:
+            response = supabase.get(setlist_songs_page_path(setlist_id, after, page_size))
+            if response.status_code != 200:
+                raise RuntimeError(f"Failed to fetch setlist songs: {response.text}")
+            page = response.json()
+        
+        yield from page
+        if len(page) < page_size:
+            return
+        after = page[-1]
+        page = None
+
+# Export Setlist route - Download a setlist as CSV, JSON, stage plot or plain text
+@bp.route('/api/export-setlist/<setlist_id>')
 @require_auth
 def export_setlist(setlist_id):
     user_id = session.get('user_id')
     
-    # Get user profile ID
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}'
-    }
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORTERS:
+        return jsonify({'error': f"format must be one of: {', '.join(EXPORTERS)}"}), 400
     
-    profile_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/profiles?firebase_uid=eq.{user_id}&select=id",
-        headers=headers
-    )
+    # The id is interpolated into PostgREST filters, so only accept a well-formed UUID
+    try:
+        setlist_id = str(uuid.UUID(setlist_id))
+    except ValueError:
+        return jsonify({'error': 'Setlist not found'}), 404
     
-    if profile_response.status_code != 200 or not profile_response.json():
+    # Get user profile ID
+    profile_id = resolve_profile_id(user_id)
+    if profile_id is None:
         return jsonify({'error': 'User profile not found'}), 404
     
-    profile_id = profile_response.json()[0]['id']
-    
-    # Get setlist details
-    setlist_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/setlists?id=eq.{setlist_id}&user_id=eq.{profile_id}",
-        headers=headers
+    # Get setlist details and the first page of songs at the same time; the
+    # songs are only used once the setlist is confirmed to belong to the user
+    setlist_response, first_page = supabase.gather(
+        ('GET', f"setlists?id=eq.{setlist_id}&user_id=eq.{profile_id}"),
+        ('GET', setlist_songs_page_path(setlist_id))
     )
     
     if setlist_response.status_code != 200 or not setlist_response.json():
@@ -506,48 +1859,121 @@ def export_setlist(setlist_id):
     
     setlist = setlist_response.json()[0]
     
-    # Get setlist songs with joined song data
-    songs_response = requests.get(
-        f"{SUPABASE_URL}/rest/v1/setlist_songs?setlist_id=eq.{setlist_id}&select=position,set_number,songs(title,artist,duration,energy,key,bpm)",
-        headers=headers
-    )
-    
-    if songs_response.status_code != 200:
+    # Check the first page before streaming so a failure can still return an error status
+    if first_page.status_code != 200:
         return jsonify({'error': 'Failed to fetch setlist songs'}), 500
+    items = iter_setlist_songs(setlist_id, first_page=first_page.json())
     
-    setlist_songs = songs_response.json()
-    
-    # Create CSV file
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write headers
-    writer.writerow(['Set', 'Position', 'Title', 'Artist', 'Duration (sec)', 'Energy', 'Key', 'BPM'])
-    
-    # Write song rows
-    for item in setlist_songs:
-        song = item.get('songs', {})
-        writer.writerow([
-            item.get('set_number', 1),
-            item.get('position', 0) + 1,  # Make positions 1-based for human readability
-            song.get('title', ''),
-            song.get('artist', ''),
-            song.get('duration', 0),
-            song.get('energy', 0),
-            song.get('key', ''),
-            song.get('bpm', 0)
-        ])
+    def stream():
+        """Encode rows as they are read, page by page"""
+        try:
+            yield from items
+        except (RuntimeError, requests.RequestException) as e:
+            # Headers are already sent; the truncated body is all we can signal
+            print(f"Export of setlist {setlist_id} stopped early: {e}")
     
-    # Prepare the response
-    output.seek(0)
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    body = EXPORTERS[export_format](setlist, stream())
     safe_name = ''.join(c if c.isalnum() else '_' for c in setlist.get('name', 'setlist'))
     return Response(
-        output.getvalue(),
-        mimetype="text/csv",
+        stream_with_context(chunk.encode('utf-8') for chunk in body),
+        mimetype=mimetype,
         headers={
-            "Content-Disposition": f"attachment; filename={safe_name}.csv"
+            "Content-Disposition": f"attachment; filename={safe_name}.{extension}"
         }
     )
 
+# Job status and progress for background imports and saves
+@bp.route('/api/jobs/<job_id>')
+@require_auth
+def get_job(job_id):
+    job = job_queue.get(job_id, owner=session.get('user_id'))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+# Page templates compiled during warm-up
+WARM_TEMPLATES = ('index.html', 'login.html', 'dashboard.html')
+
+_warm_lock = threading.Lock()
+_warm_results = None
+
+def warm_up():
+    """
+    Do the one-off work a cold instance would otherwise do on its first requests
+    
+    Initializes Firebase Admin and prefetches its signing keys, opens a pooled
+    Supabase connection, compiles the page templates and starts the job workers
+    (resuming jobs interrupted by a restart). Runs once; later calls
+    return the first run's results.
+    
+    Returns:
+        Dictionary mapping each step to 'ok' or the error it raised
+    """
+    global _warm_results
+    with _warm_lock:
+        if _warm_results is not None:
+            return _warm_results
+        
+        def firebase():
+            import firebase_admin
+            token_cache.ensure_setup()
+            if not firebase_admin._apps:
+                raise RuntimeError('Firebase Admin is not configured')
+        
+        def templates():
+            for name in WARM_TEMPLATES:
+                current_app.jinja_env.get_template(name)
+        
+        results = {}
+        steps = (('firebase', firebase), ('supabase', supabase.warm), ('templates', templates),
+                 ('jobs', job_queue.start))
+        for step, fn in steps:
+            started = time.perf_counter()
+            try:
+                fn()
+                results[step] = 'ok'
+            except Exception as e:
+                results[step] = f"error: {e}"
+            print(f"Warm-up {step}: {results[step]} ({(time.perf_counter() - started) * 1000:.0f}ms)")
+        _warm_results = results
+        return results
+
+# Startup probe: warms the instance before Cloud Run sends it traffic
+@bp.route('/startupz')
+def startupz():
+    return jsonify({'status': 'ok', 'warm_up': warm_up()})
+
+def create_app():
+    """
+    Build the Flask application
+    
+    Nothing here touches the network: Firebase Admin, the Supabase session and
+    the signing-key refresher start on first use, or during the startup probe
+    (/startupz). Set PREWARM_ON_START=1 to warm up in the background instead
+    when no startup probe is configured. The job queue does start here, so
+    jobs interrupted by a restart resume without waiting for a request.
+    """
+    app = Flask(__name__, template_folder=templates_dir, static_folder=static_dir)
+    app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev_secret_key")
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+    app.register_blueprint(bp)
+    
+    job_queue.start()
+    
+    # Request IDs, Server-Timing headers and latency histograms for every request
+    instrumentation.init_app(app)
+    
+    if os.environ.get("PREWARM_ON_START", "").lower() in ('1', 'true', 'yes'):
+        def prewarm():
+            with app.app_context():
+                warm_up()
+        threading.Thread(target=prewarm, name='prewarm', daemon=True).start()
+    
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 8080)), debug=False)
@@ -0,0 +1,138 @@
+"""
+Measure cold-start cost: import time and the latency of the first requests
+
+Each run starts a fresh interpreter, imports app.py and times its first page
+render and first authenticated API call against the in-memory fake PostgREST
+(with firebase_admin.auth.verify_id_token stubbed). Runs are repeated with
+and without a /startupz warm-up beforehand, which is what Cloud Run's
+startup probe does before sending traffic.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--runs 5] [--latency-ms 20] [--importtime 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_postgrest import start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the fresh interpreter; prints one JSON line of timings in milliseconds
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, ROOT)
+timings = {}
+
+import app as setlist_app
+timings['import'] = time.perf_counter() - started
+client = setlist_app.app.test_client()
+
+if WARM:
+    mark = time.perf_counter()
+    client.get('/startupz')
+    timings['warm_up'] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+client.get('/login')
+timings['first_page'] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+import firebase_admin.auth
+firebase_admin.auth.verify_id_token = lambda token, **kwargs: {'uid': token, 'exp': time.time() + 3600}
+client.post('/api/session/check', json={'idToken': 'cold-start-user'})
+response = client.get('/api/songs')
+assert response.status_code == 200, response.status_code
+timings['first_api'] = time.perf_counter() - mark
+
+mark = time.perf_counter()
+client.get('/api/songs')
+timings['second_api'] = time.perf_counter() - mark
+
+print(json.dumps({name: value * 1000 for name, value in timings.items()}))
+'''
+
+
+def run_child(warm, env):
+    started = time.perf_counter()
+    code = CHILD.replace('ROOT', repr(ROOT)).replace('WARM', repr(warm))
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=env)
+    wall = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings['process'] = wall
+    return timings
+
+
+def interpreter_baseline(runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def top_imports(count, env):
+    """Return the modules with the largest cumulative import time when importing app"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import sys; sys.path.insert(0, {ROOT!r}); import app"],
+        capture_output=True, text=True, env=env
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per mode')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Injected upstream latency')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='Also list the N slowest imports (python -X importtime)')
+    args = parser.parse_args()
+
+    store, server, supabase_url = start_server(latency=args.latency_ms / 1000)
+    env = dict(os.environ, SUPABASE_URL=supabase_url, SUPABASE_KEY='benchmark', PYTHONDONTWRITEBYTECODE='')
+    env.pop('PREWARM_ON_START', None)
+
+    # One throwaway run so every mode sees compiled bytecode, as a built image does
+    run_child(False, env)
+
+    baseline = interpreter_baseline(args.runs)
+    print(f"Interpreter startup (python -c pass): {baseline:.0f}ms, median of {args.runs}\n")
+
+    columns = ['process', 'import', 'warm_up', 'first_page', 'first_api', 'second_api']
+    print(f"{'mode':<12}" + ''.join(f"{column:>12}" for column in columns))
+    for mode, warm in (('cold', False), ('probe-warm', True)):
+        runs = [run_child(warm, env) for _ in range(args.runs)]
+        medians = {column: statistics.median(run[column] for run in runs)
+                   for column in columns if column in runs[0]}
+        print(f"{mode:<12}" + ''.join(
+            f"{medians[column]:>10.0f}ms" if column in medians else f"{'-':>12}" for column in columns
+        ))
+    print("\nMedians in milliseconds; first_api is session check + GET /api/songs on a fresh instance.")
+
+    if args.importtime:
+        print("\nSlowest imports (cumulative):")
+        for microseconds, name in top_imports(args.importtime, env):
+            print(f"{microseconds / 1000:>8.1f}ms  {name}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
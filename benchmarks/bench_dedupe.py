@@ -0,0 +1,105 @@
+"""
+Benchmark fuzzy duplicate detection against comparing every pair of songs
+
+Usage:
+    python benchmarks/bench_dedupe.py [--sizes 1000,5000,20000,50000] [--threshold 0.75]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from song_dedupe import find_clusters, similarity, song_signature
+
+WORDS = ['love', 'night', 'heart', 'fire', 'dream', 'road', 'home', 'rain', 'light', 'blue',
+         'girl', 'baby', 'time', 'down', 'run', 'wild', 'gold', 'sky', 'river', 'stone',
+         'summer', 'city', 'dance', 'ghost', 'highway', 'angel', 'shadow', 'thunder']
+
+
+def make_library(size, duplicate_rate, seed=0):
+    """
+    Build a library where ``duplicate_rate`` of the songs are variants of another song
+
+    Returns:
+        (songs, pairs): The songs, and the (original, variant) index pairs planted
+    """
+    rng = random.Random(seed)
+    artists = [f"Artist {i}" for i in range(max(5, size // 12))]
+    songs = []
+    pairs = []
+    while len(songs) < size:
+        if songs and rng.random() < duplicate_rate:
+            original = rng.randrange(len(songs))
+            title = songs[original]['title']
+            variant = rng.choice([
+                f"{title} (Live)",
+                f"{title} - Remastered",
+                title.replace("'", ''),
+                title.upper(),
+                title[:-1] + title[-1] * 2
+            ])
+            artist = songs[original]['artist']
+            if rng.random() < 0.3:
+                artist = f"The {artist}"
+            songs.append({'title': variant, 'artist': artist})
+            pairs.append((original, len(songs) - 1))
+            continue
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+        if rng.random() < 0.2:
+            title = title.replace(' ', "' ", 1)
+        songs.append({'title': title, 'artist': rng.choice(artists)})
+    return songs, pairs
+
+
+def pairwise(songs, threshold):
+    """The same matches found by comparing every pair of songs"""
+    signatures = [song_signature(song['title'], song['artist']) for song in songs]
+    matched = set()
+    for i, (artist, title, grams, numbers) in enumerate(signatures):
+        for j in range(i):
+            other = signatures[j]
+            if other[0] == artist and other[3] == numbers and (
+                    (title and other[1] == title) or similarity(grams, other[2]) >= threshold):
+                matched.add((j, i))
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,5000,20000,50000')
+    parser.add_argument('--threshold', type=float, default=0.75)
+    parser.add_argument('--duplicate-rate', type=float, default=0.05)
+    parser.add_argument('--pairwise-max', type=int, default=5000,
+                        help='Largest library to also run the pairwise comparison on')
+    args = parser.parse_args()
+
+    print(f"{'songs':>8} {'index ms':>9} {'pairwise ms':>12} {'clusters':>9} {'planted':>8} "
+          f"{'found':>6} {'same as pairwise':>17}")
+    for size in [int(size) for size in args.sizes.split(',')]:
+        songs, pairs = make_library(size, args.duplicate_rate, seed=size)
+        started = time.perf_counter()
+        _, clusters = find_clusters(songs, args.threshold)
+        indexed = time.perf_counter() - started
+
+        cluster_of = {}
+        for number, cluster in enumerate(clusters):
+            for position in cluster['positions']:
+                cluster_of[position] = number
+        found = sum(1 for a, b in pairs if a in cluster_of and cluster_of.get(a) == cluster_of.get(b))
+
+        compared = '-'
+        same = '-'
+        if size <= args.pairwise_max:
+            started = time.perf_counter()
+            matched = pairwise(songs, args.threshold)
+            compared = f"{(time.perf_counter() - started) * 1000:.0f}"
+            same = str(all(a in cluster_of and cluster_of[a] == cluster_of.get(b) for a, b in matched))
+        print(f"{size:>8} {indexed * 1000:>9.0f} {compared:>12} {len(clusters):>9} {len(pairs):>8} "
+              f"{found:>6} {same:>17}")
+
+
+if __name__ == '__main__':
+    main()
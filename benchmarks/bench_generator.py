@@ -0,0 +1,263 @@
+"""
+Benchmark the setlist generator against the original list-based implementation
+
+Usage:
+    python benchmarks/bench_generator.py [--sizes 100,1000,10000,50000] [--repeat 3]
+    python benchmarks/bench_generator.py --flow 50,200 [--flow-time 0.3]
+    python benchmarks/bench_generator.py --columns 1000,10000,50000
+    python benchmarks/bench_generator.py --tour 100 --sizes 300,1000,10000
+    python benchmarks/bench_generator.py --regenerate --num-sets 4 --sizes 1000,10000,50000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from setlist_flow import FlowCost, order_set
+from setlist_generator import SongColumns, generate_setlist, regenerate_setlist
+from setlist_tour import generate_tour
+
+
+def legacy_generate_setlist(songs, num_sets, set_duration, min_songs_between_artist=4):
+    """The original implementation, kept for comparison"""
+    setlist = []
+    used_songs = set()
+
+    def can_add_artist(artist, set_songs, min_spacing):
+        recent_artists = [song['artist'] for song in set_songs[-min_spacing:]]
+        return artist not in recent_artists
+
+    must_play_songs = [song for song in songs if song.get('must_play', False)]
+    optional_songs = [song for song in songs if not song.get('must_play', False)]
+
+    for set_num in range(num_sets):
+        current_set = []
+        current_duration = 0
+
+        for song in must_play_songs[:]:
+            if (song['title'] not in used_songs and
+                current_duration + song['duration'] <= set_duration and
+                (not current_set or can_add_artist(song['artist'], current_set, min_songs_between_artist))):
+                current_set.append(song)
+                current_duration += song['duration']
+                used_songs.add(song['title'])
+                must_play_songs.remove(song)
+
+        available_songs = [song for song in optional_songs
+                           if song['title'] not in used_songs]
+        random.shuffle(available_songs)
+
+        for song in available_songs:
+            if (current_duration + song['duration'] <= set_duration and
+                (not current_set or can_add_artist(song['artist'], current_set, min_songs_between_artist))):
+                current_set.append(song)
+                current_duration += song['duration']
+                used_songs.add(song['title'])
+
+        setlist.append({'songs': current_set, 'duration': current_duration})
+
+    extras = ([song for song in must_play_songs] +
+              [song for song in optional_songs if song['title'] not in used_songs])
+
+    return {'setlist': setlist, 'extras': extras}
+
+
+def make_library(size, seed=0):
+    """Build a synthetic library with unique titles and a realistic artist spread"""
+    rng = random.Random(seed)
+    artists = [f"Artist {i}" for i in range(max(5, size // 12))]
+    return [{
+        'id': str(i),
+        'title': f"Song {i}",
+        'artist': rng.choice(artists),
+        'duration': rng.randint(150, 420),
+        'energy': rng.randint(1, 10),
+        'bpm': rng.randint(70, 170),
+        'key': rng.choice(['C', 'G', 'D', 'A', 'E', 'F', 'Bb', 'Am', 'Em', 'Dm']),
+        'must_play': rng.random() < 0.02,
+        'exclude_from_set': False
+    } for i in range(size)]
+
+
+def check_setlist(result, songs, set_duration, spacing):
+    """Verify the hard constraints: set length, artist spacing and no repeats"""
+    seen = set()
+    for set_data in result['setlist']:
+        if sum(song['duration'] for song in set_data['songs']) > set_duration:
+            return False
+        for position, song in enumerate(set_data['songs']):
+            if song['id'] in seen:
+                return False
+            seen.add(song['id'])
+            recent = set_data['songs'][max(0, position - spacing):position]
+            if any(other['artist'] == song['artist'] for other in recent):
+                return False
+    return len(seen) + len(result['extras']) == len(songs)
+
+
+def fill_ratio(result, set_duration):
+    sets = result['setlist']
+    return sum(set_data['duration'] for set_data in sets) / (set_duration * len(sets))
+
+
+def best_of(fn, repeat):
+    best = None
+    for attempt in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_flow(set_sizes, time_limit):
+    """Time flow ordering on spacing-valid sets of the given sizes"""
+    print(f"{'set size':>8} {'elapsed ms':>11} {'start cost':>11} {'flow cost':>10} {'clashes':>8}")
+    for size in set_sizes:
+        songs = make_library(size * 4, seed=size)
+        for song in songs:
+            song['must_play'] = False
+        set_songs = generate_setlist(songs, 1, size * 285)['setlist'][0]['songs'][:size]
+        start = FlowCost(set_songs, 'arc', 4).total(list(range(len(set_songs))))
+
+        started = time.perf_counter()
+        ordered, cost = order_set(set_songs, 'arc', 4, time_limit, random.Random(size))
+        elapsed = time.perf_counter() - started
+        clashes = FlowCost(ordered, 'arc', 4).violations(list(range(len(ordered))))
+        print(f"{len(set_songs):>8} {elapsed * 1000:>11.1f} {start:>11.2f} {cost:>10.2f} {clashes:>8}")
+
+
+def peak_bytes(fn):
+    """Peak memory allocated while running fn"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_columns(sizes, num_sets, set_duration, repeat):
+    """Compare generating from song dicts with reusing a prebuilt SongColumns"""
+    print(f"{'songs':>8} {'build ms':>9} {'dicts ms':>9} {'columns ms':>11} "
+          f"{'dicts peak KiB':>15} {'columns peak KiB':>17}")
+    for size in sizes:
+        songs = make_library(size)
+        build = best_of(lambda: SongColumns(songs), repeat)
+        columns = SongColumns(songs)
+        from_dicts = best_of(lambda: generate_setlist(songs, num_sets, set_duration, seed=1), repeat)
+        from_columns = best_of(lambda: generate_setlist(columns, num_sets, set_duration, seed=1), repeat)
+        dicts_peak = peak_bytes(lambda: generate_setlist(songs, num_sets, set_duration, seed=1))
+        columns_peak = peak_bytes(lambda: generate_setlist(columns, num_sets, set_duration, seed=1))
+        print(f"{size:>8} {build * 1000:>9.2f} {from_dicts * 1000:>9.2f} {from_columns * 1000:>11.2f} "
+              f"{dicts_peak / 1024:>15.0f} {columns_peak / 1024:>17.0f}")
+
+
+def bench_tour(shows, sizes, num_sets, set_duration):
+    """Time a whole tour and count songs repeated on consecutive nights"""
+    print(f"{'songs':>8} {'shows':>6} {'elapsed ms':>11} {'distinct':>9} {'repeats':>8} "
+          f"{'relaxed':>8} {'rep openers':>12}")
+    for size in sizes:
+        songs = make_library(size)
+        # make_library marks 2% as must-play, which would fill every show of a large library
+        for song in songs[5:]:
+            song['must_play'] = False
+        tour = [{'num_sets': num_sets, 'set_duration': set_duration} for _ in range(shows)]
+        started = time.perf_counter()
+        result = generate_tour(songs, tour, 4, seed=1)
+        elapsed = time.perf_counter() - started
+
+        repeats = 0
+        previous = set()
+        for show in result['shows']:
+            played = {song['id'] for set_data in show['setlist'] for song in set_data['songs']
+                      if not song['must_play']}
+            repeats += len(played & previous)
+            previous = played
+        stats = result['stats']
+        print(f"{size:>8} {shows:>6} {elapsed * 1000:>11.1f} {stats['distinct_songs']:>9} {repeats:>8} "
+              f"{stats['rests_relaxed']:>8} {stats['repeated_openers']:>12}")
+
+
+def bench_regenerate(sizes, num_sets, set_duration, repeat):
+    """Compare replacing one song of a generated show with generating the show again"""
+    print(f"{'songs':>8} {'full ms':>8} {'refill ms':>10} {'speedup':>8} {'sets kept':>10} {'valid':>6}")
+    for size in sizes:
+        songs = make_library(size)
+        for song in songs[5:]:
+            song['must_play'] = False
+        columns = SongColumns(songs)
+        # Build the ID map up front, as a cached library's columns already have it
+        columns.index_of(None)
+        show = generate_setlist(columns, num_sets, set_duration, 4, seed=1)
+        setlist = [[song['id'] for song in set_data['songs']] for set_data in show['setlist']]
+        edited = setlist[num_sets // 2]
+        dropped = edited[len(edited) // 2]
+        pinned = [song_id for ids in setlist for song_id in ids if song_id != dropped]
+
+        full = best_of(lambda: generate_setlist(columns, num_sets, set_duration, 4, seed=1), repeat)
+        refill = best_of(lambda: regenerate_setlist(columns, setlist, set_duration, 4, pinned, seed=1), repeat)
+        result = regenerate_setlist(columns, setlist, set_duration, 4, pinned, seed=1)
+        kept = sum(before['songs'] == after['songs']
+                   for before, after in zip(show['setlist'], result['setlist']))
+        # The dropped song is neither played nor listed in extras
+        result['extras'].append(songs[int(dropped)])
+        valid = check_setlist(result, songs, set_duration, 4)
+        print(f"{size:>8} {full * 1000:>8.2f} {refill * 1000:>10.2f} {full / refill:>7.1f}x "
+              f"{kept:>6}/{num_sets:<3} {str(valid):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000,50000')
+    parser.add_argument('--num-sets', type=int, default=3)
+    parser.add_argument('--set-duration', type=int, default=45 * 60)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--flow', help='Comma-separated set sizes to benchmark flow ordering on instead')
+    parser.add_argument('--flow-time', type=float, default=0.3)
+    parser.add_argument('--columns', help='Comma-separated library sizes to compare dict and column input on')
+    parser.add_argument('--tour', type=int, metavar='SHOWS', help='Time generating a tour of this many shows')
+    parser.add_argument('--regenerate', action='store_true',
+                        help='Compare replacing one song with generating the whole show again')
+    args = parser.parse_args()
+
+    if args.regenerate:
+        bench_regenerate([int(size) for size in args.sizes.split(',')],
+                         args.num_sets, args.set_duration, args.repeat)
+        return
+
+    if args.tour:
+        bench_tour(args.tour, [int(size) for size in args.sizes.split(',')], args.num_sets, args.set_duration)
+        return
+
+    if args.flow:
+        bench_flow([int(size) for size in args.flow.split(',')], args.flow_time)
+        return
+
+    if args.columns:
+        bench_columns([int(size) for size in args.columns.split(',')],
+                      args.num_sets, args.set_duration, args.repeat)
+        return
+
+    print(f"{'songs':>8} {'legacy ms':>10} {'indexed ms':>11} {'speedup':>8} "
+          f"{'legacy fill':>12} {'indexed fill':>13} {'valid':>6}")
+    for size in [int(size) for size in args.sizes.split(',')]:
+        songs = make_library(size)
+
+        expected = legacy_generate_setlist(songs, args.num_sets, args.set_duration)
+        actual = generate_setlist(songs, args.num_sets, args.set_duration)
+        valid = check_setlist(actual, songs, args.set_duration, 4)
+
+        legacy = best_of(lambda: legacy_generate_setlist(songs, args.num_sets, args.set_duration), args.repeat)
+        indexed = best_of(lambda: generate_setlist(songs, args.num_sets, args.set_duration), args.repeat)
+        print(f"{size:>8} {legacy * 1000:>10.2f} {indexed * 1000:>11.2f} {legacy / indexed:>7.1f}x "
+              f"{fill_ratio(expected, args.set_duration):>12.3f} {fill_ratio(actual, args.set_duration):>13.3f} "
+              f"{str(valid):>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,504 @@
+"""
+In-memory stand-in for the Supabase PostgREST API, for offline benchmarks
+
+Implements the subset of PostgREST the app uses against tables matching
+schema.sql: column filters (eq, neq, gt, gte, lt, lte, like, ilike, in, is),
+or=(...)/and(...) groups, select with embedded resources, order, limit,
+offset, Prefer return=representation/minimal, count=exact and
+on_conflict upserts with ignore/merge-duplicates, plus the save_setlist
+function from schema.sql under /rpc/. Every response can be
+delayed by a fixed latency plus random jitter to mimic a remote project.
+
+Usage:
+    python benchmarks/fake_postgrest.py [--port 54321] [--latency-ms 20] [--jitter-ms 5]
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+# Column defaults and unique keys, mirroring schema.sql
+TABLES = {
+    'profiles': {
+        'defaults': {'username': None, 'email': None},
+        'unique': [('firebase_uid',)]
+    },
+    'songs': {
+        'defaults': {'energy': 5, 'key': None, 'bpm': 0, 'must_play': False, 'exclude_from_set': False},
+        'unique': [('user_id', 'title', 'artist')]
+    },
+    'setlists': {
+        'defaults': {'description': None},
+        'unique': []
+    },
+    'setlist_songs': {
+        'defaults': {},
+        'unique': []
+    }
+}
+
+# Foreign keys: (table, embedded table) -> (local column, remote column, to-many)
+RELATIONS = {
+    ('songs', 'profiles'): ('user_id', 'id', False),
+    ('setlists', 'profiles'): ('user_id', 'id', False),
+    ('setlist_songs', 'setlists'): ('setlist_id', 'id', False),
+    ('setlist_songs', 'songs'): ('song_id', 'id', False),
+    ('profiles', 'songs'): ('id', 'user_id', True),
+    ('profiles', 'setlists'): ('id', 'user_id', True),
+    ('setlists', 'setlist_songs'): ('id', 'setlist_id', True),
+    ('songs', 'setlist_songs'): ('id', 'song_id', True)
+}
+
+# ON DELETE CASCADE: table -> [(child table, child column, parent column)]
+CASCADES = {
+    'profiles': [('songs', 'user_id', 'id'), ('setlists', 'user_id', 'id')],
+    'songs': [('setlist_songs', 'song_id', 'id')],
+    'setlists': [('setlist_songs', 'setlist_id', 'id')]
+}
+
+RESERVED_PARAMS = {'select', 'order', 'limit', 'offset', 'on_conflict', 'or', 'and', 'columns'}
+
+
+class QueryError(ValueError):
+    """Malformed query, reported as a PostgREST-style 400"""
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _split_top_level(text):
+    """Split on commas that are not inside parentheses or double quotes"""
+    parts, depth, current = [], 0, []
+    quoted = escaped = False
+    for char in text:
+        current.append(char)
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = quoted
+        elif char == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == ',' and depth == 0:
+            current.pop()
+            parts.append(''.join(current))
+            current = []
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+    if current:
+        parts.append(''.join(current))
+    return [part for part in parts if part]
+
+
+def _unquote(value):
+    """Strip PostgREST double quotes and backslash escapes"""
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+
+def _coerce(value, sample):
+    """Convert a filter value to the type of the stored column value"""
+    if value == 'null':
+        return None
+    if isinstance(sample, bool):
+        return value.lower() == 'true'
+    if isinstance(sample, int):
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    if isinstance(sample, float):
+        return float(value)
+    return value
+
+
+def _like(pattern, value, flags=0):
+    regex = '^' + '.*'.join(re.escape(part) for part in pattern.replace('%', '*').split('*')) + '$'
+    return value is not None and re.match(regex, str(value), flags | re.DOTALL) is not None
+
+
+def _compare(row, column, op, value):
+    """Evaluate one column filter such as ('title', 'ilike', '*rock*') against a row"""
+    negate = op.startswith('not.')
+    if negate:
+        op = op[4:]
+    actual = row.get(column)
+
+    if op == 'is':
+        result = actual is None if value == 'null' else actual is _coerce(value, True)
+    elif op == 'in':
+        options = [_unquote(option) for option in _split_top_level(value[1:-1])]
+        result = any(actual == _coerce(option, actual) or str(actual) == option for option in options)
+    elif op in ('like', 'ilike'):
+        result = _like(value, actual, re.IGNORECASE if op == 'ilike' else 0)
+    else:
+        expected = _coerce(value, actual)
+        if actual is None or expected is None:
+            result = op == 'eq' and actual is expected
+        else:
+            try:
+                result = {
+                    'eq': lambda: actual == expected,
+                    'neq': lambda: actual != expected,
+                    'gt': lambda: actual > expected,
+                    'gte': lambda: actual >= expected,
+                    'lt': lambda: actual < expected,
+                    'lte': lambda: actual <= expected
+                }[op]()
+            except KeyError:
+                raise QueryError(f"Unsupported operator '{op}'")
+            except TypeError:
+                result = str(actual) == str(expected) if op == 'eq' else False
+    return not result if negate else result
+
+
+def _parse_condition(text, grouped=False):
+    """
+    Parse 'col.op.value', 'and(...)' or 'or(...)' into a predicate
+
+    Like PostgREST, double-quoted values are only unquoted inside and/or
+    groups (and in() lists); a top-level filter value is taken literally.
+    """
+    for group, combine in (('and(', all), ('or(', any)):
+        if text.startswith(group):
+            inner = [_parse_condition(part, grouped=True)
+                     for part in _split_top_level(text[len(group):-1])]
+            return lambda row, inner=inner, combine=combine: combine(p(row) for p in inner)
+    column, op, value = _split_filter(text, grouped)
+    return lambda row: _compare(row, column, op, value)
+
+
+def _split_filter(text, grouped=False):
+    column, _, rest = text.partition('.')
+    op, _, value = rest.partition('.')
+    if op == 'not':
+        inner_op, _, value = value.partition('.')
+        op = f"not.{inner_op}"
+    if not column or not op:
+        raise QueryError(f"Malformed filter '{text}'")
+    return column, op, _unquote(value) if grouped and not op.endswith('in') else value
+
+
+def _parse_select(text):
+    """
+    Parse 'id,name,songs(title,artist)' into ({alias: column}, {alias: (table, nested select)})
+
+    Aliases use PostgREST's 'alias:column' form; '::type' casts are ignored.
+    """
+    columns, embedded = {}, {}
+    for part in _split_top_level(text or '*'):
+        part = part.strip().split('::')[0]
+        if '(' in part:
+            name = part[:part.index('(')]
+            alias, _, target = name.partition(':')
+            embedded[alias] = (target or alias, _parse_select(part[part.index('(') + 1:-1]))
+        else:
+            alias, _, column = part.partition(':')
+            columns[alias] = column or alias
+    return columns, embedded
+
+
+class FakePostgrest:
+    """
+    Thread-safe in-memory tables with PostgREST query semantics
+
+    Args:
+        latency: Seconds added to every response
+        jitter: Extra random delay of up to this many seconds
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.tables = {name: [] for name in TABLES}
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self._rng.random() * self.jitter)
+
+    @staticmethod
+    def _filter(rows, params):
+        """Apply the column filters in ``params``, ignoring embedded-resource ones"""
+        filters = []
+        for key, value in params:
+            if key in ('or', 'and'):
+                filters.append(_parse_condition(f"{key}{value}"))
+            elif key not in RESERVED_PARAMS and '.' not in key:
+                filters.append(_parse_condition(f"{key}.{value}"))
+        return [row for row in rows if all(f(row) for f in filters)]
+
+    def _rows(self, table, params):
+        return self._filter(self.tables[table], params)
+
+    def _order(self, rows, order):
+        for term in reversed(_split_top_level(order)):
+            column, _, direction = term.partition('.')
+            descending = direction.startswith('desc')
+            present = [row for row in rows if row.get(column) is not None]
+            missing = [row for row in rows if row.get(column) is None]
+            present.sort(key=lambda row: row[column], reverse=descending)
+            rows = present + missing if not descending else missing + present
+        return rows
+
+    def _project(self, table, row, select, params, prefix=''):
+        columns, embedded = select
+        result = dict(row) if '*' in columns else {alias: row.get(column) for alias, column in columns.items()}
+        for alias, (target, nested) in embedded.items():
+            relation = RELATIONS.get((table, target))
+            if relation is None:
+                raise QueryError(f"Could not find a relationship between '{table}' and '{target}'")
+            local, remote, many = relation
+            related = [other for other in self.tables[target] if other.get(remote) == row.get(local)]
+            path = f"{prefix}{alias}."
+            nested_params = [(key[len(path):], value) for key, value in params if key.startswith(path)]
+            if nested_params:
+                related = self._filter(related, nested_params)
+                nested_query = dict(nested_params)
+                if nested_query.get('order'):
+                    related = self._order(related, nested_query['order'])
+                if 'limit' in nested_query:
+                    related = related[:int(nested_query['limit'])]
+            projected = [self._project(target, other, nested, params, path) for other in related]
+            result[alias] = projected if many else (projected[0] if projected else None)
+        return result
+
+    def select(self, table, params):
+        query = dict(params)
+        rows = self._rows(table, params)
+        total = len(rows)
+        if query.get('order'):
+            rows = self._order(rows, query['order'])
+        offset = int(query.get('offset', 0))
+        rows = rows[offset:]
+        if 'limit' in query:
+            rows = rows[:int(query['limit'])]
+        select = _parse_select(query.get('select'))
+        return [self._project(table, row, select, params) for row in rows], offset, total
+
+    def insert(self, table, records, on_conflict=None, resolution=None):
+        spec = TABLES[table]
+        conflict_key = tuple(on_conflict.split(',')) if on_conflict else None
+        created = []
+        for record in records:
+            row = dict(spec['defaults'])
+            row.update(record)
+            row.setdefault('id', str(uuid.uuid4()))
+            row.setdefault('created_at', _now())
+            if table != 'setlist_songs':
+                row.setdefault('updated_at', row['created_at'])
+
+            existing = None
+            for key in spec['unique'] + [('id',)]:
+                matches = [other for other in self.tables[table]
+                           if all(other.get(column) == row.get(column) for column in key)]
+                if matches:
+                    existing = (key, matches[0])
+                    break
+            if existing:
+                key, match = existing
+                if conflict_key is None or set(conflict_key) != set(key) or resolution is None:
+                    raise QueryError(f"duplicate key value violates unique constraint on {table}{key}")
+                if resolution == 'merge-duplicates':
+                    match.update({column: value for column, value in record.items() if column != 'id'})
+                    match['updated_at'] = _now()
+                    created.append(match)
+                continue
+            self.tables[table].append(row)
+            created.append(row)
+        return created
+
+    def update(self, table, params, changes):
+        rows = self._rows(table, params)
+        for row in rows:
+            row.update(changes)
+            if table != 'setlist_songs':
+                row['updated_at'] = _now()
+        return rows
+
+    def delete(self, table, params):
+        rows = self._rows(table, params)
+        self._remove(table, rows)
+        return rows
+
+    def _remove(self, table, rows):
+        """Delete rows and, like ON DELETE CASCADE, everything referencing them"""
+        removed = {id(row) for row in rows}
+        self.tables[table] = [row for row in self.tables[table] if id(row) not in removed]
+        for child, column, parent_column in CASCADES.get(table, []):
+            keys = {row[parent_column] for row in rows}
+            children = [row for row in self.tables[child] if row.get(column) in keys]
+            if children:
+                self._remove(child, children)
+
+    def save_setlist(self, args):
+        """The save_setlist Postgres function: header and songs in one transaction"""
+        setlist_id = args.get('p_setlist_id') or str(uuid.uuid4())
+        rows = args.get('p_songs') or []
+        song_ids = {song['id'] for song in self.tables['songs']}
+        missing = [row['song_id'] for row in rows if row.get('song_id') not in song_ids]
+        if missing:
+            raise QueryError(f"insert or update on table \"setlist_songs\" violates foreign key constraint "
+                             f"(song_id)=({missing[0]})")
+        header = next((row for row in self.tables['setlists'] if row['id'] == setlist_id), None)
+        if header is not None and header['user_id'] != args.get('p_user_id'):
+            raise QueryError(f"Setlist {setlist_id} belongs to another user")
+        if header is None:
+            self.insert('setlists', [{'id': setlist_id, 'user_id': args.get('p_user_id'),
+                                      'name': args.get('p_name'), 'description': args.get('p_description')}])
+        self.delete('setlist_songs', [('setlist_id', f"eq.{setlist_id}")])
+        self.insert('setlist_songs', [{'setlist_id': setlist_id, 'song_id': row['song_id'],
+                                       'position': row['position'], 'set_number': row['set_number']}
+                                      for row in rows])
+        return setlist_id
+
+    def handle(self, method, path, body, prefer):
+        """
+        Serve one request and return (status, body, headers)
+
+        Args:
+            method: HTTP method
+            path: Path below /rest/v1/, including query string
+            body: Decoded JSON request body or None
+            prefer: Value of the Prefer header
+        """
+        split = urlsplit(path)
+        table = unquote(split.path.strip('/'))
+        params = parse_qsl(split.query, keep_blank_values=True)
+        preferences = {part.strip() for part in (prefer or '').split(',') if part.strip()}
+        if table == 'rpc/save_setlist' and method == 'POST':
+            with self._lock:
+                self.requests += 1
+                try:
+                    return 200, self.save_setlist(body or {}), {}
+                except (QueryError, ValueError) as e:
+                    return 400, {'message': str(e)}, {}
+        if table not in TABLES:
+            return 404, {'message': f"relation \"{table}\" does not exist"}, {}
+
+        with self._lock:
+            self.requests += 1
+            try:
+                if method in ('GET', 'HEAD'):
+                    rows, offset, total = self.select(table, params)
+                    headers = {}
+                    if 'count=exact' in preferences:
+                        end = offset + len(rows) - 1
+                        headers['Content-Range'] = f"{offset}-{end}/{total}" if rows else f"*/{total}"
+                    return 200, rows, headers
+
+                if method == 'POST':
+                    records = body if isinstance(body, list) else [body]
+                    resolution = next((p.split('=', 1)[1] for p in preferences
+                                       if p.startswith('resolution=')), None)
+                    rows = self.insert(table, records, dict(params).get('on_conflict'), resolution)
+                    status, result = 201, None
+                elif method == 'PATCH':
+                    rows = self.update(table, params, body or {})
+                    status, result = 204, None
+                elif method == 'DELETE':
+                    rows = self.delete(table, params)
+                    status, result = 204, None
+                else:
+                    return 405, {'message': f"Unsupported method {method}"}, {}
+            except (QueryError, ValueError) as e:
+                return (409 if 'duplicate key' in str(e) else 400), {'message': str(e)}, {}
+
+            if 'return=representation' in preferences:
+                select = _parse_select(dict(params).get('select'))
+                result = [self._project(table, row, select, params) for row in rows]
+                status = 201 if method == 'POST' else 200
+            return status, result, {}
+
+
+def make_server(store, host='127.0.0.1', port=0):
+    """Create an HTTP server serving ``store`` under /rest/v1/ (port 0 picks a free port)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _serve(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            store.delay()
+
+            if not self.path.startswith('/rest/v1/'):
+                status, result, headers = 404, {'message': 'Not found'}, {}
+            else:
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    status, result, headers = 400, {'message': 'Invalid JSON body'}, {}
+                else:
+                    status, result, headers = store.handle(self.command, self.path[len('/rest/v1/'):],
+                                                           body, self.headers.get('Prefer'))
+
+            payload = json.dumps(result).encode('utf-8') if result is not None else b''
+            self.send_response(status)
+            if payload:
+                self.send_header('Content-Type', 'application/json')
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(payload)
+
+        do_GET = do_HEAD = do_POST = do_PATCH = do_DELETE = _serve
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(latency=0.0, jitter=0.0, host='127.0.0.1', port=0, seed=None):
+    """
+    Start a fake PostgREST server in a background thread
+
+    Returns:
+        (store, server, base_url) where base_url can be used as SUPABASE_URL
+    """
+    store = FakePostgrest(latency=latency, jitter=jitter, seed=seed)
+    server = make_server(store, host, port)
+    thread = threading.Thread(target=server.serve_forever, name='fake-postgrest', daemon=True)
+    thread.start()
+    return store, server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--jitter-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    store = FakePostgrest(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000)
+    server = make_server(store, args.host, args.port)
+    print(f"Fake PostgREST listening on http://{args.host}:{server.server_address[1]} "
+          f"({args.latency_ms}ms +{args.jitter_ms}ms jitter)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
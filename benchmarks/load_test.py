@@ -0,0 +1,326 @@
+"""
+Offline load test: drive the Flask app against a fake Supabase and Firebase
+
+Starts benchmarks/fake_postgrest.py in-process (with injected latency),
+stubs firebase_admin.auth.verify_id_token, serves app.py on a local port
+and replays a weighted mix of API traffic from concurrent virtual users.
+Reports p50/p99 latency, requests/sec and Supabase calls per request (read
+from the Server-Timing header) for each operation.
+
+The load generator shares the process with the server, so absolute numbers
+are pessimistic; compare runs against each other rather than production.
+
+Usage:
+    python benchmarks/load_test.py [--mix mixed] [--users 20] [--concurrency 20] [--duration 20]
+    python benchmarks/load_test.py --mix browse --latency-ms 40 --gevent
+    python benchmarks/load_test.py --mix list=50,generate=50 --json results.json --max-p99-ms 500
+"""
+import sys
+
+# Patch before anything imports socket/threading, as the gunicorn gevent worker does
+if '--gevent' in sys.argv:
+    from gevent import monkey
+    monkey.patch_all()
+
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_postgrest import start_server
+
+# Named traffic mixes: operation -> relative weight
+MIXES = {
+    'mixed': {'list': 40, 'setlists': 10, 'add': 15, 'import': 5, 'generate': 15, 'save': 5, 'export': 10},
+    'browse': {'list': 60, 'setlists': 20, 'export': 15, 'generate': 5},
+    'write': {'add': 35, 'delete': 10, 'import': 15, 'list': 25, 'save': 15},
+    'generate': {'generate': 60, 'save': 20, 'list': 20}
+}
+
+ARTISTS = [f"Artist {i}" for i in range(40)]
+KEYS = ['C', 'G', 'D', 'A', 'E', 'F', 'Bb', 'Am', 'Em', 'Dm']
+
+SUPABASE_CALLS = re.compile(r'supabase;dur=[\d.]+;desc="(\d+) calls?"')
+
+
+def parse_mix(text):
+    """Return a mix by name, or parse 'op=weight,op=weight'"""
+    if text in MIXES:
+        return MIXES[text]
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def make_song(rng, index):
+    return {
+        'title': f"Song {index} {rng.randrange(10 ** 6)}",
+        'artist': rng.choice(ARTISTS),
+        'duration': rng.randint(150, 420),
+        'energy': rng.randint(1, 10),
+        'key': rng.choice(KEYS),
+        'bpm': rng.randint(70, 170)
+    }
+
+
+def make_csv(rng, rows, start=0):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=['title', 'artist', 'duration', 'energy', 'key', 'bpm'])
+    writer.writeheader()
+    for index in range(start, start + rows):
+        writer.writerow(make_song(rng, index))
+    return buffer.getvalue().encode('utf-8')
+
+
+class VirtualUser:
+    """A signed-in browser session with its own library and saved setlists"""
+
+    def __init__(self, base_url, number, seed):
+        self.base_url = base_url
+        self.uid = f"bench-user-{number}"
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+        self.added = []
+        self.setlists = []
+        self.counter = 0
+
+    def call(self, method, path, **kwargs):
+        return self.http.request(method, f"{self.base_url}{path}", timeout=60, **kwargs)
+
+    def sign_in(self, library_size):
+        response = self.call('POST', '/api/session/check', json={'idToken': self.uid})
+        response.raise_for_status()
+        # The dashboard's first song listing creates the profile
+        self.op_list().raise_for_status()
+        if library_size:
+            self.call('POST', '/api/import-csv',
+                      files={'file': ('library.csv', make_csv(self.rng, library_size))}).raise_for_status()
+        self.op_save()
+
+    def op_list(self):
+        return self.call('GET', '/api/songs')
+
+    def op_setlists(self):
+        return self.call('GET', '/api/setlists')
+
+    def op_add(self):
+        self.counter += 1
+        response = self.call('POST', '/api/songs', json=make_song(self.rng, f"added-{self.counter}"))
+        if response.ok:
+            self.added.append(response.json()['id'])
+        return response
+
+    def op_delete(self):
+        if not self.added:
+            return self.op_add()
+        return self.call('DELETE', f"/api/songs/{self.added.pop()}")
+
+    def op_import(self):
+        self.counter += 1
+        rows = make_csv(self.rng, 50, start=self.counter * 1000)
+        return self.call('POST', '/api/import-csv', files={'file': ('import.csv', rows)})
+
+    def _generate(self, save):
+        return self.call('POST', '/api/generate-setlist', json={
+            'num_sets': 2,
+            'set_duration': 45 * 60,
+            'min_songs_between_artist': 3,
+            'save_setlist': save,
+            'setlist_name': f"Bench {self.counter}"
+        })
+
+    def op_generate(self):
+        return self._generate(False)
+
+    def op_save(self):
+        response = self._generate(True)
+        if response.ok and response.json().get('setlist_id'):
+            self.setlists.append(response.json()['setlist_id'])
+        return response
+
+    def op_export(self):
+        if not self.setlists:
+            return self.op_save()
+        setlist_id = self.rng.choice(self.setlists)
+        fmt = self.rng.choice(['csv', 'json', 'text'])
+        response = self.call('GET', f"/api/export-setlist/{setlist_id}?format={fmt}")
+        response.content
+        return response
+
+
+OPERATIONS = {name[3:]: getattr(VirtualUser, name) for name in dir(VirtualUser) if name.startswith('op_')}
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def start_app(port):
+    """Import app.py against the fake services and serve it on a local port"""
+    import firebase_admin.auth
+
+    firebase_admin.auth.verify_id_token = lambda token, **kwargs: {
+        'uid': token, 'email': f"{token}@example.com", 'exp': time.time() + 3600
+    }
+
+    import app as setlist_app
+
+    if '--gevent' in sys.argv:
+        from gevent.pywsgi import WSGIServer
+        server = WSGIServer(('127.0.0.1', port), setlist_app.app, log=None)
+        server.start()
+        return server.server_port
+    import logging
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, setlist_app.app, threaded=True)
+    server.socket.listen(1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.port
+
+
+def run(args):
+    store, fake_server, supabase_url = start_server(latency=args.latency_ms / 1000,
+                                                    jitter=args.jitter_ms / 1000, seed=args.seed)
+    os.environ['SUPABASE_URL'] = supabase_url
+    os.environ['SUPABASE_KEY'] = 'benchmark'
+    os.environ.setdefault('SUPABASE_POOL_SIZE', str(max(8, args.concurrency)))
+
+    port = start_app(args.port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    print(f"Seeding {args.users} users with {args.library_size} songs each...")
+    users = [VirtualUser(base_url, number, args.seed + number) for number in range(args.users)]
+    with ThreadPoolExecutor(max_workers=min(args.users, args.concurrency)) as pool:
+        list(pool.map(lambda user: user.sign_in(args.library_size), users))
+
+    mix = args.mix
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+    upstream_before = store.requests
+    deadline = time.perf_counter() + args.duration
+
+    def worker(number):
+        rng = random.Random(args.seed * 7919 + number)
+        while time.perf_counter() < deadline:
+            user = users[rng.randrange(len(users))]
+            name = rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = OPERATIONS[name](user)
+                ok = response.status_code < 400
+                match = SUPABASE_CALLS.search(response.headers.get('Server-Timing', ''))
+                calls = int(match.group(1)) if match else 0
+            except requests.RequestException:
+                ok, calls = False, 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[name].append((elapsed, ok, calls))
+
+    print(f"Running '{args.mix_name}' mix for {args.duration}s with {args.concurrency} concurrent clients "
+          f"({args.latency_ms}ms +{args.jitter_ms}ms upstream latency)...")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(worker, range(args.concurrency)))
+    wall = time.perf_counter() - started
+    fake_server.shutdown()
+
+    results = {'operations': {}, 'wall_seconds': round(wall, 2)}
+    all_latencies = []
+    total_requests = total_errors = total_calls = 0
+    for name in names:
+        rows = samples[name]
+        latencies = [row[0] for row in rows]
+        all_latencies.extend(latencies)
+        errors = sum(1 for row in rows if not row[1])
+        calls = sum(row[2] for row in rows)
+        total_requests += len(rows)
+        total_errors += errors
+        total_calls += calls
+        results['operations'][name] = {
+            'requests': len(rows),
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'rps': round(len(rows) / wall, 1),
+            'supabase_calls_per_request': round(calls / len(rows), 2) if rows else 0.0
+        }
+    results['total'] = {
+        'requests': total_requests,
+        'errors': total_errors,
+        'p50_ms': round(percentile(all_latencies, 0.5) * 1000, 1),
+        'p99_ms': round(percentile(all_latencies, 0.99) * 1000, 1),
+        'rps': round(total_requests / wall, 1),
+        'supabase_calls_per_request': round(total_calls / total_requests, 2) if total_requests else 0.0,
+        'upstream_requests': store.requests - upstream_before
+    }
+    return results
+
+
+def print_report(results):
+    print(f"\n{'operation':<10} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8} {'sb calls':>9}")
+    rows = list(results['operations'].items()) + [('TOTAL', results['total'])]
+    for name, row in rows:
+        print(f"{name:<10} {row['requests']:>9} {row['errors']:>7} {row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} "
+              f"{row['rps']:>8.1f} {row['supabase_calls_per_request']:>9.2f}")
+    print(f"\nUpstream requests served by the fake PostgREST: {results['total']['upstream_requests']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mix', default='mixed',
+                        help=f"Traffic mix: {', '.join(MIXES)} or op=weight,... (ops: {', '.join(OPERATIONS)})")
+    parser.add_argument('--users', type=int, default=20, help='Distinct signed-in users')
+    parser.add_argument('--library-size', type=int, default=300, help='Songs imported per user before the run')
+    parser.add_argument('--concurrency', type=int, default=20, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to generate load')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Injected upstream latency')
+    parser.add_argument('--jitter-ms', type=float, default=5, help='Extra random upstream latency')
+    parser.add_argument('--port', type=int, default=0, help='Port to serve the app on (0 picks a free one)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--gevent', action='store_true', help='Serve with gevent, like the production worker')
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--max-p99-ms', type=float, help='Exit non-zero if the overall p99 exceeds this')
+    args = parser.parse_args()
+
+    args.mix_name = args.mix
+    args.mix = parse_mix(args.mix)
+
+    results = run(args)
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_p99_ms is not None and results['total']['p99_ms'] > args.max_p99_ms:
+        print(f"\np99 {results['total']['p99_ms']}ms exceeds the {args.max_p99_ms}ms limit")
+        sys.exit(1)
+    if results['total']['errors']:
+        print(f"\n{results['total']['errors']} requests failed")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a fixed time
+
+    Args:
+        maxsize: Maximum number of entries kept before the least recently used is evicted
+        ttl: Seconds an entry stays valid after it is set (None for no expiry)
+        maxweight: Optional cap on the summed weight of all entries (e.g. bytes)
+        weigh: Function returning the weight of a value; required with maxweight
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, maxweight=None, weigh=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigh = weigh
+        self.weight = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires, _ = entry
+            if expires is not None and expires <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        weight = self.weigh(value) if self.weigh else 0
+        if self.maxweight is not None and weight > self.maxweight:
+            # Never cache a single value larger than the whole budget
+            self.pop(key)
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (value, expires, weight)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (
+                    self.maxweight is not None and self.weight > self.maxweight):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self.weight -= evicted
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+        return entry
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._remove(key)
+        return entry[0] if entry is not None else default
+
+    def pop_where(self, predicate):
+        """Remove every entry whose key satisfies ``predicate``; returns how many were removed"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        return {'size': len(self._data), 'weight': self.weight, 'hits': self.hits, 'misses': self.misses}
@@ -45,7 +45,9 @@ if "%FLASK_SECRET_KEY%"=="" (
     for /f "tokens=*" %%a in ('powershell -Command "[Convert]::ToBase64String([System.Text.Encoding]::UTF8.GetBytes([System.Guid]::NewGuid()))"') do set FLASK_SECRET_KEY=%%a
 )
 
-REM Deploy to Cloud Run with cost-optimized settings
+REM Deploy to Cloud Run with cost-optimized settings. Background job state lives in SQLite on
+REM the instance, so it is pinned to one instance and keeps CPU for jobs between requests.
+REM JOBS_DIR defaults to in-memory /tmp, so jobs only outlive the instance if it is on a mounted volume
 echo Deploying to Cloud Run...
 gcloud run deploy setlistgenie ^
   --image gcr.io/pauliecee-ba4e0/setlistgenie ^
@@ -54,7 +56,10 @@ gcloud run deploy setlistgenie ^
   --memory 256Mi ^
   --cpu 1 ^
   --min-instances 0 ^
-  --max-instances 2 ^
+  --max-instances 1 ^
+  --concurrency 250 ^
+  --cpu-boost ^
+  --no-cpu-throttling ^
   --set-env-vars "FLASK_SECRET_KEY=%FLASK_SECRET_KEY%" ^
   --set-env-vars "SUPABASE_URL=https://cqlldqgxghuvbtmlaiec.supabase.co" ^
   --set-env-vars "SUPABASE_KEY=%SUPABASE_KEY%"
@@ -43,7 +43,10 @@ fi
 echo "Building container image..."
 gcloud builds submit --tag gcr.io/pauliecee-ba4e0/setlistgenie
 
-# Deploy to Cloud Run with cost-optimized settings
+# Deploy to Cloud Run with cost-optimized settings. Background job state lives in SQLite on
+# the instance, so it is pinned to one instance (a poll routed to another would 404) and keeps
+# CPU between requests so import and save jobs run after their 202 response. JOBS_DIR defaults
+# to in-memory /tmp, so jobs only outlive the instance if JOBS_DIR is on a mounted volume
 echo "Deploying to Cloud Run..."
 gcloud run deploy setlistgenie \
   --image gcr.io/pauliecee-ba4e0/setlistgenie \
@@ -52,7 +55,10 @@ gcloud run deploy setlistgenie \
   --memory 256Mi \
   --cpu 1 \
   --min-instances 0 \
-  --max-instances 2 \
+  --max-instances 1 \
+  --concurrency 250 \
+  --cpu-boost \
+  --no-cpu-throttling \
   --set-env-vars "FLASK_SECRET_KEY=${FLASK_SECRET_KEY:-$(openssl rand -base64 32)}" \
   --set-env-vars "SUPABASE_URL=${SUPABASE_URL:-https://cqlldqgxghuvbtmlaiec.supabase.co}" \
   --set-env-vars "SUPABASE_KEY=${SUPABASE_KEY:-your_supabase_key_here}"
@@ -0,0 +1,173 @@
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Latency buckets in seconds, shared by every histogram
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets for the number of upstream calls made by one request
+CALL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# Longer client-supplied X-Request-ID values are truncated
+MAX_REQUEST_ID_LENGTH = 128
+
+# The trace of the request being handled, if any
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with one series per label set"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """Return the histogram in Prometheus text exposition format"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: (list(counts), total, count)
+                      for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)]
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = _labels(pairs + ['le="%s"' % bound])
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+            bucket_labels = _labels(pairs + ['le="+Inf"'])
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            label_text = _labels(pairs) if pairs else ''
+            lines.append(f"{self.name}_sum{label_text} {total:.6f}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    return '{' + ','.join(pairs) + '}'
+
+
+request_latency = Histogram(
+    'setlistgenie_request_duration_seconds',
+    'Time spent handling HTTP requests',
+    ('route', 'method', 'status')
+)
+upstream_latency = Histogram(
+    'setlistgenie_upstream_duration_seconds',
+    'Time spent in upstream calls and heavy operations',
+    ('upstream', 'operation')
+)
+upstream_calls_per_request = Histogram(
+    'setlistgenie_supabase_calls_per_request',
+    'Number of Supabase calls made while handling one request',
+    ('route',),
+    buckets=CALL_COUNT_BUCKETS
+)
+
+
+class RequestTrace:
+    """Timings of the upstream calls made while handling one request"""
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, upstream, operation, elapsed):
+        with self._lock:
+            self.spans.append((upstream, operation, elapsed))
+
+    def count(self, upstream):
+        return sum(1 for span in self.spans if span[0] == upstream)
+
+    def server_timing(self):
+        """Build a Server-Timing header summarising time per upstream"""
+        totals = {}
+        for upstream, operation, elapsed in self.spans:
+            calls, duration = totals.get(upstream, (0, 0.0))
+            totals[upstream] = (calls + 1, duration + elapsed)
+        parts = [f'{upstream};dur={duration * 1000:.1f};desc="{calls} call{"s" if calls != 1 else ""}"'
+                 for upstream, (calls, duration) in totals.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ', '.join(parts)
+
+
+def record(upstream, operation, elapsed):
+    """Record one upstream call in the histograms and the current request's trace"""
+    upstream_latency.observe(elapsed, upstream, operation)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(upstream, operation, elapsed)
+
+
+@contextmanager
+def traced(upstream, operation):
+    """Time a block of code as an upstream call, e.g. traced('firebase', 'verify_id_token')"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(upstream, operation, time.perf_counter() - started)
+
+
+def render_metrics(*extra_sections):
+    """
+    Render every histogram in Prometheus text exposition format
+
+    Args:
+        *extra_sections: Additional pre-rendered Prometheus text to append
+    """
+    sections = [request_latency.render(), upstream_latency.render(), upstream_calls_per_request.render()]
+    sections.extend(extra_sections)
+    return '\n'.join(sections) + '\n'
+
+
+def init_app(app):
+    """Attach request IDs, latency histograms and Server-Timing headers to a Flask app"""
+    from flask import g, request
+
+    @app.before_request
+    def start_trace():
+        trace = RequestTrace(request.headers.get('X-Request-ID', '')[:MAX_REQUEST_ID_LENGTH])
+        g.trace = trace
+        g.trace_token = current_trace.set(trace)
+
+    @app.after_request
+    def finish_trace(response):
+        trace = g.get('trace')
+        if trace is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_latency.observe(time.perf_counter() - trace.started, route, request.method,
+                                str(response.status_code))
+        upstream_calls_per_request.observe(trace.count('supabase'), route)
+        response.headers['X-Request-ID'] = trace.request_id
+        response.headers['Server-Timing'] = trace.server_timing()
+        return response
+
+    @app.teardown_request
+    def end_trace(exc):
+        token = g.pop('trace_token', None)
+        if token is not None:
+            current_trace.reset(token)
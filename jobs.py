@@ -0,0 +1,229 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id TEXT PRIMARY KEY,
+  kind TEXT NOT NULL,
+  owner TEXT,
+  status TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  progress TEXT,
+  result TEXT,
+  error TEXT,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  created_at REAL NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, updated_at);
+"""
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when too many jobs are already waiting"""
+
+
+class JobFailed(Exception):
+    """
+    Raised by a handler to fail its job with a message and structured details
+
+    Args:
+        message: Error shown as the job's 'error'
+        details: Optional JSON-serialisable value stored as the job's 'result'
+    """
+
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+class Job:
+    """Handle passed to job handlers for reporting progress"""
+
+    def __init__(self, jobs, job_id, attempt):
+        self.id = job_id
+        self.attempt = attempt
+        self._jobs = jobs
+
+    def progress(self, **progress):
+        """Record progress, e.g. job.progress(fraction=0.4, rows_read=2000)"""
+        self._jobs._update(self.id, progress=json.dumps(progress))
+
+
+class JobQueue:
+    """
+    Background jobs run by a fixed pool of worker threads, with state in SQLite
+
+    Jobs are persisted before they are queued, so after a restart anything
+    that was still queued or running is picked up again (handlers registered
+    with retry_on_restart=False are marked failed instead). Submissions are
+    refused with QueueFull once ``max_pending`` jobs are waiting.
+
+    Args:
+        path: SQLite database file
+        workers: Number of worker threads
+        max_pending: Maximum queued (not yet running) jobs
+        retention: Seconds finished jobs are kept before being pruned
+    """
+
+    def __init__(self, path, workers=2, max_pending=100, retention=86400):
+        self.path = path
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self._handlers = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._db = None
+        self._threads = []
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def register(self, kind, handler, retry_on_restart=True):
+        """
+        Register the function that runs jobs of a kind
+
+        Args:
+            kind: Job type name
+            handler: Callable(job, payload) returning a JSON-serialisable result
+            retry_on_restart: Re-run jobs interrupted by a restart (handler must be idempotent)
+        """
+        self._handlers[kind] = (handler, retry_on_restart)
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def start(self):
+        """Open the database, recover unfinished jobs and start the workers (idempotent)"""
+        with self._lock:
+            if self._db is not None:
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(SCHEMA)
+
+        self.prune()
+        for job_id, kind in self._execute(
+                "SELECT id, kind FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"):
+            _, retry = self._handlers.get(kind, (None, False))
+            if retry:
+                self._update(job_id, status='queued')
+                self._queue.put(job_id)
+            else:
+                self._update(job_id, status='failed', error='Interrupted by a restart')
+
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind, payload, owner=None, job_id=None):
+        """
+        Persist and queue a job
+
+        Returns:
+            The job as returned by get()
+
+        Raises:
+            QueueFull: If max_pending jobs are already waiting
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        self.start()
+        if self._queue.qsize() >= self.max_pending:
+            self.rejected += 1
+            raise QueueFull(f"{self._queue.qsize()} jobs already waiting")
+
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, owner, status, payload, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, owner, json.dumps(payload), now, now)
+        )
+        self._queue.put(job_id)
+        return self.get(job_id)
+
+    def get(self, job_id, owner=None):
+        """Return a job's status, progress and result, or None (also if owned by someone else)"""
+        self.start()
+        rows = self._execute(
+            "SELECT id, kind, owner, status, progress, result, error, attempts, created_at, updated_at "
+            "FROM jobs WHERE id = ?", (job_id,)
+        )
+        if not rows:
+            return None
+        job_id, kind, job_owner, status, progress, result, error, attempts, created_at, updated_at = rows[0]
+        if owner is not None and job_owner != owner:
+            return None
+        return {
+            'id': job_id,
+            'kind': kind,
+            'status': status,
+            'progress': json.loads(progress) if progress else None,
+            'result': json.loads(result) if result else None,
+            'error': error,
+            'attempts': attempts,
+            'queue_position': self._queue.qsize() if status == 'queued' else None,
+            'created_at': created_at,
+            'updated_at': updated_at
+        }
+
+    def prune(self):
+        """Delete finished jobs older than the retention period"""
+        self._execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                      (time.time() - self.retention,))
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            rows = self._execute("SELECT kind, payload, attempts FROM jobs WHERE id = ?", (job_id,))
+            if not rows:
+                continue
+            kind, payload, attempts = rows[0]
+            handler, _ = self._handlers[kind]
+            self._update(job_id, status='running', attempts=attempts + 1)
+            with self._lock:
+                self.running += 1
+            try:
+                result = handler(Job(self, job_id, attempts + 1), json.loads(payload))
+                self._update(job_id, status='succeeded', result=json.dumps(result))
+                self.completed += 1
+            except JobFailed as e:
+                self._update(job_id, status='failed', error=str(e), result=json.dumps(e.details))
+                self.failed += 1
+            except Exception as e:
+                print(f"Job {job_id} ({kind}) failed: {e}\n{traceback.format_exc()}")
+                self._update(job_id, status='failed', error=str(e))
+                self.failed += 1
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+    def stats(self):
+        """Return queue depth and job counters"""
+        return {
+            'workers': self.workers,
+            'pending': self._queue.qsize(),
+            'running': self.running,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,132 @@
+import base64
+import json
+from datetime import datetime
+from urllib.parse import quote, urlencode
+
+
+def encode_cursor(values):
+    """Encode the sort-key values of the last row on a page as an opaque cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Decode a cursor produced by encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed or has the wrong number of keys
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def quote_value(value):
+    """Double-quote a value for use inside PostgREST or=/and= conditions"""
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{text}"'
+
+
+def ilike_pattern(term, grouped=True):
+    """
+    Case-insensitive substring pattern; the caller's own wildcards are taken literally
+
+    PostgREST only strips double quotes inside or=/and= groups and in() lists,
+    so the pattern is quoted for those and left bare (grouped=False) for a
+    top-level column filter such as title=ilike.*term*.
+    """
+    term = ' '.join(term.replace('*', ' ').replace('%', ' ').split())
+    return quote_value(f"*{term}*") if grouped else f"*{term}*"
+
+
+def keyset_condition(order, values):
+    """
+    PostgREST condition selecting rows strictly after ``values`` in ``order``
+
+    For order [('title', 'asc'), ('id', 'asc')] and values ['B', 7] this is
+    or(title.gt."B",and(title.eq."B",id.gt."7")).
+
+    Args:
+        order: List of (column, 'asc' or 'desc') pairs ending in a unique column
+        values: Sort-key values of the last row already seen
+    """
+    branches = []
+    for index, (column, direction) in enumerate(order):
+        terms = [f"{order[i][0]}.eq.{quote_value(values[i])}" for i in range(index)]
+        terms.append(f"{column}.{'gt' if direction == 'asc' else 'lt'}.{quote_value(values[index])}")
+        branches.append(terms[0] if len(terms) == 1 else f"and({','.join(terms)})")
+    return f"or({','.join(branches)})"
+
+
+def parse_fields(text, allowed):
+    """
+    Parse a comma-separated ?fields= list, preserving order
+
+    Raises:
+        ValueError: If a field is not in ``allowed``
+    """
+    if not text:
+        return None
+    fields = []
+    for field in text.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        if field not in allowed:
+            raise ValueError(f"Unknown field '{field}' (choose from {', '.join(allowed)})")
+        if field not in fields:
+            fields.append(field)
+    return fields or None
+
+
+def parse_limit(text, default, maximum):
+    """Parse ?limit=, clamped to 1..maximum"""
+    if text is None or text == '':
+        return default
+    try:
+        limit = int(text)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+
+def parse_timestamp(text):
+    """
+    Validate an ISO 8601 timestamp such as 2024-05-01T12:00:00Z
+
+    Returns:
+        The timestamp normalised to isoformat() with an explicit UTC offset when none was given
+    """
+    try:
+        # An unencoded '+' in the offset arrives as a space
+        value = datetime.fromisoformat(text.strip().replace(' ', '+').replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError('updated_since must be an ISO 8601 timestamp')
+    if value.tzinfo is None:
+        return value.isoformat() + '+00:00'
+    return value.isoformat()
+
+
+def page_path(table, filters, select, order, limit):
+    """
+    Build a PostgREST path for one page
+
+    Args:
+        table: Table name
+        filters: List of (parameter, value) pairs such as ('user_id', 'eq.1')
+        select: List of columns to return
+        order: List of (column, direction) pairs
+        limit: Maximum rows to return
+    """
+    params = list(filters) + [
+        ('select', ','.join(select)),
+        ('order', ','.join(f"{column}.{direction}" for column, direction in order)),
+        ('limit', str(limit))
+    ]
+    return f"{table}?{urlencode(params, quote_via=quote, safe='(),.*:')}"
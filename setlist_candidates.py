@@ -0,0 +1,163 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from setlist_flow import KEY_WEIGHT, BPM_WEIGHT, song_features, transition_cost
+from setlist_generator import SongColumns, generate_setlist
+
+# How much each part of the score counts towards a candidate's total
+SCORE_WEIGHTS = {'fill': 0.5, 'spacing': 0.2, 'flow': 0.3}
+
+# Candidate counts at or above this are spread over the process pool. The pool is only
+# used outside gevent (python app.py, or gunicorn with sync/gthread workers); the deployed
+# image runs one gevent worker on one CPU, where candidates are always generated serially
+# on gevent's thread pool (see app.run_cpu_bound)
+PARALLEL_THRESHOLD = int(os.environ.get("CANDIDATE_PARALLEL_THRESHOLD", 16))
+CANDIDATE_WORKERS = int(os.environ.get("CANDIDATE_WORKERS", min(2, os.cpu_count() or 1)))
+
+_executor = None
+
+
+def _gevent_patched():
+    """True when running under gevent, where a process pool cannot be waited on safely"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _get_executor():
+    """Create the shared process pool on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=CANDIDATE_WORKERS)
+    return _executor
+
+
+def score_setlist(result, set_duration, min_songs_between_artist):
+    """
+    Score a generated setlist between 0 and 1 (higher is better)
+
+    Args:
+        result: Return value of generate_setlist
+        set_duration: Target duration of each set in seconds
+        min_songs_between_artist: Required artist spacing
+
+    Returns:
+        Dictionary with 'fill', 'spacing', 'flow' and the weighted 'total'
+    """
+    sets = result['setlist']
+    if not sets:
+        return {'fill': 0.0, 'spacing': 0.0, 'flow': 0.0, 'total': 0.0}
+
+    # Fill: share of the booked time actually covered
+    fill = sum(set_data['duration'] for set_data in sets) / (set_duration * len(sets))
+
+    # Spacing: how far apart repeated artists are, relative to twice the minimum
+    comfortable = 2 * (min_songs_between_artist + 1)
+    distances = []
+    for set_data in sets:
+        last_seen = {}
+        for position, song in enumerate(set_data['songs']):
+            artist = song['artist']
+            if artist in last_seen:
+                distances.append(min((position - last_seen[artist]) / comfortable, 1.0))
+            last_seen[artist] = position
+    spacing = sum(distances) / len(distances) if distances else 1.0
+
+    # Flow: how smooth key and BPM changes are between consecutive songs
+    worst = KEY_WEIGHT + BPM_WEIGHT
+    transitions = []
+    for set_data in sets:
+        features = song_features(set_data['songs'])
+        for first, second in zip(features, features[1:]):
+            transitions.append(transition_cost(first, second) / worst)
+    flow = 1.0 - sum(transitions) / len(transitions) if transitions else 1.0
+
+    total = (SCORE_WEIGHTS['fill'] * fill +
+             SCORE_WEIGHTS['spacing'] * spacing +
+             SCORE_WEIGHTS['flow'] * flow)
+    return {
+        'fill': round(fill, 4),
+        'spacing': round(spacing, 4),
+        'flow': round(flow, 4),
+        'total': round(total, 4)
+    }
+
+
+def _run_candidates(songs, seeds, num_sets, set_duration, min_songs_between_artist, options):
+    """Generate and score one candidate per seed (runs in a worker process)"""
+    columns = songs if isinstance(songs, SongColumns) else SongColumns(songs)
+    candidates = []
+    for seed in seeds:
+        result = generate_setlist(columns, num_sets, set_duration, min_songs_between_artist,
+                                  seed=seed, **options)
+        result['seed'] = seed
+        result['score'] = score_setlist(result, set_duration, min_songs_between_artist)
+        candidates.append(result)
+    return candidates
+
+
+def generate_candidates(songs, num_sets, set_duration, min_songs_between_artist=4,
+                        candidates=8, top_k=3, seed=None, **options):
+    """
+    Generate several setlists and return the best scoring ones
+
+    Each candidate is generated with its own seed derived from ``seed``, so
+    the same seed, library and parameters always produce the same candidates
+    (as long as any time-capped optimisation finishes within its budget).
+    Outside gevent, large batches are spread across a shared process pool;
+    under gevent they always run serially in the calling thread.
+
+    Args:
+        songs: List of song dictionaries, or a SongColumns built from them
+        num_sets: Number of sets to generate
+        set_duration: Duration of each set in seconds
+        min_songs_between_artist: Minimum number of songs between songs by the same artist
+        candidates: Number of setlists to generate
+        top_k: Number of best setlists to return
+        seed: Optional base seed; a random one is chosen when omitted
+        **options: Extra generate_setlist arguments (mode, time_budget, flow, ...)
+
+    Returns:
+        List of up to top_k results, best first, each with 'seed' and 'score'
+    """
+    global _executor
+
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    base = random.Random(seed)
+    seeds = [base.randrange(2 ** 31) for _ in range(candidates)]
+
+    # Split the time budgets across candidates so the whole call keeps the caller's budget
+    options = dict(options)
+    for budget in ('time_budget', 'flow_time_limit'):
+        if budget in options:
+            options[budget] = options[budget] / candidates
+
+    results = None
+    if candidates >= PARALLEL_THRESHOLD and CANDIDATE_WORKERS > 1 and not _gevent_patched():
+        chunk = -(-candidates // CANDIDATE_WORKERS)
+        try:
+            options_parallel = dict(options)
+            for budget in ('time_budget', 'flow_time_limit'):
+                if budget in options_parallel:
+                    options_parallel[budget] *= CANDIDATE_WORKERS
+            futures = [
+                _get_executor().submit(_run_candidates, songs, seeds[start:start + chunk], num_sets,
+                                       set_duration, min_songs_between_artist, options_parallel)
+                for start in range(0, candidates, chunk)
+            ]
+            results = [result for future in futures for result in future.result()]
+        except (OSError, RuntimeError) as e:
+            print(f"Process pool unavailable, generating candidates serially: {e}")
+            _executor = None
+            results = None
+
+    if results is None:
+        results = _run_candidates(songs, seeds, num_sets, set_duration,
+                                  min_songs_between_artist, options)
+
+    results.sort(key=lambda result: (-result['score']['total'], result['seed']))
+    return results[:top_k]
@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+
+# Export formats: mimetype and file extension
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'json': ('application/json', 'json'),
+    'stage': ('text/plain', 'txt'),
+    'text': ('text/plain', 'txt')
+}
+
+CSV_HEADER = ['Set', 'Position', 'Title', 'Artist', 'Duration (sec)', 'Energy', 'Key', 'BPM']
+
+
+def format_duration(seconds):
+    """Format seconds as m:ss"""
+    seconds = int(seconds or 0)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def export_csv(setlist, items):
+    """Yield the setlist as CSV, one encoded row at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return value
+
+    writer.writerow(CSV_HEADER)
+    yield flush()
+
+    for item in items:
+        song = item.get('songs') or {}
+        writer.writerow([
+            item.get('set_number', 1),
+            item.get('position', 0) + 1,  # Make positions 1-based for human readability
+            song.get('title', ''),
+            song.get('artist', ''),
+            song.get('duration', 0),
+            song.get('energy', 0),
+            song.get('key', ''),
+            song.get('bpm', 0)
+        ])
+        yield flush()
+
+
+def export_json(setlist, items):
+    """Yield the setlist as a JSON document without building it in memory"""
+    header = {key: setlist.get(key) for key in ('id', 'name', 'description', 'created_at')}
+    yield '{"setlist": ' + json.dumps(header) + ', "songs": ['
+    first = True
+    for item in items:
+        song = item.get('songs') or {}
+        row = {
+            'set_number': item.get('set_number', 1),
+            'position': item.get('position', 0) + 1,
+            'title': song.get('title', ''),
+            'artist': song.get('artist', ''),
+            'duration': song.get('duration', 0),
+            'energy': song.get('energy'),
+            'key': song.get('key'),
+            'bpm': song.get('bpm')
+        }
+        yield ('' if first else ', ') + json.dumps(row)
+        first = False
+    yield ']}'
+
+
+def _by_set(items):
+    """Group a stream of items into (set_number, song) pairs, marking set changes"""
+    current = None
+    for item in items:
+        set_number = item.get('set_number', 1)
+        yield set_number, set_number != current, item.get('songs') or {}
+        current = set_number
+
+
+def export_text(setlist, items):
+    """Yield a plain-text setlist: sets with numbered titles, artists and lengths"""
+    yield f"{setlist.get('name', 'Setlist')}\n"
+    if setlist.get('description'):
+        yield f"{setlist['description']}\n"
+
+    number = 0
+    for set_number, new_set, song in _by_set(items):
+        if new_set:
+            number = 0
+            yield f"\nSet {set_number}\n"
+        number += 1
+        yield f"{number:>3}. {song.get('title', '')} - {song.get('artist', '')} ({format_duration(song.get('duration'))})\n"
+
+
+def export_stage(setlist, items):
+    """
+    Yield a printable stage plot: large uppercase titles with key and tempo,
+    and a running time per set, meant to be taped to the floor
+    """
+    yield f"{setlist.get('name', 'Setlist').upper()}\n"
+
+    number = 0
+    elapsed = 0
+    for set_number, new_set, song in _by_set(items):
+        if new_set:
+            if number:
+                yield f"{'-' * 40}\nSET TIME {format_duration(elapsed)}\n"
+            number = 0
+            elapsed = 0
+            yield f"\n{'=' * 40}\nSET {set_number}\n{'=' * 40}\n"
+        number += 1
+        elapsed += song.get('duration') or 0
+        details = '  '.join(part for part in (
+            song.get('key') or '',
+            f"{song['bpm']} BPM" if song.get('bpm') else ''
+        ) if part)
+        yield f"{number:>2}  {song.get('title', '').upper()}\n"
+        if details:
+            yield f"    {details}\n"
+
+    if number:
+        yield f"{'-' * 40}\nSET TIME {format_duration(elapsed)}\n"
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'json': export_json,
+    'stage': export_stage,
+    'text': export_text
+}
@@ -0,0 +1,255 @@
+import math
+import random
+import time
+
+
+def _arc(t):
+    """Build to a peak three quarters of the way through, then ease off"""
+    if t <= 0.75:
+        return 0.4 + 0.6 * math.sin(math.pi * t / 1.5)
+    return 1.0 - 0.8 * (t - 0.75)
+
+
+def _wave(t):
+    """Two peaks, so the set breathes in the middle"""
+    return 0.55 - 0.35 * math.cos(4 * math.pi * t)
+
+
+# Target energy curves over the course of a set, mapping position (0..1) to 0..1
+ENERGY_CURVES = {
+    'rise': lambda t: 0.3 + 0.7 * t,
+    'arc': _arc,
+    'wave': _wave,
+    'steady': lambda t: 0.6
+}
+
+NOTE_NAMES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+
+# Relative weights of each part of the flow cost
+ENERGY_WEIGHT = 1.0
+KEY_WEIGHT = 0.6
+BPM_WEIGHT = 0.8
+SPACING_PENALTY = 100.0
+
+# Simulated annealing temperature schedule
+START_TEMPERATURE = 0.5
+END_TEMPERATURE = 0.001
+MAX_ITERATIONS_PER_SONG = 2000
+
+
+def parse_key(key):
+    """
+    Convert a key name such as "C Major", "A Minor", "F#m" or "Bb" to a
+    position on the circle of fifths (0-11), or None if it is unknown
+
+    Relative majors and minors share a position, so "A Minor" and
+    "C Major" are treated as fully compatible.
+    """
+    if not key:
+        return None
+    text = key.strip()
+    if not text or text[0].upper() not in NOTE_NAMES:
+        return None
+
+    pitch = NOTE_NAMES[text[0].upper()]
+    rest = text[1:].strip()
+    if rest[:1] in ('#', '♯'):
+        pitch += 1
+        rest = rest[1:]
+    elif rest[:1] in ('b', '♭'):
+        pitch -= 1
+        rest = rest[1:]
+    rest = rest.strip().lower()
+
+    minor = rest.startswith('min') or rest == 'm' or rest.startswith('m ')
+    if minor:
+        pitch += 3
+    return (pitch * 7) % 12
+
+
+def song_features(songs):
+    """Extract (energy, circle-of-fifths key, bpm) per song; unknown values are None"""
+    features = []
+    for song in songs:
+        energy = song.get('energy')
+        bpm = song.get('bpm')
+        features.append((
+            energy if isinstance(energy, (int, float)) and energy > 0 else None,
+            parse_key(song.get('key')),
+            bpm if isinstance(bpm, (int, float)) and bpm > 0 else None
+        ))
+    return features
+
+
+def transition_cost(first, second):
+    """
+    Cost of playing the song with features ``second`` straight after ``first``
+
+    Key cost is the circle-of-fifths distance (0-6) scaled to 0..1; BPM cost
+    is the tempo jump capped at 40 BPM, also scaled to 0..1. Unknown keys or
+    tempos cost nothing.
+    """
+    cost = 0.0
+    if first[1] is not None and second[1] is not None:
+        steps = abs(first[1] - second[1])
+        cost += KEY_WEIGHT * min(steps, 12 - steps) / 6
+    if first[2] is not None and second[2] is not None:
+        cost += BPM_WEIGHT * min(abs(first[2] - second[2]), 40) / 40
+    return cost
+
+
+def transition_matrix(features):
+    """Precompute transition_cost for every ordered pair of songs"""
+    return [[transition_cost(first, second) for second in features] for first in features]
+
+
+class FlowCost:
+    """Incremental cost of an ordering: energy-curve fit, transitions and artist spacing"""
+
+    def __init__(self, songs, curve, spacing):
+        self.n = len(songs)
+        self.features = song_features(songs)
+        self.matrix = transition_matrix(self.features)
+        self.artists = [song['artist'] for song in songs]
+        self.spacing = max(0, spacing)
+        shape = ENERGY_CURVES[curve]
+        positions = max(1, self.n - 1)
+        self.targets = [1 + 9 * shape(p / positions) for p in range(self.n)]
+
+    def position(self, song, p):
+        energy = self.features[song][0]
+        if energy is None:
+            return 0.0
+        return ENERGY_WEIGHT * ((energy - self.targets[p]) / 9) ** 2
+
+    def edge(self, order, p):
+        """Cost of the transition into position p"""
+        if p <= 0 or p >= self.n:
+            return 0.0
+        return self.matrix[order[p - 1]][order[p]]
+
+    def clashes(self, order, p):
+        """Artist repeats between position p and the songs just before it"""
+        if not (0 <= p < self.n):
+            return 0
+        artist = self.artists[order[p]]
+        return sum(1 for q in range(max(0, p - self.spacing), p) if self.artists[order[q]] == artist)
+
+    def local(self, order, positions):
+        """Cost contribution of the given positions, counting each term once"""
+        touched = set()
+        for p in positions:
+            for q in range(p, min(self.n, p + self.spacing + 1)):
+                touched.add(q)
+            touched.add(p + 1)
+        cost = 0.0
+        for p in positions:
+            cost += self.position(order[p], p)
+        for q in touched:
+            if q < self.n:
+                cost += self.edge(order, q) + SPACING_PENALTY * self.clashes(order, q)
+        return cost
+
+    def total(self, order):
+        cost = 0.0
+        for p in range(self.n):
+            cost += self.position(order[p], p) + self.edge(order, p) + SPACING_PENALTY * self.clashes(order, p)
+        return cost
+
+    def violations(self, order):
+        return sum(self.clashes(order, p) for p in range(self.n))
+
+
+def order_set(songs, curve='arc', spacing=4, time_limit=0.2, rng=None):
+    """
+    Reorder a set to follow an energy curve with smooth key and BPM changes
+
+    Starts from the ordering that best matches energies to the curve, then
+    improves it with simulated annealing over swap and 2-opt (segment
+    reversal) moves until ``time_limit`` seconds have passed. Artist spacing
+    is a heavy penalty; if the result still breaks it, the original order is
+    kept.
+
+    Args:
+        songs: Song dictionaries in their current order
+        curve: Name of an entry in ENERGY_CURVES
+        spacing: Minimum songs between two songs by the same artist
+        time_limit: Seconds the optimiser may run
+        rng: Optional random.Random for reproducible results
+
+    Returns:
+        Tuple of (reordered songs, flow cost of that order)
+    """
+    if curve not in ENERGY_CURVES:
+        raise ValueError(f"Unknown energy curve '{curve}'")
+    rng = rng or random
+    n = len(songs)
+    cost = FlowCost(songs, curve, spacing)
+    original = list(range(n))
+    if n < 3:
+        return list(songs), cost.total(original)
+
+    deadline = time.perf_counter() + time_limit
+
+    # Rank-match energies to the curve: lowest energy to the lowest target
+    by_energy = sorted(original, key=lambda i: (cost.features[i][0] or 5, rng.random()))
+    by_target = sorted(range(n), key=lambda p: cost.targets[p])
+    order = [0] * n
+    for song, p in zip(by_energy, by_target):
+        order[p] = song
+
+    current = cost.total(order)
+    best, best_cost = order[:], current
+    started = time.perf_counter()
+    temperature = START_TEMPERATURE
+    iteration = 0
+
+    # Small sets converge long before the time limit
+    max_iterations = MAX_ITERATIONS_PER_SONG * n
+
+    while iteration < max_iterations:
+        iteration += 1
+        if iteration & 63 == 0:
+            now = time.perf_counter()
+            if now > deadline:
+                break
+            # Geometric cooling driven by the fraction of the time budget used
+            progress = (now - started) / max(deadline - started, 1e-9)
+            temperature = START_TEMPERATURE * (END_TEMPERATURE / START_TEMPERATURE) ** progress
+
+        a = rng.randrange(n)
+        b = rng.randrange(n)
+        if a == b:
+            continue
+        if a > b:
+            a, b = b, a
+
+        if rng.random() < 0.5 or b - a > 24:
+            # Swap two songs
+            positions = (a, b)
+            before = cost.local(order, positions)
+            order[a], order[b] = order[b], order[a]
+            delta = cost.local(order, positions) - before
+            if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                current += delta
+            else:
+                order[a], order[b] = order[b], order[a]
+                continue
+        else:
+            # Reverse a short segment (2-opt)
+            positions = range(a, b + 1)
+            before = cost.local(order, positions)
+            order[a:b + 1] = order[a:b + 1][::-1]
+            delta = cost.local(order, positions) - before
+            if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                current += delta
+            else:
+                order[a:b + 1] = order[a:b + 1][::-1]
+                continue
+
+        if current < best_cost - 1e-9:
+            best, best_cost = order[:], current
+
+    if cost.violations(best) > cost.violations(original):
+        best, best_cost = original, cost.total(original)
+    return [songs[i] for i in best], best_cost
@@ -1,66 +1,539 @@
-def generate_setlist(songs, num_sets, set_duration, min_songs_between_artist=4):
+import random
+import time
+from array import array
+from collections import Counter, deque
+from itertools import compress, islice
+
+from setlist_flow import order_set
+
+# Set packing modes accepted by generate_setlist
+PACKING_MODES = ('greedy', 'optimal')
+
+# Random draws regenerate_setlist tries per open slot before scanning the library
+REFILL_PROBES = 32
+
+# Translation table turning a used-flag bytearray into an unused-flag one
+_UNUSED = bytes.maketrans(b'\x00\x01', b'\x01\x00')
+
+
+class ArtistWindow:
+    """
+    Ring buffer of the most recent artists in a set
+
+    Keeps a count per artist alongside the buffer so checking whether an
+    artist appeared in the last ``spacing`` songs is O(1) instead of a slice
+    and scan of the set.
+    """
+
+    def __init__(self, spacing):
+        self.spacing = max(0, spacing)
+        self.recent = deque()
+        self.counts = {}
+
+    def allows(self, artist):
+        return not self.counts.get(artist)
+
+    def push(self, artist):
+        if not self.spacing:
+            return
+        if len(self.recent) == self.spacing:
+            oldest = self.recent.popleft()
+            self.counts[oldest] -= 1
+        self.recent.append(artist)
+        self.counts[artist] = self.counts.get(artist, 0) + 1
+
+    def clear(self):
+        self.recent.clear()
+        self.counts.clear()
+
+    def copy(self):
+        window = ArtistWindow(self.spacing)
+        window.recent = deque(self.recent)
+        window.counts = dict(self.counts)
+        return window
+
+
+class DurationPool:
+    """
+    Unused song durations bucketed by length
+
+    Lets the generator stop scanning as soon as the time left in a set is
+    shorter than every song still available.
+    """
+
+    def __init__(self, durations):
+        self.counts = Counter(durations)
+        self.keys = sorted(self.counts)
+        self.low = 0
+
+    def remove(self, duration):
+        self.counts[duration] -= 1
+
+    def shortest(self):
+        """Return the shortest unused duration, or None if the pool is empty"""
+        while self.low < len(self.keys) and not self.counts[self.keys[self.low]]:
+            self.low += 1
+        return self.keys[self.low] if self.low < len(self.keys) else None
+
+
+def intern_artists(songs):
+    """Map each song's artist name to a small integer ID"""
+    ids = {}
+    return [ids.setdefault(song['artist'], len(ids)) for song in songs]
+
+
+class SongColumns:
+    """
+    Column-oriented copy of a song library for the generator
+
+    Durations, interned artist IDs and the indexes of must-play and optional
+    (non-excluded) songs are kept in typed ``array`` columns, so the packing
+    loops index flat machine-int columns instead of dicts, and the generator
+    only touches song dicts again when building its output. Build it once per
+    library and reuse it across generations and candidates.
+
+    Args:
+        songs: List of song dictionaries with artist, duration, must_play and exclude_from_set
+    """
+
+    def __init__(self, songs):
+        self.songs = songs
+        durations = [song['duration'] for song in songs]
+        try:
+            self.duration = array('i', durations)
+        except TypeError:
+            self.duration = array('i', (int(duration or 0) for duration in durations))
+        self.artist = array('i', intern_artists(songs))
+
+        # Indexes of playable songs, split by must-play, and the optional songs' durations
+        must_play = []
+        optional = []
+        self.not_optional = bytearray(b'\x01') * len(songs)
+        for i, song in enumerate(songs):
+            if song.get('exclude_from_set', False):
+                continue
+            if song.get('must_play', False):
+                must_play.append(i)
+            else:
+                optional.append(i)
+                self.not_optional[i] = 0
+        self.must_play_indexes = array('i', must_play)
+        self.optional_indexes = array('i', optional)
+        self.optional_durations = Counter(map(self.duration.__getitem__, optional))
+        self._ids = None
+
+    def index_of(self, song_id):
+        """Index of the song with the given ID, or None (the ID map is built on first use)"""
+        if self._ids is None:
+            self._ids = {str(song.get('id')): i for i, song in enumerate(self.songs)}
+        return self._ids.get(str(song_id))
+
+    def __len__(self):
+        return len(self.songs)
+
+    def playable(self):
+        """Number of songs not excluded from sets"""
+        return len(self.must_play_indexes) + len(self.optional_indexes)
+
+
+def _choose_songs(counts, buckets, artists):
+    """Pick the requested number of songs per duration, spreading artists out"""
+    chosen = []
+    per_artist = Counter()
+    for duration, count in counts.items():
+        bucket = buckets[duration]
+        taken = set()
+        for _ in range(count):
+            # Prefer the least-used artist among the first few shuffled candidates
+            best = None
+            for position in range(len(bucket)):
+                if position in taken:
+                    continue
+                if best is None or per_artist[artists[bucket[position]]] < per_artist[artists[bucket[best]]]:
+                    best = position
+                    if not per_artist[artists[bucket[best]]]:
+                        break
+                if position > len(taken) + 16:
+                    break
+            taken.add(best)
+            chosen.append(bucket[best])
+            per_artist[artists[bucket[best]]] += 1
+    return chosen
+
+
+def _arrange(chosen, artists, window):
+    """
+    Order songs so no artist repeats within the spacing window
+
+    Always plays the allowed song whose artist has the most songs left,
+    which is the standard greedy for spaced scheduling. Returns None if the
+    greedy gets stuck.
+    """
+    window = window.copy()
+    remaining = Counter(artists[i] for i in chosen)
+    by_artist = {}
+    for i in chosen:
+        by_artist.setdefault(artists[i], []).append(i)
+
+    order = []
+    for _ in range(len(chosen)):
+        best = None
+        for artist, left in remaining.items():
+            if left and window.allows(artist) and (best is None or left > remaining[best]):
+                best = artist
+        if best is None:
+            return None
+        order.append(by_artist[best].pop())
+        remaining[best] -= 1
+        window.push(best)
+    return order
+
+
+def pack_set(candidates, durations, artists, capacity, window, deadline, rng=random):
+    """
+    Choose and order songs that fill ``capacity`` seconds as closely as possible
+
+    Runs a bounded subset-sum over duration buckets (songs of equal length
+    are interchangeable for the sum, and bucket counts are binary-split so
+    the DP stays small), then walks achievable totals from ``capacity``
+    downward until a selection can be ordered without breaking artist
+    spacing.
+
+    Args:
+        candidates: Indexes of songs that may be used
+        durations: Song durations by index
+        artists: Interned artist IDs by index
+        capacity: Seconds left in the set
+        window: ArtistWindow state after the songs already in the set
+        deadline: time.perf_counter() value after which to give up
+        rng: Random source used to break ties between equal-length songs
+
+    Returns:
+        Ordered list of song indexes, or None if nothing better was found in time
+    """
+    if capacity <= 0:
+        return None
+
+    buckets = {}
+    for i in candidates:
+        if 0 < durations[i] <= capacity:
+            buckets.setdefault(durations[i], []).append(i)
+    if not buckets:
+        return None
+    for bucket in buckets.values():
+        rng.shuffle(bucket)
+
+    # No subset can exceed every candidate played once, so the bitset never needs to be wider
+    capacity = min(capacity, sum(duration * len(bucket) for duration, bucket in buckets.items()))
+
+    items = []
+    for duration, bucket in buckets.items():
+        left = len(bucket)
+        size = 1
+        while left > 0:
+            take = min(size, left)
+            items.append((duration, take))
+            left -= take
+            size *= 2
+
+    # reach has bit t set when a total of t seconds is achievable
+    mask = (1 << (capacity + 1)) - 1
+    reach = 1
+    before = []
+    for position, (duration, take) in enumerate(items):
+        if not position % 64 and time.perf_counter() > deadline:
+            return None
+        before.append(reach)
+        reach = (reach | (reach << (duration * take))) & mask
+
+    # Jump straight to the next achievable total below the last one tried
+    while True:
+        target = reach.bit_length() - 1
+        if target <= 0:
+            return None
+        counts = Counter()
+        total = target
+        for position in range(len(items) - 1, -1, -1):
+            if not (before[position] >> total) & 1:
+                duration, take = items[position]
+                counts[duration] += take
+                total -= duration * take
+        order = _arrange(_choose_songs(counts, buckets, artists), artists, window)
+        if order is not None:
+            return order
+        if time.perf_counter() > deadline:
+            return None
+        reach &= (1 << target) - 1
+
+
+def generate_setlist(songs, num_sets, set_duration, min_songs_between_artist=4,
+                     mode='greedy', time_budget=0.5, flow=None, flow_time_limit=0.3, seed=None,
+                     allowed=None):
     """
     Generate a setlist with the given constraints
-    
+
     Args:
-        songs: List of song dictionaries with title, artist, duration, must_play, and exclude_from_set
+        songs: List of song dictionaries with title, artist, duration, must_play, and
+            exclude_from_set, or a SongColumns built from them; excluded songs are skipped
         num_sets: Number of sets to generate
         set_duration: Duration of each set in seconds
         min_songs_between_artist: Minimum number of songs between songs by the same artist
-    
+        mode: 'greedy' for a single randomized first-fit pass, or 'optimal' to
+            fill each set as close to set_duration as possible
+        time_budget: Seconds of CPU the 'optimal' mode may spend across all sets;
+            any set it cannot improve in time falls back to the greedy fill
+        flow: Optional energy curve name (see setlist_flow.ENERGY_CURVES); when
+            given, each set is reordered for energy, key and BPM flow
+        flow_time_limit: Seconds the flow ordering may spend across all sets
+        seed: Optional seed making the greedy and optimal packing reproducible
+        allowed: Optional bytearray indexed like songs; optional songs whose entry
+            is 0 are not used (and not listed in extras). Must-play songs are
+            always eligible
+
     Returns:
-        Dictionary containing the setlist and extras
+        Dictionary containing the setlist and extras. Each set reports its
+        packing gap (seconds short of set_duration).
     """
-    import random
-    
+    if mode not in PACKING_MODES:
+        raise ValueError(f"Unknown packing mode '{mode}'")
+    deadline = time.perf_counter() + time_budget
+    rng = random.Random(seed) if seed is not None else random
+
+    # Work on column indexes so songs are tracked by identity, not by title
+    columns = songs if isinstance(songs, SongColumns) else SongColumns(songs)
+    songs = columns.songs
+    durations = columns.duration
+    artists = columns.artist
+    used = bytearray(len(columns))
+
+    must_play = list(columns.must_play_indexes)
+    all_optional = columns.optional_indexes
+    optional_durations = columns.optional_durations
+    if allowed is not None:
+        all_optional = list(compress(all_optional, map(allowed.__getitem__, all_optional)))
+        optional_durations = map(durations.__getitem__, all_optional)
+
+    pool = DurationPool(optional_durations)
+    window = ArtistWindow(min_songs_between_artist)
     setlist = []
-    used_songs = set()
-    
-    def can_add_artist(artist, set_songs, min_spacing):
-        """Check if an artist can be added based on spacing requirements"""
-        recent_artists = [song['artist'] for song in set_songs[-min_spacing:]]
-        return artist not in recent_artists
-    
-    # Sort songs by must_play first
-    must_play_songs = [song for song in songs if song.get('must_play', False)]
-    optional_songs = [song for song in songs if not song.get('must_play', False)]
-    
+    available = list(all_optional)
+
     for set_num in range(num_sets):
+        window.clear()
         current_set = []
         current_duration = 0
-        
+
+        def add(i):
+            nonlocal current_duration
+            current_set.append(i)
+            current_duration += durations[i]
+            used[i] = 1
+            window.push(artists[i])
+
         # Try to add must-play songs first
-        for song in must_play_songs[:]:
-            if (song['title'] not in used_songs and 
-                current_duration + song['duration'] <= set_duration and
-                (not current_set or can_add_artist(song['artist'], current_set, min_songs_between_artist))):
-                current_set.append(song)
-                current_duration += song['duration']
-                used_songs.add(song['title'])
-                must_play_songs.remove(song)
-        
-        # Fill remaining time with optional songs
-        available_songs = [song for song in optional_songs 
-                         if song['title'] not in used_songs]
-        random.shuffle(available_songs)
-        
-        for song in available_songs:
-            if (current_duration + song['duration'] <= set_duration and
-                (not current_set or can_add_artist(song['artist'], current_set, min_songs_between_artist))):
-                current_set.append(song)
-                current_duration += song['duration']
-                used_songs.add(song['title'])
-        
-        setlist.append({
-            'songs': current_set,
-            'duration': current_duration
-        })
-    
+        still_pending = []
+        for i in must_play:
+            if (current_duration + durations[i] <= set_duration and
+                    window.allows(artists[i])):
+                add(i)
+            else:
+                still_pending.append(i)
+        must_play = still_pending
+
+        # In optimal mode, pack the remaining time with the best subset found
+        # within this set's share of the time budget
+        if mode == 'optimal':
+            share = (deadline - time.perf_counter()) / (num_sets - set_num)
+            order = pack_set(available, durations, artists, set_duration - current_duration,
+                             window, time.perf_counter() + max(0, share), rng)
+            if order is not None:
+                for i in order:
+                    add(i)
+                    pool.remove(durations[i])
+                available = [i for i in available if not used[i]]
+
+        # Fill remaining time with optional songs, visiting them in random
+        # order. The shuffle is done lazily (Fisher-Yates one draw at a time)
+        # so a set that fills early never pays to shuffle the whole library.
+        remaining = len(available)
+        visited = 0
+
+        for k in range(remaining):
+            shortest = pool.shortest()
+            if shortest is None or current_duration + shortest > set_duration:
+                break
+            j = rng.randrange(k, remaining)
+            available[k], available[j] = available[j], available[k]
+            i = available[k]
+            visited = k + 1
+            if (current_duration + durations[i] <= set_duration and
+                    window.allows(artists[i])):
+                add(i)
+                pool.remove(durations[i])
+
+        # Only the visited prefix can contain songs used by this set
+        available = [i for i in available[:visited] if not used[i]] + available[visited:]
+
+        # Map indexes back to song dicts only for the output
+        set_data = {
+            'songs': [songs[i] for i in current_set],
+            'duration': current_duration,
+            'gap': set_duration - current_duration
+        }
+        if flow:
+            set_data['songs'], set_data['flow_cost'] = order_set(
+                set_data['songs'], flow, min_songs_between_artist, flow_time_limit / num_sets, rng)
+        setlist.append(set_data)
+
     # Collect unused songs as extras
-    extras = ([song for song in must_play_songs] +
-             [song for song in optional_songs if song['title'] not in used_songs])
-    
+    extras = ([songs[i] for i in must_play] +
+              [songs[i] for i in compress(all_optional, (not used[i] for i in all_optional))])
+
     return {
         'setlist': setlist,
         'extras': extras
     }
+
+
+def regenerate_setlist(songs, setlist, set_duration, min_songs_between_artist=4, pinned=(),
+                       seed=None):
+    """
+    Refill the open slots of an existing setlist, keeping pinned songs in place
+
+    Sets whose songs are all pinned are returned unchanged. In the other sets
+    pinned songs keep their positions and every other slot (an unpinned song,
+    or one no longer in the library) is open: each open slot gets one new
+    song, and the set's last open slot takes as many as fit the time left.
+    The time left and the artist window come from the songs kept in place,
+    and new songs are found by random probing instead of a pass over the
+    library, so a small edit costs a fraction of a full generation. Songs
+    already in the setlist, including the ones being replaced, are not
+    reused; must-play songs missing from it are tried first.
+
+    Artist spacing is kept in the returned order: an open slot that stays
+    empty moves the songs behind it up, so new songs avoid the artists of
+    the next pinned songs wherever they land, and a pinned song pulled too
+    close to an earlier pinned song by the same artist moves to the extras.
+
+    Args:
+        songs: List of song dictionaries, or a SongColumns built from them
+        setlist: Existing sets, each a list of song IDs in order
+        set_duration: Duration of each set in seconds
+        min_songs_between_artist: Minimum number of songs between songs by the same artist
+        pinned: IDs of the songs to keep where they are
+        seed: Optional seed making the refill reproducible
+
+    Returns:
+        Dictionary containing the setlist and extras, as from generate_setlist,
+        plus 'regenerated' with the numbers (from 1) of the sets that were refilled
+    """
+    rng = random.Random(seed) if seed is not None else random
+    columns = songs if isinstance(songs, SongColumns) else SongColumns(songs)
+    songs = columns.songs
+    durations = columns.duration
+    artists = columns.artist
+    pinned = {str(song_id) for song_id in pinned}
+
+    # Only optional songs start out unused, so the extras are a single compress at the end
+    used = bytearray(columns.not_optional)
+
+    # Resolve IDs to indexes; every song in the setlist counts as used, pinned or not
+    sets = []
+    listed = set()
+    for set_ids in setlist:
+        entries = []
+        for song_id in set_ids:
+            i = columns.index_of(song_id)
+            if i is not None:
+                used[i] = 1
+                listed.add(i)
+            entries.append(i if i is not None and str(song_id) in pinned else None)
+        sets.append(entries)
+
+    must_play = [i for i in columns.must_play_indexes if i not in listed]
+    optional = columns.optional_indexes
+    shortest = min(columns.optional_durations, default=None)
+
+    def draw(remaining, fits):
+        """Take a fitting must-play song, else probe at random, then scan, the optional songs"""
+        for k, i in enumerate(must_play):
+            if durations[i] <= remaining and fits(i):
+                del must_play[k]
+                return i
+        if shortest is None or remaining < shortest:
+            return None
+        for _ in range(REFILL_PROBES):
+            i = optional[rng.randrange(len(optional))]
+            if not used[i] and durations[i] <= remaining and fits(i):
+                return i
+        start = rng.randrange(len(optional))
+        for i in optional[start:] + optional[:start]:
+            if not used[i] and durations[i] <= remaining and fits(i):
+                return i
+        return None
+
+    result = []
+    regenerated = []
+    dropped = []
+    for number, entries in enumerate(sets, 1):
+        remaining = set_duration - sum(durations[i] for i in entries if i is not None)
+        if None not in entries:
+            result.append({
+                'songs': [songs[i] for i in entries],
+                'duration': set_duration - remaining,
+                'gap': remaining
+            })
+            continue
+
+        regenerated.append(number)
+        open_slots = entries.count(None)
+        window = ArtistWindow(min_songs_between_artist)
+        pinned_at = {}
+        current_set = []
+        for k, entry in enumerate(entries):
+            if entry is not None:
+                artist = artists[entry]
+                # An open slot that stayed empty can pull two pinned songs by the same
+                # artist too close; the later one goes to the extras unless the
+                # setlist already had them that close
+                if not window.allows(artist) and k - pinned_at.get(artist, k) > min_songs_between_artist:
+                    remaining += durations[entry]
+                    dropped.append(entry)
+                    continue
+                pinned_at[artist] = k
+                current_set.append(entry)
+                window.push(artist)
+                continue
+
+            # Open slots after this one may stay empty and pull the pinned songs behind
+            # them closer, so keep clear of the next pinned songs wherever they land
+            following = (i for i in entries[k + 1:] if i is not None)
+            ahead = {artists[i] for i in islice(following, min_songs_between_artist)}
+            open_slots -= 1
+            # Leave every later open slot time for at least the shortest song
+            reserve = (shortest or 0) * open_slots
+            while True:
+                i = draw(remaining - reserve, lambda i: window.allows(artists[i]) and artists[i] not in ahead)
+                if i is None:
+                    break
+                used[i] = 1
+                current_set.append(i)
+                window.push(artists[i])
+                remaining -= durations[i]
+                if open_slots:
+                    break
+
+        result.append({
+            'songs': [songs[i] for i in current_set],
+            'duration': set_duration - remaining,
+            'gap': remaining
+        })
+
+    # Collect unused songs as extras, flipping the used flags in one pass
+    extras = [songs[i] for i in must_play + dropped] + list(compress(songs, used.translate(_UNUSED)))
+
+    return {
+        'setlist': result,
+        'extras': extras,
+        'regenerated': regenerated
+    }
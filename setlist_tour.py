@@ -0,0 +1,255 @@
+import random
+import time
+from array import array
+from collections import deque
+
+from setlist_flow import FlowCost
+from setlist_generator import SongColumns, generate_setlist
+
+# Unrested music kept available per show, relative to the show's length, so rests
+# don't leave the packer too few songs to fill sets well
+REST_SLACK = 1.5
+
+
+class RestQueue:
+    """
+    Songs resting for a number of shows after being used
+
+    Keeps an allowed flag per song and a queue of (show, index) in the order
+    songs were rested, so starting a show only touches the songs whose rest
+    has just ended instead of re-scanning the tour so far.
+
+    Args:
+        size: Number of songs in the library
+        rest: Shows a song sits out after being used (0 disables resting)
+    """
+
+    def __init__(self, size, rest):
+        self.rest = max(0, rest)
+        self.allowed = bytearray(b'\x01') * size
+        self.rested_at = array('i', [-1]) * size
+        self.queue = deque()
+
+    def mark(self, i, show):
+        """Rest song ``i`` after it was used in ``show``"""
+        if not self.rest:
+            return
+        self.allowed[i] = 0
+        self.rested_at[i] = show
+        self.queue.append((show, i))
+
+    def _pop(self):
+        """Remove the oldest rest, returning the song index it frees or None if it was stale"""
+        show, i = self.queue.popleft()
+        if self.rested_at[i] != show:
+            return None
+        self.allowed[i] = 1
+        return i
+
+    def release(self, show):
+        """Allow again every song whose rest is over by ``show``, returning their indexes"""
+        released = []
+        while self.queue and self.queue[0][0] + self.rest < show:
+            i = self._pop()
+            if i is not None:
+                released.append(i)
+        return released
+
+    def release_oldest(self):
+        """End the longest-running rest early, returning the song index or None if nothing rests"""
+        while self.queue:
+            i = self._pop()
+            if i is not None:
+                return i
+        return None
+
+
+def spacing_ok(songs, spacing):
+    """True if no artist repeats within ``spacing`` songs"""
+    last_seen = {}
+    for position, song in enumerate(songs):
+        previous = last_seen.get(song['artist'])
+        if previous is not None and position - previous <= spacing:
+            return False
+        last_seen[song['artist']] = position
+    return True
+
+
+def _fill_slot(songs, first, eligible, spacing, keep_first=False):
+    """
+    Move an eligible song to the first (or last) position of a set
+
+    Args:
+        keep_first: When filling the last position, leave the song at position 0
+            where it is (the set's opener was already chosen)
+
+    Returns:
+        The reordered set, or None if no eligible song can move there without
+        breaking artist spacing
+    """
+    order = range(len(songs)) if first else range(len(songs) - 1, 0 if keep_first else -1, -1)
+    for j in order:
+        if not eligible(songs[j]):
+            continue
+        rest = songs[:j] + songs[j + 1:]
+        moved = [songs[j]] + rest if first else rest + [songs[j]]
+        if spacing_ok(moved, spacing):
+            return moved
+    return None
+
+
+def generate_tour(songs, shows, min_songs_between_artist=4, song_rest=1, opener_rest=3,
+                  closer_rest=3, mode='greedy', time_budget=2.0, flow=None, flow_time_limit=1.0,
+                  seed=None):
+    """
+    Generate setlists for a run of shows in one pass
+
+    Shows are generated in order. Songs played in a show sit out the next
+    ``song_rest`` shows, and a show's opener (closer) is not used as an
+    opener (closer) again within ``opener_rest`` (``closer_rest``) shows.
+    Rests are tracked incrementally with RestQueue. When the rested library
+    is too short to fill a show, the longest-resting songs are let back in
+    early, and the show reports how many were. Must-play songs are played
+    every show.
+
+    Args:
+        songs: List of song dictionaries, or a SongColumns built from them
+        shows: List of dictionaries with num_sets and set_duration (seconds);
+            any other keys (name, date, ...) are copied to the result
+        min_songs_between_artist: Minimum number of songs between songs by the same artist
+        song_rest: Shows a song sits out after being played
+        opener_rest: Shows before an opener may open again
+        closer_rest: Shows before a closer may close again
+        mode: Packing mode passed to generate_setlist
+        time_budget: Seconds the 'optimal' mode may spend across the whole tour
+        flow: Optional energy curve name passed to generate_setlist
+        flow_time_limit: Seconds flow ordering may spend across the whole tour
+        seed: Optional seed making the tour reproducible
+
+    Returns:
+        Dictionary with 'shows' (each with its setlist, opener, closer and
+        rotation details) and tour-wide 'stats'
+    """
+    started = time.perf_counter()
+    columns = songs if isinstance(songs, SongColumns) else SongColumns(songs)
+    songs = columns.songs
+    durations = columns.duration
+    index_of = {id(song): i for i, song in enumerate(songs)}
+    base = random.Random(seed)
+
+    song_rests = RestQueue(len(songs), song_rest)
+    opener_rests = RestQueue(len(songs), opener_rest)
+    closer_rests = RestQueue(len(songs), closer_rest)
+    plays = array('i', [0]) * len(songs)
+
+    must_play_seconds = sum(durations[i] for i in columns.must_play_indexes)
+    allowed_seconds = sum(durations[i] for i in columns.optional_indexes)
+    optional = bytearray(len(songs))
+    for i in columns.optional_indexes:
+        optional[i] = 1
+
+    deadline = started + time_budget
+    flow_deadline = started + flow_time_limit
+    results = []
+    relaxed_total = 0
+    repeated_openers = 0
+    repeated_closers = 0
+
+    for number, show in enumerate(shows):
+        shows_left = len(shows) - number
+        for i in song_rests.release(number):
+            if optional[i]:
+                allowed_seconds += durations[i]
+        opener_rests.release(number)
+        closer_rests.release(number)
+
+        # Let the longest-resting songs back in until the show can be filled with room to spare
+        needed = (show['num_sets'] * show['set_duration'] - must_play_seconds) * REST_SLACK
+        relaxed = 0
+        while allowed_seconds < needed:
+            i = song_rests.release_oldest()
+            if i is None:
+                break
+            if optional[i]:
+                allowed_seconds += durations[i]
+                relaxed += 1
+
+        now = time.perf_counter()
+        result = generate_setlist(
+            columns, show['num_sets'], show['set_duration'], min_songs_between_artist,
+            mode=mode,
+            time_budget=max(0, deadline - now) / shows_left,
+            flow=flow,
+            flow_time_limit=max(0, flow_deadline - now) / shows_left,
+            seed=base.randrange(2 ** 31),
+            allowed=song_rests.allowed if song_rests.rest else None
+        )
+        sets = result['setlist']
+        non_empty = [set_data for set_data in sets if set_data['songs']]
+
+        # Swap in an opener and closer that have not opened or closed recently. In a
+        # one-set show both passes work on the same set, so the closer pass leaves the
+        # opener it may have just placed at position 0 alone
+        repeated_opener = repeated_closer = False
+        if non_empty:
+            single = non_empty[0] is non_empty[-1]
+            for set_data, first, rests in ((non_empty[0], True, opener_rests),
+                                          (non_empty[-1], False, closer_rests)):
+                current = set_data['songs'][0 if first else -1]
+                if rests.allowed[index_of[id(current)]]:
+                    continue
+                moved = _fill_slot(set_data['songs'], first,
+                                   lambda song: rests.allowed[index_of[id(song)]],
+                                   min_songs_between_artist, keep_first=single and not first)
+                if moved is None:
+                    continue
+                set_data['songs'] = moved
+                if flow:
+                    set_data['flow_cost'] = FlowCost(moved, flow, min_songs_between_artist).total(
+                        list(range(len(moved))))
+
+            # Judge the final opener and closer, not the passes that placed them
+            opener = index_of[id(non_empty[0]['songs'][0])]
+            closer = index_of[id(non_empty[-1]['songs'][-1])]
+            repeated_opener = not opener_rests.allowed[opener]
+            repeated_closer = not closer_rests.allowed[closer]
+            opener_rests.mark(opener, number)
+            closer_rests.mark(closer, number)
+
+        for set_data in sets:
+            for song in set_data['songs']:
+                i = index_of[id(song)]
+                plays[i] += 1
+                if optional[i]:
+                    if song_rests.allowed[i] and song_rests.rest:
+                        allowed_seconds -= durations[i]
+                    song_rests.mark(i, number)
+
+        relaxed_total += relaxed
+        repeated_openers += repeated_opener
+        repeated_closers += repeated_closer
+        entry = {key: value for key, value in show.items() if key not in ('num_sets', 'set_duration')}
+        entry.update({
+            'show': number + 1,
+            'setlist': sets,
+            'opener': non_empty[0]['songs'][0]['title'] if non_empty else None,
+            'closer': non_empty[-1]['songs'][-1]['title'] if non_empty else None,
+            'rests_relaxed': relaxed,
+            'repeated_opener': repeated_opener,
+            'repeated_closer': repeated_closer
+        })
+        results.append(entry)
+
+    played = [count for count in plays if count]
+    return {
+        'shows': results,
+        'stats': {
+            'shows': len(shows),
+            'distinct_songs': len(played),
+            'max_plays': max(played) if played else 0,
+            'rests_relaxed': relaxed_total,
+            'repeated_openers': repeated_openers,
+            'repeated_closers': repeated_closers,
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+    }
@@ -21,6 +21,9 @@ CREATE TABLE IF NOT EXISTS songs (
   title TEXT NOT NULL,
   artist TEXT NOT NULL,
   duration INTEGER NOT NULL,
+  energy INTEGER DEFAULT 5,
+  key TEXT,
+  bpm INTEGER DEFAULT 0,
   must_play BOOLEAN DEFAULT FALSE,
   exclude_from_set BOOLEAN DEFAULT FALSE,
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
@@ -47,6 +50,77 @@ CREATE TABLE IF NOT EXISTS setlist_songs (
   created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Databases created before the unique index below may already hold exact duplicates,
+-- which would make creating it fail: point setlist entries at the oldest copy of each
+-- song and delete the other copies first (both statements do nothing on a new database)
+WITH ranked AS (
+  SELECT id, FIRST_VALUE(id) OVER (PARTITION BY user_id, title, artist ORDER BY created_at, id) AS keep_id
+  FROM songs
+)
+UPDATE setlist_songs SET song_id = ranked.keep_id
+FROM ranked
+WHERE setlist_songs.song_id = ranked.id AND ranked.id <> ranked.keep_id;
+
+WITH ranked AS (
+  SELECT id, FIRST_VALUE(id) OVER (PARTITION BY user_id, title, artist ORDER BY created_at, id) AS keep_id
+  FROM songs
+)
+DELETE FROM songs
+USING ranked
+WHERE songs.id = ranked.id AND ranked.id <> ranked.keep_id;
+
+-- One row per (title, artist) per user so CSV imports can upsert in bulk
+CREATE UNIQUE INDEX IF NOT EXISTS songs_user_title_artist_idx
+  ON songs (user_id, title, artist);
+
+-- Keyset pagination and updated_since delta sync
+CREATE INDEX IF NOT EXISTS songs_user_updated_idx ON songs (user_id, updated_at, id);
+CREATE INDEX IF NOT EXISTS setlists_user_created_idx ON setlists (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS setlists_user_updated_idx ON setlists (user_id, updated_at, id);
+
+-- Keep updated_at current so delta sync sees edits, not just inserts
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = NOW();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS songs_set_updated_at ON songs;
+CREATE TRIGGER songs_set_updated_at BEFORE UPDATE ON songs
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS setlists_set_updated_at ON setlists;
+CREATE TRIGGER setlists_set_updated_at BEFORE UPDATE ON setlists
+  FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- Save a setlist header and all of its songs in one transaction (POST /rest/v1/rpc/save_setlist).
+-- Saving again under the same id keeps the header and replaces the songs, so retried saves are safe.
+CREATE OR REPLACE FUNCTION save_setlist(
+  p_user_id UUID,
+  p_name TEXT,
+  p_description TEXT,
+  p_songs JSONB,
+  p_setlist_id UUID DEFAULT NULL
+) RETURNS UUID AS $$
+DECLARE
+  v_setlist_id UUID := COALESCE(p_setlist_id, uuid_generate_v4());
+BEGIN
+  INSERT INTO setlists (id, user_id, name, description)
+  VALUES (v_setlist_id, p_user_id, p_name, p_description)
+  ON CONFLICT (id) DO NOTHING;
+  IF NOT EXISTS (SELECT 1 FROM setlists WHERE id = v_setlist_id AND user_id = p_user_id) THEN
+    RAISE EXCEPTION 'Setlist % belongs to another user', v_setlist_id;
+  END IF;
+
+  DELETE FROM setlist_songs WHERE setlist_id = v_setlist_id;
+  INSERT INTO setlist_songs (setlist_id, song_id, position, set_number)
+  SELECT v_setlist_id, (song->>'song_id')::UUID, (song->>'position')::INTEGER, (song->>'set_number')::INTEGER
+  FROM jsonb_array_elements(p_songs) AS song;
+  RETURN v_setlist_id;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Enable Row Level Security
 ALTER TABLE profiles ENABLE ROW LEVEL SECURITY;
 ALTER TABLE songs ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,244 @@
+import math
+import re
+import unicodedata
+from array import array
+from collections import Counter
+
+# Words marking a version of a song rather than a different song when they appear in
+# brackets or after a dash, e.g. "Dont Stop (live)" or "Hey Jude - Remastered 2009"
+VERSION_WORDS = {
+    'live', 'remaster', 'remastered', 'version', 'edit', 'mix', 'remix', 'acoustic', 'demo',
+    'mono', 'stereo', 'single', 'radio', 'extended', 'unplugged', 'instrumental', 'feat',
+    'ft', 'featuring', 'bonus', 'take', 'session', 'reprise'
+}
+
+_BRACKETS = re.compile(r'[(\[{]([^)\]}]*)[)\]}]')
+_DASH_SUFFIX = re.compile(r'\s[-–—]\s(.*)$')
+_FEATURING = re.compile(r'\s(?:feat\.?|ft\.?|featuring)\s.*$')
+_APOSTROPHES = re.compile(r"['’`]")
+_NON_WORD = re.compile(r'[\W_]+')
+_NUMBERS = re.compile(r'\d+')
+
+
+def _fold(text):
+    """Casefold and strip accents so 'Beyoncé' and 'beyonce' compare equal"""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.casefold().replace('&', ' and ')
+
+
+def _is_version(text):
+    return not VERSION_WORDS.isdisjoint(_NON_WORD.sub(' ', text).split())
+
+
+def normalise_title(title):
+    """
+    Title reduced to the words that identify the song
+
+    Drops version qualifiers in brackets or after a dash, apostrophes and
+    other punctuation, so "Don't Stop" and "Dont Stop (live)" both become
+    "dont stop".
+    """
+    text = _fold(title)
+    text = _BRACKETS.sub(lambda match: ' ' if _is_version(match.group(1)) else f" {match.group(1)} ", text)
+    suffix = _DASH_SUFFIX.search(text)
+    if suffix and _is_version(suffix.group(1)):
+        text = text[:suffix.start()]
+    text = _APOSTROPHES.sub('', text)
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def normalise_artist(artist):
+    """Artist reduced to its letters and digits, without a leading 'the' or featured artists"""
+    text = _FEATURING.sub('', _fold(artist))
+    words = _NON_WORD.sub(' ', _APOSTROPHES.sub('', text)).split()
+    if len(words) > 1 and words[0] == 'the':
+        words = words[1:]
+    return ''.join(words)
+
+
+def title_grams(key):
+    """Character trigrams of a normalised title, padded so word edges count"""
+    padded = f" {key} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def song_signature(title, artist):
+    """(artist key, title key, title trigrams, numbers in the title) compared by DuplicateIndex"""
+    title_key = normalise_title(title)
+    grams = title_grams(title_key) if title_key else frozenset()
+    return normalise_artist(artist), title_key, grams, tuple(_NUMBERS.findall(title_key))
+
+
+def similarity(a, b):
+    """Jaccard similarity of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class DuplicateIndex:
+    """
+    Normalised title/artist index for finding likely duplicate songs
+
+    Songs are blocked by normalised artist, and titles are compared by the
+    Jaccard similarity of their trigrams; titles with different numbers in
+    them ("Symphony No. 5", "Symphony No. 9") never match. Each song's
+    trigram signature is computed once when it is added and kept as an array
+    of trigram ranks rather than a set of strings, and only a short
+    prefix of it (rarest trigrams first) is indexed: two titles with
+    similarity >= ``threshold`` always share a trigram in their prefixes, so
+    a lookup only verifies the few songs found through those postings
+    instead of comparing against the whole library.
+
+    Args:
+        threshold: Minimum title similarity (0-1) for two songs by the same artist to match
+        frequencies: Optional trigram counts of the songs about to be added, fixing
+            the rarest-first order; trigrams first seen later are ranked after them
+            in the order they are added, which is still correct but slower
+    """
+
+    def __init__(self, threshold=0.8, frequencies=None):
+        self.threshold = threshold
+        self.songs = []
+        self.signatures = []
+        self.exact = {}
+        self.postings = {}
+        # Rank of each trigram in the fixed order prefixes are taken in (rarest first)
+        self.ranks = {gram: rank for rank, gram in
+                      enumerate(sorted(frequencies or (), key=lambda gram: (frequencies[gram], gram)))}
+
+    def __len__(self):
+        return len(self.songs)
+
+    def _prefix(self, grams):
+        """
+        Ranks of the trigrams that must be shared with any match
+
+        Trigrams the index has never seen sort first; no indexed song has them,
+        so they are dropped from the prefix rather than looked up. Postings are
+        keyed by rank, so they share the rank ints instead of each holding a
+        copy of the trigram.
+        """
+        size = len(grams) - math.ceil(self.threshold * len(grams) - 1e-9) + 1
+        ranks = self.ranks
+        known = sorted([ranks[gram] for gram in grams if gram in ranks])
+        return known[:max(0, size - (len(grams) - len(known)))]
+
+    def add(self, song, signature=None):
+        """
+        Index a song dictionary (with title and artist)
+
+        Returns:
+            The song's position in the index
+        """
+        position = len(self.songs)
+        signature = signature or song_signature(song.get('title'), song.get('artist'))
+        artist_key, title_key, grams, numbers = signature
+        # Ranks never change once given, so existing prefixes stay valid
+        for gram in grams:
+            if gram not in self.ranks:
+                self.ranks[gram] = len(self.ranks)
+        # Keep the trigrams as their ranks in a flat array, a fraction of the size of a
+        # set of strings
+        self.songs.append(song)
+        self.signatures.append((artist_key, title_key, array('i', map(self.ranks.__getitem__, grams)), numbers))
+        if title_key:
+            self.exact.setdefault((artist_key, title_key), position)
+        for rank in self._prefix(grams):
+            self.postings.setdefault((artist_key, rank), []).append(position)
+        return position
+
+    def matches(self, title=None, artist=None, signature=None, limit=5):
+        """
+        Indexed songs likely to be the same song, most similar first
+
+        Args:
+            title, artist: Song to look up, unless its signature is given
+            signature: Result of song_signature(), to avoid normalising the same song twice
+            limit: Most matches to return (None for all)
+
+        Returns:
+            List of (position, score) pairs with score >= threshold
+        """
+        artist_key, title_key, grams, numbers = signature or song_signature(title, artist)
+        found = {}
+        exact = self.exact.get((artist_key, title_key)) if title_key else None
+        if exact is not None:
+            found[exact] = 1.0
+        if grams:
+            low = self.threshold * len(grams)
+            high = len(grams) / self.threshold if self.threshold else math.inf
+            # Trigrams the index has never seen can only count against a match
+            query = frozenset(self.ranks[gram] for gram in grams if gram in self.ranks)
+            for rank in self._prefix(grams):
+                for position in self.postings.get((artist_key, rank), ()):
+                    if position in found:
+                        continue
+                    _, _, other, other_numbers = self.signatures[position]
+                    if not low <= len(other) <= high or other_numbers != numbers:
+                        continue
+                    shared = len(query.intersection(other))
+                    score = shared / (len(grams) + len(other) - shared)
+                    if score >= self.threshold:
+                        found[position] = score
+        ranked = sorted(found.items(), key=lambda item: (-item[1], item[0]))
+        return ranked if limit is None else ranked[:limit]
+
+
+def find_clusters(songs, threshold=0.8):
+    """
+    Group a library into clusters of likely duplicate songs
+
+    Each song is matched against the songs indexed before it and linked to
+    them with a union-find, so the whole pass is near-linear in the library
+    size.
+
+    Args:
+        songs: List of song dictionaries with title and artist
+        threshold: Minimum title similarity, see DuplicateIndex
+
+    Returns:
+        (index, clusters): The DuplicateIndex of every song, and a list of
+        clusters, each a dict with 'positions' (indexes into songs, in library
+        order) and 'score' (the weakest link that joined the cluster)
+    """
+    signatures = [song_signature(song.get('title'), song.get('artist')) for song in songs]
+    frequencies = Counter(gram for _, _, grams, _ in signatures for gram in grams)
+    index = DuplicateIndex(threshold, frequencies)
+    parent = list(range(len(songs)))
+    weakest = {}
+
+    def root(position):
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    for position, (song, signature) in enumerate(zip(songs, signatures)):
+        for other, score in index.matches(signature=signature, limit=None):
+            a, b = root(position), root(other)
+            if a != b:
+                parent[a] = b
+                weakest[b] = min(score, weakest.get(a, 1.0), weakest.get(b, 1.0))
+        index.add(song, signature)
+
+    groups = {}
+    for position in range(len(songs)):
+        groups.setdefault(root(position), []).append(position)
+    clusters = [{'positions': positions, 'score': round(weakest.get(top, 1.0), 3)}
+                for top, positions in groups.items() if len(positions) > 1]
+    return index, clusters
+
+
+def suggest_keep(songs):
+    """
+    The song of a cluster to keep: the plainest (shortest) title, then the first listed
+
+    Returns:
+        Index into songs
+    """
+    return min(range(len(songs)), key=lambda i: (len(songs[i].get('title') or ''), i))
@@ -0,0 +1,218 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import record
+
+
+class SupabaseClient:
+    """
+    Thin data-access layer over the Supabase PostgREST API
+
+    A single pooled requests.Session is shared by every caller so connections
+    to SUPABASE_URL are kept alive between requests instead of paying a fresh
+    TCP+TLS handshake on every call.
+
+    Args:
+        url: Base Supabase project URL
+        key: Supabase API key sent as both apikey and bearer token
+        pool_size: Maximum connections kept open (requests beyond it wait for a free one)
+        connect_timeout: Seconds to wait for a connection to be established
+        read_timeout: Seconds to wait for a response once connected
+        retries: Retry attempts for idempotent reads (GET/HEAD)
+        backoff_factor: Exponential backoff multiplier between retries
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, url, key, pool_size=8, connect_timeout=3.05, read_timeout=10,
+                 retries=2, backoff_factor=0.2):
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.timeout = (connect_timeout, read_timeout)
+
+        self._lock = threading.Lock()
+        self._counters = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'in_flight': 0,
+            'peak_in_flight': 0
+        }
+
+        client = self
+
+        class CountingRetry(Retry):
+            def increment(self, *args, **kwargs):
+                client._count('retries')
+                return super().increment(*args, **kwargs)
+
+        # Reads are retried on connection errors, timeouts and gateway errors;
+        # writes only on connection errors, where the request was never sent
+        retry = CountingRetry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=retry
+        )
+
+        # Runs independent requests side by side (greenlets under the gevent worker)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='supabase')
+
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers.update({
+            'apikey': key,
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json'
+        })
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._counters[name] += delta
+
+    def request(self, method, path, prefer=None, **kwargs):
+        """
+        Send a request to a PostgREST path such as "songs?user_id=eq.1"
+
+        Args:
+            method: HTTP method
+            path: Table or RPC path relative to /rest/v1/, including query string
+            prefer: Optional value for the PostgREST Prefer header
+
+        Returns:
+            requests.Response
+        """
+        headers = kwargs.pop('headers', {})
+        if prefer:
+            headers['Prefer'] = prefer
+        kwargs.setdefault('timeout', self.timeout)
+
+        with self._lock:
+            self._counters['requests'] += 1
+            self._counters['in_flight'] += 1
+            self._counters['peak_in_flight'] = max(self._counters['peak_in_flight'],
+                                                   self._counters['in_flight'])
+        started = time.perf_counter()
+        try:
+            return self.session.request(method, f"{self.base_url}/{path.lstrip('/')}",
+                                        headers=headers, **kwargs)
+        except requests.RequestException:
+            self._count('errors')
+            raise
+        finally:
+            self._count('in_flight', -1)
+            # Label by table (or rpc/<name>) so query strings don't explode the series count
+            record('supabase', f"{method} {path.lstrip('/').split('?', 1)[0]}",
+                   time.perf_counter() - started)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, json=None, **kwargs):
+        return self.request('POST', path, json=json, **kwargs)
+
+    def patch(self, path, json=None, **kwargs):
+        return self.request('PATCH', path, json=json, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def gather(self, *calls):
+        """
+        Send independent requests concurrently and return their responses in order
+
+        Args:
+            *calls: (method, path) or (method, path, kwargs) tuples
+
+        Returns:
+            List of requests.Response, one per call
+        """
+        # Each call runs in a copy of the caller's context so it is timed against the current request
+        futures = [
+            self._executor.submit(contextvars.copy_context().run, self.request, call[0], call[1],
+                                  **(call[2] if len(call) > 2 else {}))
+            for call in calls
+        ]
+        return [future.result() for future in futures]
+
+    def warm(self, path='profiles?select=id&limit=1'):
+        """Open a pooled connection (DNS, TCP and TLS) ahead of the first real request"""
+        return self.request('HEAD', path)
+
+    def stats(self):
+        """Return request and connection-pool usage counters"""
+        with self._lock:
+            stats = dict(self._counters)
+
+        connections = 0
+        idle = 0
+        for key in self.adapter.poolmanager.pools.keys():
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            idle += pool.pool.qsize() if pool.pool else 0
+
+        stats['pool_maxsize'] = self.adapter._pool_maxsize
+        stats['connections_opened'] = connections
+        stats['idle_slots'] = idle
+        return stats
+
+
+def create_client():
+    """Build a SupabaseClient configured from environment variables"""
+    return SupabaseClient(
+        url=os.environ.get("SUPABASE_URL", "https://cqlldqgxghuvbtmlaiec.supabase.co"),
+        key=os.environ.get("SUPABASE_KEY", ""),
+        pool_size=int(os.environ.get("SUPABASE_POOL_SIZE", 8)),
+        connect_timeout=float(os.environ.get("SUPABASE_CONNECT_TIMEOUT", 3.05)),
+        read_timeout=float(os.environ.get("SUPABASE_READ_TIMEOUT", 10)),
+        retries=int(os.environ.get("SUPABASE_RETRIES", 2))
+    )
+
+
+class LazyClient:
+    """
+    Stand-in that builds the real client on first use
+
+    Attribute access is forwarded to the client returned by ``factory``, so
+    call sites use it exactly like a SupabaseClient while cold starts skip
+    building sessions and pools that the first request may never need.
+    """
+
+    def __init__(self, factory=create_client):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self):
+        return self._client is not None
+
+    def get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.get_client(), name)
@@ -0,0 +1,140 @@
+"""
+Invariants every generated setlist must hold, whatever the packing mode
+
+Run with:
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from bench_generator import legacy_generate_setlist, make_library as make_bench_library
+from setlist_generator import PACKING_MODES, generate_setlist
+
+SET_DURATION = 1800
+SPACING = 3
+
+
+def make_library(size=150, seed=0):
+    rng = random.Random(seed)
+    songs = []
+    for i in range(size):
+        songs.append({
+            'id': f"song-{i}",
+            'title': f"Song {i}",
+            'artist': f"Artist {rng.randrange(12)}",
+            'duration': rng.randint(150, 330),
+            'energy': rng.randint(1, 10),
+            'key': rng.choice(['C', 'G', 'D', 'Am', 'Em']),
+            'bpm': rng.randint(70, 160),
+            'must_play': rng.random() < 0.08,
+            'exclude_from_set': rng.random() < 0.05
+        })
+    return songs
+
+
+@pytest.fixture(params=[(mode, flow) for mode in PACKING_MODES for flow in (None, 'arc')],
+                ids=lambda param: f"{param[0]}-{param[1] or 'no-flow'}")
+def generated(request):
+    mode, flow = request.param
+    songs = make_library()
+    result = generate_setlist(songs, 3, SET_DURATION, SPACING, mode=mode, flow=flow, seed=7)
+    return songs, result, flow
+
+
+def test_no_song_is_used_twice(generated):
+    _, result, _ = generated
+    ids = [song['id'] for set_data in result['setlist'] for song in set_data['songs']]
+    assert len(ids) == len(set(ids))
+    assert not set(ids) & {song['id'] for song in result['extras']}
+
+
+def test_excluded_songs_are_never_played(generated):
+    _, result, _ = generated
+    assert not any(song['exclude_from_set'] for set_data in result['setlist'] for song in set_data['songs'])
+
+
+def assert_artists_spaced(songs, spacing):
+    last_seen = {}
+    for position, song in enumerate(songs):
+        if song['artist'] in last_seen:
+            assert position - last_seen[song['artist']] > spacing
+        last_seen[song['artist']] = position
+
+
+def test_artists_are_spaced(generated):
+    _, result, _ = generated
+    for set_data in result['setlist']:
+        assert_artists_spaced(set_data['songs'], SPACING)
+
+
+def test_must_play_songs_come_first(generated):
+    _, result, flow = generated
+    if flow:
+        pytest.skip('flow ordering reorders must-play songs within the set')
+    for set_data in result['setlist']:
+        flags = [song['must_play'] for song in set_data['songs']]
+        assert flags == sorted(flags, reverse=True)
+
+
+def test_every_must_play_song_is_placed_or_listed(generated):
+    songs, result, _ = generated
+    placed = {song['id'] for set_data in result['setlist'] for song in set_data['songs']}
+    extras = {song['id'] for song in result['extras']}
+    for song in songs:
+        if song['must_play'] and not song['exclude_from_set']:
+            assert song['id'] in placed | extras
+
+
+def test_gap_is_the_time_left_in_the_set(generated):
+    _, result, _ = generated
+    for set_data in result['setlist']:
+        assert set_data['duration'] == sum(song['duration'] for song in set_data['songs'])
+        assert set_data['gap'] == SET_DURATION - set_data['duration']
+        assert set_data['gap'] >= 0
+
+
+@pytest.mark.parametrize('mode', PACKING_MODES)
+def test_same_seed_gives_the_same_setlist(mode):
+    songs = make_library()
+    first = generate_setlist(songs, 3, SET_DURATION, SPACING, mode=mode, time_budget=5, seed=11)
+    second = generate_setlist(songs, 3, SET_DURATION, SPACING, mode=mode, time_budget=5, seed=11)
+    assert first == second
+
+
+def run_legacy(songs, num_sets, set_duration, spacing, seed):
+    random.seed(seed)
+    return legacy_generate_setlist(songs, num_sets, set_duration, spacing)
+
+
+def run_indexed(songs, num_sets, set_duration, spacing, seed):
+    return generate_setlist(songs, num_sets, set_duration, spacing, seed=seed)
+
+
+@pytest.mark.parametrize('size', [100, 1000, 10000])
+@pytest.mark.parametrize('generator', [run_legacy, run_indexed], ids=['legacy', 'indexed'])
+def test_legacy_and_indexed_generators_hold_the_same_invariants(generator, size, record_property):
+    songs = make_bench_library(size, seed=size)
+    started = time.perf_counter()
+    result = generator(songs, 3, SET_DURATION, SPACING, seed=size)
+    # Timing is informational (shown with --junitxml); the benchmark script compares speed
+    record_property('generate_ms', round((time.perf_counter() - started) * 1000, 2))
+
+    placed = [song for set_data in result['setlist'] for song in set_data['songs']]
+    ids = [song['id'] for song in placed]
+    assert len(ids) == len(set(ids))
+    assert len(ids) + len(result['extras']) == len(songs)
+    assert {song['id'] for song in result['extras']}.isdisjoint(ids)
+    for set_data in result['setlist']:
+        assert set_data['duration'] == sum(song['duration'] for song in set_data['songs'])
+        assert set_data['duration'] <= SET_DURATION
+        flags = [song['must_play'] for song in set_data['songs']]
+        assert flags == sorted(flags, reverse=True)
+        assert_artists_spaced(set_data['songs'], SPACING)
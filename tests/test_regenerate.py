@@ -0,0 +1,52 @@
+"""
+Invariants of refilling an existing setlist around pinned songs
+
+Run with:
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from setlist_generator import generate_setlist, regenerate_setlist
+from test_generator import SET_DURATION, SPACING, assert_artists_spaced, make_library
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_refill_keeps_spacing_and_pinned_order(seed):
+    rng = random.Random(seed)
+    songs = make_library(200, seed)
+    show = generate_setlist(songs, 3, SET_DURATION, SPACING, seed=seed)
+    setlist = [[song['id'] for song in set_data['songs']] for set_data in show['setlist']]
+    pinned = {song_id for ids in setlist for song_id in ids if rng.random() < 0.5}
+
+    result = regenerate_setlist(songs, setlist, SET_DURATION, SPACING, pinned, seed=seed)
+
+    ids = [song['id'] for set_data in result['setlist'] for song in set_data['songs']]
+    assert len(ids) == len(set(ids))
+    assert {song['id'] for song in result['extras']}.isdisjoint(ids)
+    for before, after in zip(setlist, result['setlist']):
+        assert_artists_spaced(after['songs'], SPACING)
+        assert after['duration'] == sum(song['duration'] for song in after['songs'])
+        assert after['gap'] >= 0
+        # Pinned songs still in the set come in the order they had
+        kept = [song['id'] for song in after['songs'] if song['id'] in pinned]
+        assert kept == [song_id for song_id in before if song_id in kept]
+
+
+def test_pinned_song_pulled_too_close_moves_to_extras():
+    songs = [
+        {'id': 'a1', 'title': 'A1', 'artist': 'A', 'duration': 200},
+        {'id': 'b', 'title': 'B', 'artist': 'B', 'duration': 200},
+        {'id': 'a2', 'title': 'A2', 'artist': 'A', 'duration': 200}
+    ]
+    # Nothing can replace b, so the pinned songs either side of it would meet;
+    # b itself was in the setlist, so like any replaced song it is not an extra
+    result = regenerate_setlist(songs, [['a1', 'b', 'a2']], 600, 1, pinned=['a1', 'a2'], seed=1)
+
+    assert [song['id'] for song in result['setlist'][0]['songs']] == ['a1']
+    assert {song['id'] for song in result['extras']} == {'a2'}
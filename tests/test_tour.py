@@ -0,0 +1,67 @@
+"""
+Rotation invariants of generated tours
+
+Run with:
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from setlist_tour import generate_tour, spacing_ok
+
+SPACING = 2
+
+
+def make_library(size, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'id': f"song-{i}",
+        'title': f"Song {i}",
+        'artist': f"Artist {rng.randrange(max(4, size // 3))}",
+        'duration': rng.randint(150, 300),
+        'must_play': False,
+        'exclude_from_set': False
+    } for i in range(size)]
+
+
+def check_rotation(tour, opener_rest, closer_rest):
+    openers = []
+    closers = []
+    for show in tour['shows']:
+        played = [song for set_data in show['setlist'] for song in set_data['songs']]
+        assert len({song['id'] for song in played}) == len(played)
+        for set_data in show['setlist']:
+            assert spacing_ok(set_data['songs'], SPACING)
+
+        sets = [set_data['songs'] for set_data in show['setlist'] if set_data['songs']]
+        opener, closer = sets[0][0], sets[-1][-1]
+        assert show['opener'] == opener['title'] and show['closer'] == closer['title']
+        # A recent opener (closer) may only come back when the show says it had to
+        if opener['id'] in openers[-opener_rest:]:
+            assert show['repeated_opener']
+        if closer['id'] in closers[-closer_rest:]:
+            assert show['repeated_closer']
+        openers.append(opener['id'])
+        closers.append(closer['id'])
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_single_set_shows_keep_opener_rotation(seed):
+    songs = make_library(12, seed)
+    shows = [{'num_sets': 1, 'set_duration': 700} for _ in range(6)]
+    tour = generate_tour(songs, shows, SPACING, song_rest=0, opener_rest=3, closer_rest=3, seed=seed)
+    check_rotation(tour, 3, 3)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_multi_set_shows_keep_rotation(seed):
+    songs = make_library(120, seed)
+    shows = [{'num_sets': 2, 'set_duration': 1500} for _ in range(8)]
+    tour = generate_tour(songs, shows, SPACING, song_rest=1, opener_rest=3, closer_rest=3, seed=seed)
+    check_rotation(tour, 3, 3)
+    assert tour['stats']['shows'] == len(shows)
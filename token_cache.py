@@ -0,0 +1,148 @@
+import hashlib
+import threading
+import time
+
+from cache import TTLCache
+from instrumentation import traced
+
+# Google's public certificates used to sign Firebase ID tokens
+ID_TOKEN_CERT_URI = ('https://www.googleapis.com/robot/v1/metadata/x509/'
+                     'securetoken@system.gserviceaccount.com')
+
+
+class VerifiedTokenCache:
+    """
+    Cache of Firebase ID tokens that have already passed verify_id_token
+
+    Entries are keyed by a SHA-256 of the token (the raw token is never
+    stored) and expire at the token's own ``exp`` claim, so an expired token
+    is always re-verified and rejected by Firebase. Tokens are cached only
+    after a successful verification; failures are never cached.
+
+    Args:
+        maxsize: Maximum number of verified tokens kept
+        revocation_interval: If set, re-verify with check_revoked=True at most
+            this many seconds after the last check, so revoked sessions are cut
+            off within that window
+        clock_skew: Seconds subtracted from ``exp`` to allow for clock drift
+        setup: Optional callable run once before the first verification, e.g. to
+            initialise Firebase Admin lazily instead of at import time
+    """
+
+    def __init__(self, maxsize=10000, revocation_interval=None, clock_skew=30, setup=None):
+        self.revocation_interval = revocation_interval
+        self.clock_skew = clock_skew
+        self._cache = TTLCache(maxsize=maxsize)
+        self._refresher = None
+        self._setup = setup
+        self._setup_lock = threading.Lock()
+        self._setup_done = threading.Event()
+        if setup is None:
+            self._setup_done.set()
+        self.verifications = 0
+        self.failures = 0
+        self.key_refreshes = 0
+
+    def ensure_setup(self):
+        """
+        Run the setup callable if it has not completed yet (thread-safe, idempotent)
+
+        Concurrent callers wait until setup has finished rather than skipping
+        ahead of it; if setup raises, the next caller runs it again.
+        """
+        if self._setup_done.is_set():
+            return
+        with self._setup_lock:
+            if not self._setup_done.is_set():
+                self._setup()
+                self._setup_done.set()
+
+    @staticmethod
+    def _key(id_token):
+        return hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+
+    def verify(self, id_token):
+        """
+        Return the decoded claims for an ID token, verifying it only on a cache miss
+
+        Raises:
+            Whatever auth.verify_id_token raises for invalid, expired or revoked tokens
+        """
+        key = self._key(id_token)
+        claims = self._cache.get(key)
+        if claims is not None:
+            return claims
+
+        self.ensure_setup()
+        from firebase_admin import auth
+
+        self.verifications += 1
+        try:
+            with traced('firebase', 'verify_id_token'):
+                claims = auth.verify_id_token(id_token, check_revoked=bool(self.revocation_interval))
+        except Exception:
+            self.failures += 1
+            raise
+
+        ttl = claims.get('exp', 0) - time.time() - self.clock_skew
+        if self.revocation_interval:
+            ttl = min(ttl, self.revocation_interval)
+        if ttl > 0:
+            self._cache.set(key, claims, ttl=ttl)
+        return claims
+
+    def invalidate(self, id_token):
+        """Forget a token, e.g. on logout"""
+        if id_token:
+            self._cache.pop(self._key(id_token))
+
+    def _refresh_keys(self):
+        """Fetch the signing certificates through firebase_admin's caching transport"""
+        from firebase_admin import auth
+
+        try:
+            request = auth._get_client(None)._token_verifier.request
+        except Exception:
+            # Firebase Admin is not initialised; nothing to warm
+            return False
+        try:
+            request(ID_TOKEN_CERT_URI, method='GET')
+            self.key_refreshes += 1
+            return True
+        except Exception as e:
+            print(f"Certificate prefetch failed: {e}")
+            return False
+
+    def start_key_refresh(self, interval=3600, retry_delay=5):
+        """
+        Prefetch the public-key set now and keep it warm from a daemon thread
+
+        The certificates are served with a Cache-Control max-age, so refetching
+        periodically means verify_id_token never blocks on a certificate
+        download in the request path. A failed fetch (or Firebase Admin not
+        being initialised yet) is retried after ``retry_delay`` seconds,
+        doubling on each consecutive failure up to ``interval``.
+        """
+        if self._refresher is not None:
+            return
+
+        def run():
+            delay = retry_delay
+            while True:
+                if self._refresh_keys():
+                    delay = retry_delay
+                    time.sleep(interval)
+                else:
+                    time.sleep(delay)
+                    delay = min(delay * 2, interval)
+
+        self._refresher = threading.Thread(target=run, name='firebase-key-refresh', daemon=True)
+        self._refresher.start()
+
+    def stats(self):
+        """Return hit/miss and verification counters"""
+        stats = self._cache.stats()
+        stats['verifications'] = self.verifications
+        stats['failures'] = self.failures
+        stats['key_refreshes'] = self.key_refreshes
+        return stats